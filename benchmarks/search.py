@@ -0,0 +1,105 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# File search over synthetic libraries, through FileIndex and its trigram
+# SearchIndex. Runs from the repository root:
+#
+#     python benchmarks/search.py [--files 10000] [--seed 1]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
+
+from klipmi.model.files import FileIndex  # noqa: E402
+
+PARTS = ["benchy", "gear_hook", "bracket", "spool_holder", "clip", "enclosure"]
+MATERIALS = ["pla", "petg", "abs", "tpu"]
+# The last query matches every file
+QUERIES = ["b", "benchy", "gear_hook", "customer_42/", "_0.2mm"]
+TYPED = "customer_42/gear"
+BUILD_CHUNK = 500
+
+
+def library(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    files = []
+    for number in range(count):
+        path = "customer_%d/%s_%d_%s_0.2mm.gcode" % (
+            rng.randrange(200),
+            rng.choice(PARTS),
+            number,
+            rng.choice(MATERIALS),
+        )
+        files.append({"path": path, "modified": rng.random() * 1e9, "size": 1})
+    return files
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return (time.perf_counter() - started) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="File search benchmark")
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    files = library(args.files, args.seed)
+    index = FileIndex()
+    elapsed, _ = timed(index.load, files)
+    print("load index            %7.2f ms" % elapsed)
+
+    chunks = []
+    while True:
+        elapsed, done = timed(index.search.build, BUILD_CHUNK)
+        chunks.append(elapsed)
+        if done:
+            break
+    print(
+        "build search index    %7.2f ms total, <= %.2f ms per %d paths"
+        % (sum(chunks), max(chunks), BUILD_CHUNK)
+    )
+
+    elapsed, _ = timed(
+        lambda: [index.add("new/file_%d.gcode" % i, 0.0, 1) for i in range(1000)]
+    )
+    print("incremental add       %7.4f ms per file" % (elapsed / 1000))
+
+    for query in QUERIES:
+        elapsed, _ = timed(index.find, query)
+        count = len(index.search.search(query))
+        print("query %-15r %7.2f ms (%d matches)" % (query, elapsed, count))
+
+    elapsed, _ = timed(
+        lambda: [index.find(TYPED[:end]) for end in range(1, len(TYPED) + 1)]
+    )
+    print("%d keystrokes typed  %7.2f ms total" % (len(TYPED), elapsed))
+
+    texts = list(index.search.texts.items())
+    elapsed, _ = timed(lambda: [path for path, text in texts if "benchy" in text])
+    print("linear scan 'benchy'  %7.2f ms, for comparison" % elapsed)
+
+
+if __name__ == "__main__":
+    main()
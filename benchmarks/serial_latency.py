@@ -0,0 +1,128 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# Touch latency of the threaded serial transport against pyserial-asyncio.
+#
+# A pseudo terminal stands in for the display: touch frames are written to
+# its master side at a fixed interval and timed until the protocol on the
+# loop has the complete frame. A task keeps the loop busy with blocking
+# chunks, like rendering a page does. Runs on Linux from the repository
+# root, needs the nextion fork from requirements.txt:
+#
+#     python benchmarks/serial_latency.py [--touches 200] [--busy-ms 5]
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+import tty
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
+
+import serial_asyncio  # noqa: E402
+
+from klipmi.model.display import EOL, createSerialConnection, splitFrames  # noqa: E402
+from klipmi.utils.stats import LatencyStats  # noqa: E402
+
+BAUD = 115200
+
+# Touch event: page 1, component 2, released
+TOUCH = bytes([0x65, 1, 2, 0]) + EOL
+
+
+class TouchProtocol(asyncio.Protocol):
+    def __init__(self, sent: list, stats: LatencyStats):
+        self.sent: list = sent
+        self.stats: LatencyStats = stats
+        self.buffer: bytes = b""
+        self.received: int = 0
+
+    def data_received(self, data: bytes):
+        frames, self.buffer = splitFrames(self.buffer + data)
+        now = time.perf_counter()
+        for _ in frames:
+            self.stats.record(now - self.sent[self.received])
+            self.received += 1
+
+
+def touch(master: int, sent: list, count: int, interval: float):
+    for _ in range(count):
+        time.sleep(interval)
+        sent.append(time.perf_counter())
+        os.write(master, TOUCH)
+
+
+async def keepBusy(busy: float, stop: asyncio.Event):
+    while not stop.is_set():
+        time.sleep(busy)
+        await asyncio.sleep(0.001)
+
+
+async def measure(name: str, count: int, interval: float, busy: float):
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    sent: list = []
+    stats = LatencyStats(count)
+    loop = asyncio.get_running_loop()
+
+    def factory():
+        return TouchProtocol(sent, stats)
+
+    if name == "threaded":
+        transport, protocol = await createSerialConnection(
+            loop, factory, os.ttyname(slave), BAUD
+        )
+    else:
+        transport, protocol = await serial_asyncio.create_serial_connection(
+            loop, factory, os.ttyname(slave), baudrate=BAUD
+        )
+
+    stop = asyncio.Event()
+    if busy > 0:
+        loop.create_task(keepBusy(busy, stop))
+    writer = threading.Thread(target=touch, args=(master, sent, count, interval))
+    writer.start()
+    while protocol.received < count:
+        await asyncio.sleep(0.01)
+    stop.set()
+    writer.join()
+    transport.close()
+    await asyncio.sleep(0.05)
+    os.close(master)
+    os.close(slave)
+    print("%-16s busy %4.1fms  %s" % (name, busy * 1000, stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Touch latency of the serial transports"
+    )
+    parser.add_argument("--touches", type=int, default=200)
+    parser.add_argument("--interval-ms", type=float, default=20.0)
+    parser.add_argument("--busy-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    for busy in sorted({0.0, args.busy_ms / 1000}):
+        for name in ["threaded", "serial-asyncio"]:
+            asyncio.run(measure(name, args.touches, args.interval_ms / 1000, busy))
+
+
+if __name__ == "__main__":
+    main()
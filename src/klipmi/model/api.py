@@ -0,0 +1,150 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import stat
+
+from aiohttp import web
+
+from klipmi.model.state import KlipmiState
+
+# Seconds between keepalive comments on an idle event stream
+KEEPALIVE = 15.0
+
+
+class StatusApi:
+    """
+    Read-only HTTP API over the status klipmi already holds, so local tools
+    do not need Moonraker connections of their own.
+
+    GET /status returns the full snapshot. GET /events is a server-sent
+    events stream starting with a "status" event holding the snapshot,
+    followed by "delta" events with only the fields changed since the last
+    event sent to that client. A slow client gets the changes merged into
+    fewer events instead of a backlog.
+
+    While the display sleeps the Moonraker subscription shrinks, the status
+    of the objects left out is frozen. "partial" is true then and
+    "subscribed" lists the objects and fields still kept current.
+
+    `listen` is either "host:port" or the path of a Unix socket.
+    """
+
+    def __init__(self, state: KlipmiState, listen: str):
+        self.state: KlipmiState = state
+        self.listen: str = listen
+        self.updated: asyncio.Event = asyncio.Event()
+        self.runner: web.AppRunner | None = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/status", self.getStatus)
+        app.router.add_get("/events", self.getEvents)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        if self.listen.startswith("/"):
+            # A socket left behind by an earlier run blocks the bind
+            if os.path.exists(self.listen) and stat.S_ISSOCK(
+                os.stat(self.listen).st_mode
+            ):
+                os.unlink(self.listen)
+            site = web.UnixSite(self.runner, self.listen)
+        else:
+            host, _, port = self.listen.rpartition(":")
+            site = web.TCPSite(self.runner, host or "localhost", int(port))
+        await site.start()
+        logging.info("Status API listening on %s" % self.listen)
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def publish(self):
+        """Wakes the event streams, called whenever the status changed"""
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+    def snapshot(self) -> dict:
+        status = self.state.printer.status
+        return {
+            "printer": self.state.options.name,
+            "version": status.version,
+            "state": self.state.status.name.lower(),
+            "stale": self.state.stale,
+            **self.subscription(),
+            "status": status.toDict(),
+        }
+
+    def subscription(self) -> dict:
+        printer = self.state.printer
+        return {
+            "partial": printer.subscription != printer.objects,
+            "subscribed": printer.subscription,
+        }
+
+    async def getStatus(self, request: web.Request) -> web.Response:
+        return web.json_response(self.snapshot())
+
+    async def getEvents(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+
+        snapshot = self.snapshot()
+        version, state = snapshot["version"], snapshot["state"]
+        subscription = self.subscription()
+        try:
+            await response.write(self.event("status", snapshot))
+            while True:
+                # Taken before looking for changes, a publish() while this
+                # client is being written to sets it and is not missed
+                updated = self.updated
+
+                status = self.state.printer.status
+                delta: dict = {"version": status.version}
+                if self.state.status.name.lower() != state:
+                    state = delta["state"] = self.state.status.name.lower()
+                if self.subscription() != subscription:
+                    subscription = self.subscription()
+                    delta.update(subscription)
+                if status.version != version:
+                    changes = status.changes(version)
+                    if changes:
+                        delta["status"] = changes
+                    version = status.version
+                if len(delta) > 1:
+                    await response.write(self.event("delta", delta))
+                    continue
+
+                try:
+                    await asyncio.wait_for(updated.wait(), KEEPALIVE)
+                except asyncio.TimeoutError:
+                    await response.write(b": keepalive\n\n")
+        except ConnectionResetError:
+            # The client went away
+            pass
+        return response
+
+    @staticmethod
+    def event(name: str, data: dict) -> bytes:
+        return ("event: %s\ndata: %s\n\n" % (name, json.dumps(data))).encode()
@@ -0,0 +1,222 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import logging
+import time
+
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+from klipmi.utils.stats import LatencyStats
+
+GCODE_METHOD = "printer.gcode.script"
+
+# Commands waiting to be sent before new ones are rejected
+MAX_QUEUED = 16
+
+# Seconds a command may wait before it is dropped instead of sent, motion or
+# heater commands executed long after the touch are worse than none
+MAX_WAIT = 30.0
+
+# G-code commands where a later command for the same target replaces an
+# earlier one that has not been sent yet, mapped to the parameter naming it
+COALESCE = {
+    "SET_HEATER_TEMPERATURE": "HEATER",
+    "SET_PIN": "PIN",
+    "SET_FAN_SPEED": "FAN",
+}
+
+
+def parseGcode(script: str) -> Tuple[str, Dict[str, str]]:
+    words = script.split()
+    if not words:
+        return "", {}
+    params = {}
+    for word in words[1:]:
+        key, _, value = word.partition("=")
+        params[key.upper()] = value
+    return words[0].upper(), params
+
+
+class CommandDroppedError(Exception):
+    pass
+
+
+class Command:
+    def __init__(self, method: str, params: dict):
+        self.method: str = method
+        self.params: dict = params
+        self.queued: float = time.monotonic()
+        self.name: str = method
+        self.key: Tuple | None = None
+        self.futures: List[asyncio.Future] = []
+
+        if method == GCODE_METHOD:
+            self.name, gcodeParams = parseGcode(params.get("script", ""))
+            target = COALESCE.get(self.name)
+            if target is not None and target in gcodeParams:
+                self.key = (self.name, gcodeParams[target])
+
+    def resolve(self, result: Any = None, error: BaseException | None = None):
+        for future in self.futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+class CommandStats:
+    def __init__(self):
+        self.latency: LatencyStats = LatencyStats(64)
+        self.errors: int = 0
+        self.coalesced: int = 0
+        self.lastError: str = ""
+
+    def summary(self) -> dict:
+        return {
+            **self.latency.summary(),
+            "errors": self.errors,
+            "coalesced": self.coalesced,
+            "last_error": self.lastError,
+        }
+
+
+class CommandQueue:
+    """
+    Sends printer commands one at a time in submission order.
+
+    A queued command that is superseded by a newer one for the same target
+    (see COALESCE) is removed, and the newer one queued at the tail, so it
+    never overtakes commands submitted in between. Urgent commands such as emergency
+    stop skip the queue entirely and discard everything still waiting.
+    Latency and error counts are tracked per command name.
+
+    Nothing is replayed late: the queue holds at most MAX_QUEUED commands,
+    commands that waited longer than MAX_WAIT are dropped, and while
+    `available()` is False, i.e. Moonraker's circuit is open, new commands
+    are rejected and the queued ones failed.
+    """
+
+    def __init__(self, call: Callable, available: Callable[[], bool] = lambda: True):
+        self.call: Callable = call
+        self.available: Callable[[], bool] = available
+        self.queue: Deque[Command] = deque()
+        self.stats: Dict[str, CommandStats] = {}
+        self.worker: asyncio.Task | None = None
+
+    def submit(self, method: str, **params) -> asyncio.Future:
+        command = Command(method, params)
+        future = asyncio.get_event_loop().create_future()
+        future.add_done_callback(self.__consume)
+        command.futures.append(future)
+
+        if not self.available():
+            self.__drop(command, "Moonraker unavailable")
+            return future
+
+        if command.key is not None:
+            for queued in self.queue:
+                if queued.key == command.key:
+                    command.futures = queued.futures + command.futures
+                    self.queue.remove(queued)
+                    self.__stats(command.name).coalesced += 1
+                    break
+        self.__enqueue(command)
+
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self.__work())
+        return future
+
+    def __enqueue(self, command: Command):
+        if len(self.queue) >= MAX_QUEUED:
+            self.__drop(command, "Command queue full")
+        else:
+            self.queue.append(command)
+
+    def __drop(self, command: Command, reason: str):
+        logging.warning("%s, dropping %s" % (reason, command.name))
+        command.resolve(error=CommandDroppedError(reason))
+
+    def fail(self, reason: str):
+        """Fails all queued commands, e.g. when Moonraker became unavailable"""
+        dropped = list(self.queue)
+        self.queue.clear()
+        if dropped:
+            logging.warning("%s, dropping %d commands" % (reason, len(dropped)))
+        for command in dropped:
+            command.resolve(error=CommandDroppedError(reason))
+
+    async def bypass(self, method: str, **params) -> Any:
+        """Sends a command immediately, dropping all queued commands"""
+        dropped = list(self.queue)
+        self.queue.clear()
+        for command in dropped:
+            for future in command.futures:
+                future.cancel()
+        return await self.__send(Command(method, params))
+
+    async def __work(self):
+        while self.queue:
+            command = self.queue.popleft()
+            if not self.available():
+                self.__drop(command, "Moonraker unavailable")
+                continue
+            if time.monotonic() - command.queued > MAX_WAIT:
+                self.__drop(command, "Waited too long")
+                continue
+            try:
+                command.resolve(await self.__send(command))
+            except Exception as e:
+                command.resolve(error=e)
+
+    async def __send(self, command: Command) -> Any:
+        stats = self.__stats(command.name)
+        started = time.monotonic()
+        try:
+            result = await self.call(command.method, **command.params)
+        except Exception as e:
+            stats.errors += 1
+            stats.lastError = str(e)
+            logging.error("Command %s failed: %s" % (command.name, e))
+            raise
+        finally:
+            stats.latency.record(time.monotonic() - started)
+
+        if isinstance(result, dict) and "error" in result:
+            stats.errors += 1
+            stats.lastError = str(result["error"])
+            logging.error("Command %s failed: %s" % (command.name, result["error"]))
+        return result
+
+    def __stats(self, name: str) -> CommandStats:
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = CommandStats()
+        return stats
+
+    def __consume(self, future: asyncio.Future):
+        # Most callers fire and forget, retrieve the exception so asyncio
+        # does not report it as never retrieved
+        if not future.cancelled():
+            future.exception()
+
+    def summary(self) -> Dict[str, dict]:
+        return {name: stats.summary() for name, stats in self.stats.items()}
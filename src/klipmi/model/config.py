@@ -21,16 +21,37 @@ import os
 import tomllib
 
 from optparse import OptionParser
+from typing import List
 
 CONFIG_PATH = "printer_data/config/klipmi.toml"
 TABLE_KLIPMI = "klipmi"
 TABLE_MOONRAKER = "moonraker"
+TABLE_PRINTERS = "printers"
+KEY_NAME = "name"
 KEY_DEVICE = "device"
 KEY_BAUD = "baudrate"
 KEY_UI = "ui"
+KEY_THUMBNAIL_TIME = "thumbnail-upload-time"
+KEY_IO_THREAD = "io-thread"
+KEY_DEBOUNCE = "touch-debounce"
+KEY_EVENT_QUEUE = "event-queue-size"
+KEY_CACHE_DIR = "cache-dir"
+KEY_SNAPSHOT_INTERVAL = "snapshot-interval"
+KEY_WEBCAM_URL = "webcam-url"
+KEY_WEBCAM_FPS = "webcam-fps"
+KEY_WEBCAM_THRESHOLD = "webcam-threshold"
+KEY_IDLE_TIMEOUT = "idle-timeout"
+KEY_IDLE_BRIGHTNESS = "idle-brightness"
+KEY_API_LISTEN = "api-listen"
+KEY_MIRRORS = "mirror-devices"
+KEY_WATCHDOG_THRESHOLD = "watchdog-threshold"
+KEY_WATCHDOG_DEBUG = "watchdog-asyncio-debug"
 KEY_HOST = "host"
 KEY_PORT = "port"
 KEY_API = "api-key"
+KEY_RPC_TIMEOUT = "rpc-timeout"
+KEY_MAX_IN_FLIGHT = "max-in-flight"
+KEY_TRANSPORT = "transport"
 
 
 def getCommaSeparatedArgs(option, _, value, parser):
@@ -62,6 +83,21 @@ class KlipmiConfig:
     device: str = ""
     baud: int = 115200
     ui: str = ""
+    thumbnail_time: float = 3.0
+    io_thread: bool = True
+    debounce: float = 0.3
+    event_queue: int = 8
+    cache_dir: str = "~/.cache/klipmi"
+    snapshot_interval: float = 120.0
+    webcam_url: str = ""
+    webcam_fps: float = 1.0
+    webcam_threshold: float = 0.02
+    idle_timeout: float = 10.0
+    idle_brightness: int = 10
+    api_listen: str = ""
+    mirrors: List[str] = []
+    watchdog_threshold: float = 0.25
+    watchdog_debug: bool = False
 
     def __init__(self, config: dict):
         try:
@@ -79,11 +115,122 @@ class KlipmiConfig:
         except Exception as e:
             logging.exception(e)
 
+        try:
+            self.thumbnail_time = config[KEY_THUMBNAIL_TIME]
+        except Exception:
+            logging.debug(
+                "thumbnail upload time not set in config, defaulting to %.1f"
+                % self.thumbnail_time
+            )
+
+        try:
+            self.io_thread = config[KEY_IO_THREAD]
+        except Exception:
+            logging.debug(
+                "io-thread not set in config, defaulting to %s" % self.io_thread
+            )
+
+        try:
+            self.debounce = config[KEY_DEBOUNCE]
+        except Exception:
+            logging.debug(
+                "touch debounce not set in config, defaulting to %.2f" % self.debounce
+            )
+
+        try:
+            self.event_queue = config[KEY_EVENT_QUEUE]
+        except Exception:
+            logging.debug(
+                "event queue size not set in config, defaulting to %d"
+                % self.event_queue
+            )
+
+        try:
+            self.cache_dir = config[KEY_CACHE_DIR]
+        except Exception:
+            logging.debug(
+                "cache dir not set in config, defaulting to %s" % self.cache_dir
+            )
+
+        try:
+            self.snapshot_interval = config[KEY_SNAPSHOT_INTERVAL]
+        except Exception:
+            logging.debug(
+                "snapshot interval not set in config, defaulting to %.0f"
+                % self.snapshot_interval
+            )
+
+        try:
+            self.webcam_url = config[KEY_WEBCAM_URL]
+        except Exception:
+            logging.debug(
+                "webcam url not set in config, using the first Moonraker webcam"
+            )
+
+        try:
+            self.webcam_fps = config[KEY_WEBCAM_FPS]
+        except Exception:
+            logging.debug(
+                "webcam fps not set in config, defaulting to %.1f" % self.webcam_fps
+            )
+
+        try:
+            self.webcam_threshold = config[KEY_WEBCAM_THRESHOLD]
+        except Exception:
+            logging.debug(
+                "webcam threshold not set in config, defaulting to %.2f"
+                % self.webcam_threshold
+            )
+
+        try:
+            self.idle_timeout = config[KEY_IDLE_TIMEOUT]
+        except Exception:
+            logging.debug(
+                "idle timeout not set in config, defaulting to %.1f" % self.idle_timeout
+            )
+
+        try:
+            self.idle_brightness = config[KEY_IDLE_BRIGHTNESS]
+        except Exception:
+            logging.debug(
+                "idle brightness not set in config, defaulting to %d"
+                % self.idle_brightness
+            )
+
+        try:
+            self.api_listen = config[KEY_API_LISTEN]
+        except Exception:
+            logging.debug("api listen address not set in config, status API disabled")
+
+        try:
+            self.mirrors = config[KEY_MIRRORS]
+        except Exception:
+            logging.debug("mirror devices not set in config, not mirroring")
+
+        try:
+            self.watchdog_threshold = config[KEY_WATCHDOG_THRESHOLD]
+        except Exception:
+            logging.debug(
+                "watchdog threshold not set in config, defaulting to %.2f"
+                % self.watchdog_threshold
+            )
+
+        try:
+            self.watchdog_debug = config[KEY_WATCHDOG_DEBUG]
+        except Exception:
+            logging.debug(
+                "watchdog asyncio debug not set in config, defaulting to %s"
+                % self.watchdog_debug
+            )
+
 
 class MoonrakerConfig:
     host: str = "0.0.0.0"
     port: int = 7125
     api_key: str = ""
+    rpc_timeout: float = 10.0
+    max_in_flight: int = 8
+    transport: str = "websocket"
 
     def __init__(self, config: dict):
         try:
@@ -101,20 +248,81 @@ class MoonrakerConfig:
         except Exception as e:
             logging.exception(e)
 
+        try:
+            self.rpc_timeout = config[KEY_RPC_TIMEOUT]
+        except Exception:
+            logging.debug(
+                "rpc timeout not set in config, defaulting to %.1f" % self.rpc_timeout
+            )
+
+        try:
+            self.max_in_flight = config[KEY_MAX_IN_FLIGHT]
+        except Exception:
+            logging.debug(
+                "max in flight not set in config, defaulting to %d" % self.max_in_flight
+            )
+
+        try:
+            self.transport = config[KEY_TRANSPORT]
+        except Exception:
+            logging.debug(
+                "transport not set in config, defaulting to %s" % self.transport
+            )
+
+
+def parseConfig(path: str) -> dict:
+    with open(path, "rb") as f:
+        try:
+            return tomllib.load(f)
+        except Exception as e:
+            logging.exception(e)
+            return {}
+
 
 class Config:
     timeout: int = 5
 
-    def __init__(self):
+    def __init__(self, raw: dict | None = None, name: str = ""):
         self.path: str = getConfigPath() or CONFIG_PATH
-        self._raw: dict = self.parse()
+        self._raw: dict = self.parse() if raw is None else raw
+        # Tags the logs and metrics of this printer in multi-printer mode
+        self.name: str = name
         self.klipmi: KlipmiConfig = KlipmiConfig(self._raw[TABLE_KLIPMI])
         self.moonraker: MoonrakerConfig = MoonrakerConfig(self._raw[TABLE_MOONRAKER])
 
     def parse(self) -> dict:
-        with open(self.path, "rb") as f:
-            try:
-                return tomllib.load(f)
-            except Exception as e:
-                logging.exception(e)
-                return {}
+        return parseConfig(self.path)
+
+    @classmethod
+    def load(cls) -> List["Config"]:
+        """
+        One config per printer/display pair. Without [[printers]] entries the
+        file describes a single pair. Otherwise each entry holds the [klipmi]
+        and [moonraker] settings of one pair on top of the top level tables,
+        which then only provide defaults. Every pair caches into its own
+        subdirectory, and the status API is only served where an entry asks
+        for it, pairs can not share a listen address.
+        """
+        raw = parseConfig(getConfigPath() or CONFIG_PATH)
+        printers = raw.get(TABLE_PRINTERS, [])
+        if not printers:
+            return [cls(raw)]
+
+        defaults = raw.get(TABLE_KLIPMI, {})
+        configs = []
+        for number, entry in enumerate(printers, 1):
+            name = entry.get(KEY_NAME, "printer%d" % number)
+            klipmi = dict(defaults)
+            klipmi.pop(KEY_API_LISTEN, None)
+            klipmi[KEY_CACHE_DIR] = os.path.join(
+                defaults.get(KEY_CACHE_DIR, KlipmiConfig.cache_dir), name
+            )
+            klipmi.update(entry.get(TABLE_KLIPMI, {}))
+            moonraker = {
+                **raw.get(TABLE_MOONRAKER, {}),
+                **entry.get(TABLE_MOONRAKER, {}),
+            }
+            configs.append(
+                cls({TABLE_KLIPMI: klipmi, TABLE_MOONRAKER: moonraker}, name)
+            )
+        return configs
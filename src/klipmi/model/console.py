@@ -0,0 +1,49 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from collections import deque
+from typing import Deque, List
+
+CONSOLE_LINES = 200
+
+
+class Console:
+    """The latest G-code responses, older lines are dropped"""
+
+    def __init__(self, maxlines: int = CONSOLE_LINES):
+        self.lines: Deque[str] = deque(maxlen=maxlines)
+        # Lines received in total, tells readers whether anything arrived
+        self.total: int = 0
+
+    def append(self, response: str):
+        for line in response.splitlines():
+            self.lines.append(line)
+            self.total += 1
+
+    def window(self, rows: int, offset: int = 0) -> List[str]:
+        """
+        The `rows` lines ending `offset` lines before the newest one, oldest
+        first and padded with empty lines at the top
+        """
+        end = max(0, len(self.lines) - offset)
+        start = max(0, end - rows)
+        lines = [self.lines[i] for i in range(start, end)]
+        return [""] * (rows - len(lines)) + lines
+
+    def __len__(self) -> int:
+        return len(self.lines)
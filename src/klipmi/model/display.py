@@ -0,0 +1,387 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import contextvars
+import inspect
+import logging
+import os
+import serial
+import threading
+import time
+
+from nextion import TJC, EventType
+from typing import Any, Callable, Dict, List, Tuple
+
+from klipmi.utils.ringbuffer import RingBuffer
+from klipmi.utils.stats import LatencyStats
+
+EOL = b"\xff\xff\xff"
+
+# Packets with a fixed length, their payload may contain 0xff bytes
+PACKET_LENGTH = {
+    0x00: 6,  # Startup
+    0x24: 4,  # Serial buffer overflow
+    0x65: 7,  # Touch event
+    0x66: 5,  # Current page number
+    0x67: 9,  # Touch coordinate
+    0x68: 9,  # Touch coordinate in sleep
+    0x71: 8,  # Numeric data
+    0x86: 4,  # Auto sleep
+    0x87: 4,  # Auto wake
+    0x88: 4,  # Ready
+    0x89: 4,  # SD card upgrade
+    0xFD: 4,  # Transparent data finished
+    0xFE: 4,  # Transparent data ready
+}
+
+# How long a blocking read may hold the I/O thread before it services writes
+READ_TIMEOUT = 0.01
+
+# Transparent transfer replies, framed as events by the protocol
+TRANSPARENT_READY = 0xFE
+TRANSPARENT_FINISHED = 0xFD
+TRANSPARENT_TIMEOUT = 1.0
+
+# Commands pipelined by batch() per write, kept below the display's serial
+# buffer so it never overflows
+BATCH_BYTES = 768
+SUCCESS = 0x01
+
+
+def splitFrames(buffer: bytes) -> Tuple[List[bytes], bytes]:
+    """Splits complete TJC frames off the buffer, returns frames and the rest"""
+    frames = []
+    while buffer:
+        length = PACKET_LENGTH.get(buffer[0])
+        if (
+            length is not None
+            and len(buffer) >= length
+            and buffer[length - 3 : length] == EOL
+        ):
+            end = length
+        else:
+            end = buffer.find(EOL)
+            if end < 0:
+                break
+            end += len(EOL)
+        frames.append(buffer[:end])
+        buffer = buffer[end:]
+    return frames, buffer
+
+
+class SerialThreadTransport(asyncio.Transport):
+    """
+    Transport that owns the serial port from a dedicated thread.
+
+    The thread frames incoming bytes into complete TJC packets and hands them
+    to the event loop through a ring buffer, so reads never wait on the loop.
+    Writes from the loop go through a second ring buffer the thread drains.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        protocol: asyncio.Protocol,
+        port: serial.Serial,
+        capacity: int = 256,
+    ):
+        super().__init__()
+        self.loop = loop
+        self.protocol = protocol
+        self.port = port
+        self.rx: RingBuffer = RingBuffer(capacity)
+        self.tx: RingBuffer = RingBuffer(capacity)
+        self.frameStamp: float = 0.0
+        self.running: bool = True
+        self.closing: bool = False
+        self.scheduled: bool = False
+        # Callbacks from the thread run in the context of the loop side, e.g.
+        # to keep the printer name logs are tagged with
+        self.context: contextvars.Context = contextvars.copy_context()
+        self.thread = threading.Thread(
+            target=self.run, name="klipmi-serial", daemon=True
+        )
+
+    def run(self):
+        buffer = b""
+        while self.running:
+            try:
+                for data in self.tx.drain():
+                    self.port.write(data)
+                chunk = self.port.read(self.port.in_waiting or 1)
+            except serial.SerialException as e:
+                if self.running:
+                    self.running = False
+                    self.loop.call_soon_threadsafe(self.lost, e, context=self.context)
+                return
+
+            if not chunk:
+                continue
+
+            frames, buffer = splitFrames(buffer + chunk)
+            stamp = time.perf_counter()
+            for frame in frames:
+                if not self.rx.push((stamp, frame)):
+                    logging.warning("Serial receive buffer full, dropping frame")
+            if frames and not self.scheduled:
+                self.scheduled = True
+                self.loop.call_soon_threadsafe(self.deliver, context=self.context)
+
+    def deliver(self):
+        self.scheduled = False
+        for stamp, frame in self.rx.drain():
+            self.frameStamp = stamp
+            self.protocol.data_received(frame)
+
+    def lost(self, exc: Exception | None):
+        self.port.close()
+        self.protocol.connection_lost(exc)
+
+    def write(self, data):
+        if self.closing:
+            return
+        if not self.tx.push(bytes(data)):
+            logging.error("Serial transmit buffer full, dropping %d bytes", len(data))
+        if hasattr(self.port, "cancel_read"):
+            self.port.cancel_read()
+
+    def is_closing(self) -> bool:
+        return self.closing
+
+    def close(self):
+        if self.closing:
+            return
+        self.closing = True
+        self.running = False
+        if hasattr(self.port, "cancel_read"):
+            self.port.cancel_read()
+        self.thread.join(READ_TIMEOUT * 10)
+        self.loop.call_soon(self.lost, None)
+
+    def get_extra_info(self, name, default=None):
+        if name == "serial":
+            return self.port
+        return default
+
+
+async def waitForDevice(url: str, timeout: float = 30.0) -> bool:
+    """Polls until a device node exists, instead of sleeping a fixed time"""
+    if not url.startswith("/"):
+        return True
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(url):
+        if time.monotonic() > deadline:
+            logging.error("Display device %s did not appear" % url)
+            return False
+        await asyncio.sleep(0.1)
+    return True
+
+
+async def createSerialConnection(
+    loop: asyncio.AbstractEventLoop, protocolFactory: Callable, url: str, baudrate: int
+):
+    """Threaded equivalent of serial_asyncio.create_serial_connection"""
+    port = serial.serial_for_url(url, baudrate=baudrate, timeout=READ_TIMEOUT)
+    protocol = protocolFactory()
+    transport = SerialThreadTransport(loop, protocol, port)
+    loop.call_soon(protocol.connection_made, transport)
+    transport.thread.start()
+    return transport, protocol
+
+
+class Display(TJC):
+    """
+    TJC display whose serial port is served by a dedicated I/O thread.
+    Touch-to-handler latency is measured from the moment the thread framed
+    the event until its handler starts running on the loop.
+
+    Component values written with set() are mirrored in a shadow copy, and
+    writes that would not change what the display shows are skipped. The
+    shadow must be cleared whenever the display resets its components, i.e.
+    on page changes and reconnects.
+    """
+
+    def __init__(
+        self, url: str, baud: int, eventHandler: Callable, threaded: bool = True
+    ):
+        super().__init__(url, baud, eventHandler)
+        self.threaded: bool = threaded
+        self.latency: LatencyStats = LatencyStats()
+        self.shadow: Dict[str, Any] = {}
+        # Transparent transfer replies addt() is waiting for, by code
+        self.transparent: Dict[int, asyncio.Future] = {}
+
+    async def _create_serial_connection(self, baud: int):
+        if not self.threaded:
+            return await super()._create_serial_connection(baud)
+        _, connection = await createSerialConnection(
+            asyncio.get_event_loop(), self._make_protocol, self._url, baud
+        )
+        return connection
+
+    async def set(self, key: str, value, *args, **kwargs):
+        # Only component attributes are shadowed, system variables such as
+        # sleep or dim are always written. Sets deferred while sleeping are
+        # replayed through set() on wakeup and must not be skipped.
+        shadowed = "." in key and not self._sleeping
+        if shadowed and key in self.shadow and self.shadow[key] == value:
+            return value
+        result = await super().set(key, value, *args, **kwargs)
+        if shadowed:
+            self.shadow[key] = value
+        return result
+
+    def clearShadow(self):
+        self.shadow.clear()
+
+    async def addt(self, component: int, channel: int, values: bytes) -> bool:
+        """
+        Appends points to a waveform channel in one transparent transfer, the
+        whole batch costs a single command round trip instead of one add per
+        point. Returns False if nothing was sent because the display sleeps.
+        """
+        if self._sleeping:
+            return False
+        if not values:
+            return True
+        async with self._command_lock:
+            self._connection.write(
+                b"addt %d,%d,%d" % (component, channel, len(values))
+            )
+            await self.__expect(TRANSPARENT_READY)
+            self.__writeRaw(values)
+            await self.__expect(TRANSPARENT_FINISHED)
+        return True
+
+    async def batch(self, commands: List[str]) -> bool:
+        """
+        Pipelines commands: each chunk is sent in one write and then all its
+        acknowledgements are collected, instead of one round trip per command.
+        Relies on bkcmd=3, every command is answered exactly once. Returns
+        False if nothing was sent because the display sleeps.
+        """
+        if self._sleeping:
+            return False
+        chunks: List[List[bytes]] = [[]]
+        size = 0
+        for command in commands:
+            encoded = command.encode("ascii") + EOL
+            if size + len(encoded) > BATCH_BYTES and chunks[-1]:
+                chunks.append([])
+                size = 0
+            chunks[-1].append(encoded)
+            size += len(encoded)
+
+        async with self._command_lock:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                # Replies left over from an earlier command are not ours
+                self.__flushReads()
+                self.__writeRaw(b"".join(chunk))
+                try:
+                    await asyncio.wait_for(
+                        self.__acknowledge(len(chunk)), TRANSPARENT_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    # The missing acks must not be read as replies to whatever
+                    # command takes the lock next
+                    self.__flushReads()
+                    raise
+        return True
+
+    async def __acknowledge(self, count: int):
+        failed = 0
+        for _ in range(count):
+            frame = await self._connection.read()
+            if not frame or frame[0] != SUCCESS:
+                failed += 1
+        if failed:
+            logging.warning("%d of %d batched commands failed", failed, count)
+
+    def __flushReads(self):
+        try:
+            while True:
+                self._connection.read_no_wait()
+        except asyncio.QueueEmpty:
+            pass
+
+    def __writeRaw(self, data: bytes):
+        # NextionProtocol.write(eol=False) sends nothing on nextion 1.x
+        self._connection.transport.write(data)
+
+    async def __expect(self, code: int):
+        # The reply lands in the read queue on nextion 1.x, builds whose
+        # EventType includes the transparent codes hand it to the event
+        # handler instead. Either path resolves the future. It is registered
+        # before anything is awaited, the reply to a write just made cannot
+        # have arrived yet.
+        future = asyncio.get_event_loop().create_future()
+        self.transparent[code] = future
+
+        async def read():
+            while not future.done():
+                frame = await self._connection.read()
+                if frame:
+                    self.__onTransparent(frame[0])
+
+        reader = asyncio.create_task(read())
+        try:
+            await asyncio.wait_for(future, TRANSPARENT_TIMEOUT)
+        finally:
+            reader.cancel()
+            self.transparent.pop(code, None)
+
+    def __onTransparent(self, code: int) -> bool:
+        """Resolves the addt() waiting for `code`, True if it was a reply"""
+        if code not in (TRANSPARENT_READY, TRANSPARENT_FINISHED):
+            return False
+        future = self.transparent.get(code)
+        if future is None or future.done():
+            logging.debug("Unexpected transparent data reply 0x%02x", code)
+        else:
+            future.set_result(None)
+        return True
+
+    def _make_protocol(self):
+        protocol = super()._make_protocol()
+        handler = protocol.event_message_handler
+
+        def onEvent(message: bytes):
+            if message and self.__onTransparent(message[0]):
+                return
+            handler(message)
+
+        protocol.event_message_handler = onEvent
+        return protocol
+
+    def _schedule_event_message_handler(self, type_, data) -> None:
+        transport = getattr(self._connection, "transport", None)
+        stamp = getattr(transport, "frameStamp", None)
+        asyncio.create_task(self.__callEventHandler(type_, data, stamp))
+
+    async def __callEventHandler(self, type_, data, stamp: float | None):
+        if stamp is not None and type_ == EventType.TOUCH:
+            self.latency.record(time.perf_counter() - stamp)
+            if self.latency.count % 100 == 0:
+                logging.info("Touch latency: %s", self.latency)
+        # nextion 1.x has no _call_event_handler, the handler may be sync
+        result = self.event_handler(type_, data)
+        if inspect.isawaitable(result):
+            await result
@@ -0,0 +1,230 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import inspect
+import logging
+
+from collections import deque
+from nextion import EventType
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+from klipmi.model.display import Display, waitForDevice
+
+# Writes a mirror may lag behind the primary before it is resynced instead
+MIRROR_QUEUE = 256
+
+# Seconds a single write to a mirror may take before it counts as failed
+MIRROR_TIMEOUT = 5.0
+
+# Seconds between attempts to reach a mirror that failed
+MIRROR_RETRY = 5.0
+
+
+class Mirror:
+    """A secondary panel and the writes it has yet to catch up on"""
+
+    def __init__(self, device: str):
+        self.device: str = device
+        self.display: Display
+        self.queue: Deque[Tuple[str, tuple, dict]] = deque()
+        self.pending: asyncio.Event = asyncio.Event()
+        # Lost track of what the panel shows, it must be redrawn from scratch
+        self.stale: bool = True
+
+
+class DisplayGroup:
+    """
+    Fans the UI out to a primary display and any number of mirror panels.
+
+    Callers only wait for the primary, reads are answered by it as well.
+    Every write is built once and queued for each mirror, whose own worker
+    replays the queue in order, so all panels are written in parallel and
+    each keeps its own shadow cache. A mirror that falls too far behind,
+    times out or reconnects drops its queue and is resynced: it is switched
+    to the current page and gets every component attribute set since the
+    page was shown. Pictures are not replayed, they show up again with their
+    next upload.
+
+    Touches are accepted from every panel.
+    """
+
+    def __init__(
+        self,
+        primary: Display,
+        devices: List[str],
+        baud: int,
+        eventHandler: Callable,
+        threaded: bool = True,
+    ):
+        self.primary: Display = primary
+        self.eventHandler: Callable = eventHandler
+        self.mirrors: List[Mirror] = []
+        for device in devices:
+            mirror = Mirror(device)
+            mirror.display = Display(
+                device, baud, self.__mirrorEventHandler(mirror), threaded
+            )
+            self.mirrors.append(mirror)
+        self.page: str | None = None
+        # Component attributes set since the last page change, what a mirror
+        # needs to catch up
+        self.shown: Dict[str, Any] = {}
+        self.sleeping: bool = False
+        self.workers: List[asyncio.Task] = []
+
+    @property
+    def encoding(self) -> str:
+        return self.primary.encoding
+
+    @encoding.setter
+    def encoding(self, encoding: str):
+        self.primary.encoding = encoding
+        for mirror in self.mirrors:
+            mirror.display.encoding = encoding
+
+    def __mirrorEventHandler(self, mirror: Mirror) -> Callable:
+        async def handler(type: EventType, data):
+            if type == EventType.RECONNECTED:
+                # Only this panel lost its contents
+                self.__invalidate(mirror)
+            else:
+                await self.eventHandler(type, data)
+
+        return handler
+
+    def __invalidate(self, mirror: Mirror):
+        mirror.stale = True
+        mirror.queue.clear()
+        mirror.pending.set()
+
+    def __fanOut(self, method: str, *args, **kwargs):
+        for mirror in self.mirrors:
+            if mirror.stale:
+                # The resync covers this write
+                continue
+            if len(mirror.queue) >= MIRROR_QUEUE:
+                logging.warning("Mirror %s fell behind, resyncing" % mirror.device)
+                self.__invalidate(mirror)
+                continue
+            mirror.queue.append((method, args, kwargs))
+            mirror.pending.set()
+
+    async def connect(self):
+        await self.primary.connect()
+        if not self.workers:
+            self.workers = [
+                asyncio.create_task(self.__runMirror(mirror)) for mirror in self.mirrors
+            ]
+
+    async def __runMirror(self, mirror: Mirror):
+        while not await waitForDevice(mirror.device):
+            await asyncio.sleep(MIRROR_RETRY)
+        while True:
+            try:
+                await mirror.display.connect()
+                break
+            except Exception as e:
+                logging.warning("Connecting mirror %s failed: %s" % (mirror.device, e))
+                await asyncio.sleep(MIRROR_RETRY)
+
+        while True:
+            if mirror.stale:
+                # Writes from here on queue up behind the resync, which starts
+                # from what is shown right now
+                mirror.queue.clear()
+                mirror.stale = False
+                try:
+                    await asyncio.wait_for(
+                        self.__resync(mirror, self.page, dict(self.shown)),
+                        MIRROR_TIMEOUT * 4,
+                    )
+                except Exception as e:
+                    logging.debug("Resyncing mirror %s failed: %s" % (mirror.device, e))
+                    self.__invalidate(mirror)
+                    await asyncio.sleep(MIRROR_RETRY)
+                continue
+
+            if not mirror.queue:
+                mirror.pending.clear()
+                await mirror.pending.wait()
+                continue
+
+            method, args, kwargs = mirror.queue.popleft()
+            try:
+                result = getattr(mirror.display, method)(*args, **kwargs)
+                if inspect.isawaitable(result):
+                    await asyncio.wait_for(result, MIRROR_TIMEOUT)
+            except Exception as e:
+                logging.warning(
+                    "Writing to mirror %s failed: %s, resyncing" % (mirror.device, e)
+                )
+                self.__invalidate(mirror)
+
+    async def __resync(self, mirror: Mirror, page: str | None, shown: Dict[str, Any]):
+        display = mirror.display
+        if self.sleeping:
+            await display.sleep()
+            return
+        await display.wakeup()
+        if page is not None:
+            await display.command(page)
+        display.clearShadow()
+        for key, value in shown.items():
+            await display.set(key, value)
+
+    async def set(self, key: str, value, *args, **kwargs):
+        if "." in key:
+            # Mirrors show what the primary shows, skip what its shadow would
+            if key in self.shown and self.shown[key] == value:
+                return await self.primary.set(key, value, *args, **kwargs)
+            self.shown[key] = value
+        self.__fanOut("set", key, value, *args, **kwargs)
+        return await self.primary.set(key, value, *args, **kwargs)
+
+    async def get(self, key: str, *args, **kwargs):
+        return await self.primary.get(key, *args, **kwargs)
+
+    async def command(self, command: str, *args, **kwargs):
+        if command.startswith("page "):
+            self.page = command
+        self.__fanOut("command", command, *args, **kwargs)
+        return await self.primary.command(command, *args, **kwargs)
+
+    async def addt(self, component: int, channel: int, values: bytes) -> bool:
+        self.__fanOut("addt", component, channel, values)
+        return await self.primary.addt(component, channel, values)
+
+    async def batch(self, commands: List[str]) -> bool:
+        self.__fanOut("batch", commands)
+        return await self.primary.batch(commands)
+
+    def clearShadow(self):
+        self.shown.clear()
+        self.__fanOut("clearShadow")
+        self.primary.clearShadow()
+
+    async def sleep(self):
+        self.sleeping = True
+        self.__fanOut("sleep")
+        await self.primary.sleep()
+
+    async def wakeup(self):
+        self.sleeping = False
+        self.__fanOut("wakeup")
+        await self.primary.wakeup()
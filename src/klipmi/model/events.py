@@ -0,0 +1,91 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import logging
+import time
+
+from nextion import EventType
+from typing import Callable, Dict, Tuple
+
+
+class EventPipeline:
+    """
+    Bounded, ordered delivery of display events.
+
+    Every page gets its own queue drained by a single worker, so events are
+    handled one at a time and in the order they arrived. Identical touches
+    within the debounce window are dropped, as are events that arrive while
+    a page's queue is full.
+    """
+
+    def __init__(self, handler: Callable, debounce: float, maxsize: int):
+        self.handler: Callable = handler
+        self.debounce: float = debounce
+        self.maxsize: int = maxsize
+        self.queues: Dict[int | None, asyncio.Queue] = {}
+        self.workers: Dict[int | None, asyncio.Task] = {}
+        self.lastSeen: Dict[Tuple, float] = {}
+        self.stats: Dict[str, int] = {"handled": 0, "debounced": 0, "dropped": 0}
+
+    def isBounce(self, type: EventType, data) -> bool:
+        if type != EventType.TOUCH:
+            return False
+        key = (data.page_id, data.component_id, data.touch_event)
+        now = time.monotonic()
+        last = self.lastSeen.get(key)
+        if last is not None and now - last < self.debounce:
+            # Measured from the last accepted touch, chatter must not keep
+            # extending the window
+            return True
+        self.lastSeen[key] = now
+        return False
+
+    def put(self, type: EventType, data):
+        if self.isBounce(type, data):
+            self.stats["debounced"] += 1
+            return
+
+        page = data.page_id if type == EventType.TOUCH else None
+        queue = self.queues.get(page)
+        if queue is None:
+            queue = self.queues[page] = asyncio.Queue(self.maxsize)
+        try:
+            queue.put_nowait((type, data))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            logging.warning("Event queue for page %s full, dropping %s" % (page, type))
+            return
+        if queue.qsize() > 1:
+            logging.debug("Event queue depth: %s" % self.depth())
+
+        worker = self.workers.get(page)
+        if worker is None or worker.done():
+            self.workers[page] = asyncio.create_task(self.__work(queue))
+
+    async def __work(self, queue: asyncio.Queue):
+        while not queue.empty():
+            type, data = queue.get_nowait()
+            try:
+                await self.handler(type, data)
+            except Exception as e:
+                logging.exception(e)
+            self.stats["handled"] += 1
+
+    def depth(self) -> Dict[int | None, int]:
+        return {page: queue.qsize() for page, queue in self.queues.items()}
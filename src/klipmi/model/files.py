@@ -0,0 +1,308 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import heapq
+import logging
+
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Any, Callable, Coroutine, Dict, List, Set, Tuple
+
+GCODES = "gcodes"
+
+
+class FileEntry:
+    __slots__ = ("path", "modified", "size")
+
+    def __init__(self, path: str, modified: float, size: int):
+        self.path: str = path
+        self.modified: float = modified
+        self.size: int = size
+
+    @property
+    def key(self) -> Tuple[float, str]:
+        # Newest first, then by path
+        return (-self.modified, self.path)
+
+
+class SearchIndex:
+    """
+    Trigram index over file paths for case-insensitive substring search.
+
+    A query of three or more characters only looks at the paths containing
+    all of its trigrams, starting from the rarest one, and confirms the
+    match on those. Shorter queries scan the lowercased paths, which is
+    still fast at library sizes and rarely narrows much anyway.
+
+    Indexing a whole library takes a while, so loaded paths are only queued
+    and indexed in chunks by build(), or all at once by the first search.
+    """
+
+    def __init__(self):
+        self.texts: Dict[str, str] = {}
+        self.trigrams: Dict[str, Set[str]] = {}
+        self.pending: Dict[str, None] = {}
+
+    @staticmethod
+    def normalize(path: str) -> str:
+        # Every file ends in .gcode, indexing it would only add noise
+        text = path.lower()
+        return text[: -len(".gcode")] if text.endswith(".gcode") else text
+
+    @staticmethod
+    def split(text: str) -> Set[str]:
+        return {text[i : i + 3] for i in range(len(text) - 2)}
+
+    def add(self, path: str):
+        self.pending.pop(path, None)
+        text = self.normalize(path)
+        self.texts[path] = text
+        for trigram in self.split(text):
+            self.trigrams.setdefault(trigram, set()).add(path)
+
+    def remove(self, path: str):
+        if path in self.pending:
+            del self.pending[path]
+            return
+        text = self.texts.pop(path, None)
+        if text is None:
+            return
+        for trigram in self.split(text):
+            paths = self.trigrams.get(trigram)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self.trigrams[trigram]
+
+    def clear(self):
+        self.texts.clear()
+        self.trigrams.clear()
+        self.pending.clear()
+
+    def queue(self, paths):
+        self.pending.update(dict.fromkeys(paths))
+
+    def build(self, count: int | None = None) -> bool:
+        """Indexes up to `count` queued paths, True once none are left"""
+        while self.pending and count != 0:
+            self.add(next(iter(self.pending)))
+            if count is not None:
+                count -= 1
+        return not self.pending
+
+    def search(self, query: str) -> List[str]:
+        self.build()
+        # Normalized like the indexed paths, "benchy.gcode" must find benchy
+        query = self.normalize(query.strip())
+        if len(query) < 3:
+            return [path for path, text in self.texts.items() if query in text]
+
+        candidates = []
+        for trigram in self.split(query):
+            paths = self.trigrams.get(trigram)
+            if paths is None:
+                return []
+            candidates.append(paths)
+        candidates.sort(key=len)
+        matches = candidates[0].intersection(*candidates[1:])
+        return [path for path in matches if query in self.texts[path]]
+
+
+class FileIndex:
+    """
+    Local index of the G-code files, newest first.
+
+    Loaded once from server.files.list and then kept current by applying
+    notify_filelist_changed notifications, so browsing never lists the whole
+    library again. Pages are slices of the sorted order.
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, FileEntry] = {}
+        self.order: List[Tuple[float, str]] = []
+        self.search: SearchIndex = SearchIndex()
+        # Incremented on every change, lets pages tell whether to redraw
+        self.version: int = 0
+
+    def load(self, files: List[dict]):
+        self.entries = {
+            item["path"]: FileEntry(
+                item["path"], item.get("modified", 0.0), item.get("size", 0)
+            )
+            for item in files
+        }
+        self.order = sorted(entry.key for entry in self.entries.values())
+        self.search.clear()
+        self.search.queue(self.entries)
+        self.version += 1
+
+    def add(self, path: str, modified: float, size: int):
+        self.remove(path)
+        entry = FileEntry(path, modified, size)
+        self.entries[path] = entry
+        insort(self.order, entry.key)
+        self.search.add(path)
+
+    def remove(self, path: str):
+        entry = self.entries.pop(path, None)
+        if entry is None:
+            return
+        index = bisect_left(self.order, entry.key)
+        if index < len(self.order) and self.order[index] == entry.key:
+            del self.order[index]
+        self.search.remove(path)
+
+    def apply(self, change: dict) -> bool:
+        """
+        Applies a notify_filelist_changed payload. Returns False if the index
+        cannot follow the change and has to be reloaded.
+        """
+        item = change.get("item", {})
+        if item.get("root") != GCODES:
+            # Other roots, e.g. config files, do not concern the index
+            return True
+
+        action = change.get("action")
+        path = item.get("path", "")
+        if action in ["create_file", "modify_file"]:
+            self.add(path, item.get("modified", 0.0), item.get("size", 0))
+        elif action == "delete_file":
+            self.remove(path)
+        elif action == "move_file":
+            self.remove(change.get("source_item", {}).get("path", ""))
+            self.add(path, item.get("modified", 0.0), item.get("size", 0))
+        elif action == "delete_dir":
+            for child in self.children(path):
+                self.remove(child)
+        elif action == "move_dir":
+            source = change.get("source_item", {}).get("path", "")
+            for child in self.children(source):
+                entry = self.entries[child]
+                self.remove(child)
+                self.add(path + child[len(source) :], entry.modified, entry.size)
+        elif action == "create_dir":
+            return True
+        else:
+            return False
+        self.version += 1
+        return True
+
+    def children(self, directory: str) -> List[str]:
+        prefix = directory.rstrip("/") + "/"
+        return [path for path in self.entries if path.startswith(prefix)]
+
+    def page(self, number: int, size: int) -> List[FileEntry]:
+        return [
+            self.entries[path]
+            for _, path in self.order[number * size : (number + 1) * size]
+        ]
+
+    def find(self, query: str, limit: int = 100) -> List[FileEntry]:
+        """Files whose path contains the query, newest first"""
+        keys = (self.entries[path].key for path in self.search.search(query))
+        return [self.entries[path] for _, path in heapq.nsmallest(limit, keys)]
+
+    def pages(self, size: int) -> int:
+        return max(1, -(-len(self.order) // size))
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.entries
+
+
+class MetadataCache:
+    """
+    LRU cache of server.files.metadata results.
+
+    Concurrent requests for the same file share a single RPC. Entries are
+    invalidated per file when the file list changes, and prefetch() warms
+    the cache in the background for files about to be shown.
+    """
+
+    def __init__(
+        self, fetch: Callable[[str], Coroutine[Any, Any, dict]], maxsize: int = 64
+    ):
+        self.fetch: Callable[[str], Coroutine[Any, Any, dict]] = fetch
+        self.maxsize: int = maxsize
+        self.entries: OrderedDict[str, dict] = OrderedDict()
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.prefetching: asyncio.Task | None = None
+
+    async def get(self, filename: str) -> dict:
+        metadata = self.entries.get(filename)
+        if metadata is not None:
+            self.entries.move_to_end(filename)
+            return metadata
+
+        task = self.inflight.get(filename)
+        if task is None:
+            task = asyncio.create_task(self.fetch(filename))
+            self.inflight[filename] = task
+            task.add_done_callback(lambda task: self.__done(filename, task))
+        # Shielded, one caller giving up must not cancel the others
+        return await asyncio.shield(task)
+
+    def __done(self, filename: str, task: asyncio.Task):
+        if self.inflight.get(filename) is not task:
+            # Invalidated while the request was running
+            return
+        del self.inflight[filename]
+        if task.cancelled() or task.exception() is not None:
+            return
+        metadata = task.result()
+        if "error" in metadata:
+            return
+        self.entries[filename] = metadata
+        self.entries.move_to_end(filename)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, path: str):
+        """Drops a file, or everything below a directory"""
+        prefix = path.rstrip("/") + "/"
+        for filename in [
+            filename
+            for filename in list(self.entries) + list(self.inflight)
+            if filename == path or filename.startswith(prefix)
+        ]:
+            self.entries.pop(filename, None)
+            self.inflight.pop(filename, None)
+
+    def clear(self):
+        self.entries.clear()
+        self.inflight.clear()
+
+    def prefetch(self, filenames: List[str]):
+        """Fetches the files not cached yet one by one, replacing any earlier prefetch"""
+        if self.prefetching is not None:
+            self.prefetching.cancel()
+        missing = [filename for filename in filenames if filename not in self.entries]
+        if missing:
+            self.prefetching = asyncio.create_task(self.__prefetch(missing))
+
+    async def __prefetch(self, filenames: List[str]):
+        for filename in filenames:
+            try:
+                await self.get(filename)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.debug("Prefetching metadata of %s failed: %s" % (filename, e))
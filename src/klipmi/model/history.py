@@ -0,0 +1,99 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from array import array
+from typing import Dict, List
+
+from klipmi.model.status import StatusStore
+
+# Same sampling as Moonraker's temperature store, so its history can seed ours
+HISTORY_SIZE = 1200
+HISTORY_INTERVAL = 1.0
+
+
+class SensorHistory:
+    """Fixed-size ring of temperature and target samples of one sensor"""
+
+    def __init__(self, size: int = HISTORY_SIZE):
+        self.size: int = size
+        self.temperatures: array = array("f", [0.0] * size)
+        self.targets: array = array("f", [0.0] * size)
+        # Samples recorded since the last seed, and how often it was seeded
+        self.total: int = 0
+        self.seeded: int = 0
+
+    def record(self, temperature: float, target: float):
+        index = self.total % self.size
+        self.temperatures[index] = temperature
+        self.targets[index] = target
+        self.total += 1
+
+    def seed(self, temperatures: List[float], targets: List[float] | None):
+        """Replaces the history with samples from Moonraker, oldest first"""
+        temperatures = temperatures[-self.size :]
+        if targets is None:
+            targets = [0.0] * len(temperatures)
+        self.total = 0
+        self.seeded += 1
+        for temperature, target in zip(temperatures, targets[-self.size :]):
+            self.record(temperature, target)
+
+    def window(self, series: array, count: int) -> array:
+        """The newest `count` samples of a series, oldest first"""
+        count = min(count, self.total, self.size)
+        if count == 0:
+            return array("f")
+        end = self.total % self.size or self.size
+        start = end - count
+        if start >= 0:
+            return series[start:end]
+        return series[start:] + series[:end]
+
+    def __len__(self) -> int:
+        return min(self.total, self.size)
+
+
+class TemperatureHistory:
+    """Histories of every subscribed object reporting a temperature"""
+
+    def __init__(self, status: StatusStore, size: int = HISTORY_SIZE):
+        self.status: StatusStore = status
+        self.sensors: Dict[str, SensorHistory] = {}
+        self.slots: Dict[str, tuple] = {}
+        for obj, fields in status.index.items():
+            if "temperature" in fields:
+                self.sensors[obj] = SensorHistory(size)
+                self.slots[obj] = (
+                    status.slot(obj, "temperature"),
+                    status.slot(obj, "target"),
+                )
+
+    def sample(self):
+        for obj, (temperature, target) in self.slots.items():
+            self.sensors[obj].record(
+                self.status.getFloat(temperature), self.status.getFloat(target)
+            )
+
+    def seed(self, store: dict):
+        """Seeds from a server.temperature_store response"""
+        for obj, history in store.items():
+            if obj in self.sensors and "temperatures" in history:
+                self.sensors[obj].seed(history["temperatures"], history.get("targets"))
+
+    def __getitem__(self, obj: str) -> SensorHistory:
+        return self.sensors[obj]
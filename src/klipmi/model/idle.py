@@ -0,0 +1,134 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import logging
+import time
+
+from nextion import EventType
+
+from klipmi.model.printer import PrinterState
+from klipmi.model.state import KlipmiState
+
+# Seconds between idle checks
+IDLE_POLL = 5.0
+
+# Seconds the display stays dimmed before it is put to sleep
+SLEEP_DELAY = 30.0
+
+FULL_BRIGHTNESS = 100
+
+# Print states that keep the display awake
+ACTIVE_STATES = ["printing", "paused"]
+
+# All the display needs to know while asleep is when a print starts
+SLEEP_OBJECTS = {"print_stats": ["state"]}
+
+# Events that count as user activity, the display reports its own sleep too.
+# Names as in nextion 1.x, which the pinned fork is built on.
+TOUCH_EVENTS = [
+    EventType.TOUCH,
+    EventType.TOUCH_COORDINATE,
+    EventType.TOUCH_IN_SLEEP,
+    EventType.AUTO_WAKE,
+]
+
+
+class IdleManager:
+    """
+    Dims and then sleeps the display after a while without touches, as long
+    as nothing is printing.
+
+    While asleep no status is rendered and the Moonraker subscription shrinks
+    to the print state, so Klippy stops streaming temperatures nobody looks
+    at. A touch or a print starting wakes the display and resubscribes to
+    everything, the subscribe response redraws the current page.
+    """
+
+    def __init__(self, state: KlipmiState, timeout: float, brightness: int):
+        self.state: KlipmiState = state
+        self.timeout: float = timeout
+        self.brightness: int = brightness
+        self.lastTouch: float = time.monotonic()
+        self.dimmed: bool = False
+        self.sleeping: bool = False
+        self.lock: asyncio.Lock = asyncio.Lock()
+        self.printState: int = state.printer.status.slot("print_stats", "state")
+
+    def isPrinting(self) -> bool:
+        return self.state.printer.status.getStr(self.printState) in ACTIVE_STATES
+
+    def touched(self, type: EventType) -> bool:
+        """Records a touch, True if it only woke the display"""
+        if type not in TOUCH_EVENTS:
+            return False
+        self.lastTouch = time.monotonic()
+        if not self.dimmed:
+            return False
+        asyncio.create_task(self.wake())
+        return True
+
+    def onStatus(self):
+        if self.dimmed and self.isPrinting():
+            asyncio.create_task(self.wake())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(IDLE_POLL)
+            if self.isPrinting() or self.state.status != PrinterState.READY:
+                self.lastTouch = time.monotonic()
+                continue
+            idle = time.monotonic() - self.lastTouch
+            try:
+                if not self.dimmed and idle >= self.timeout:
+                    await self.dim()
+                elif not self.sleeping and idle >= self.timeout + SLEEP_DELAY:
+                    await self.sleep()
+            except Exception as e:
+                logging.warning("Idle transition failed: %s" % repr(e))
+
+    async def dim(self):
+        async with self.lock:
+            self.dimmed = True
+            await self.state.display.set("dim", self.brightness)
+
+    async def sleep(self):
+        async with self.lock:
+            if not self.dimmed:
+                return
+            logging.info("Idle, putting the display to sleep")
+            self.sleeping = True
+            # Let a touch wake the display by itself
+            await self.state.display.command("thup=1")
+            await self.state.display.sleep()
+            await self.state.printer.subscribe(SLEEP_OBJECTS)
+
+    async def wake(self):
+        async with self.lock:
+            if not self.dimmed:
+                return
+            self.lastTouch = time.monotonic()
+            self.dimmed = False
+            if self.sleeping:
+                logging.info("Waking the display")
+                await self.state.display.wakeup()
+            await self.state.display.set("dim", FULL_BRIGHTNESS)
+            if self.sleeping:
+                self.sleeping = False
+                # Rendering resumes with the full status from this resync
+                await self.state.printer.subscribe(self.state.printer.objects)
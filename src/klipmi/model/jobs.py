@@ -0,0 +1,187 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import os
+import sqlite3
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, List
+
+JOBS_FILE = "history.sqlite"
+
+# Jobs requested per server.history.list call
+SYNC_BATCH = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL,
+    print_duration REAL,
+    total_duration REAL,
+    filament_used REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_start_time ON jobs (start_time);
+"""
+
+COLUMNS = [
+    "job_id",
+    "filename",
+    "status",
+    "start_time",
+    "end_time",
+    "print_duration",
+    "total_duration",
+    "filament_used",
+]
+
+
+class Job:
+    def __init__(self, row: tuple):
+        (
+            self.job_id,
+            self.filename,
+            self.status,
+            self.start_time,
+            self.end_time,
+            self.print_duration,
+            self.total_duration,
+            self.filament_used,
+        ) = row
+
+
+class JobHistory:
+    """
+    Local SQLite copy of Moonraker's job history.
+
+    sync() only requests jobs started after the newest one stored, and
+    refreshes the jobs stored while still in progress one by one so they get
+    their final state. notify_history_changed keeps the copy current in
+    between. Pages read
+    from the database, never from Moonraker. All database access runs on a
+    single worker thread.
+    """
+
+    def __init__(self, directory: str):
+        self.path: str = os.path.join(os.path.expanduser(directory), JOBS_FILE)
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="klipmi-history"
+        )
+        self.connection: sqlite3.Connection | None = None
+        self.lock: asyncio.Lock = asyncio.Lock()
+        # Incremented whenever jobs were stored
+        self.version: int = 0
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.executescript(SCHEMA)
+        return self.connection
+
+    async def __run(self, function: Callable, *args) -> Any:
+        return await asyncio.get_event_loop().run_in_executor(
+            self.executor, function, *args
+        )
+
+    def __since(self) -> float:
+        # Moonraker returns the jobs started strictly after this
+        connection = self.__connect()
+        return connection.execute("SELECT MAX(start_time) FROM jobs").fetchone()[0] or 0
+
+    def __pending(self) -> List[str]:
+        rows = self.__connect().execute(
+            "SELECT job_id FROM jobs WHERE status = 'in_progress'"
+        )
+        return [row[0] for row in rows]
+
+    def __delete(self, job_id: str):
+        connection = self.__connect()
+        with connection:
+            connection.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def __store(self, jobs: List[dict]):
+        connection = self.__connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO jobs VALUES (%s)"
+                % ", ".join("?" * len(COLUMNS)),
+                [tuple(job.get(column) for column in COLUMNS) for job in jobs],
+            )
+
+    def __page(self, number: int, size: int) -> List[Job]:
+        rows = self.__connect().execute(
+            "SELECT %s FROM jobs ORDER BY start_time DESC LIMIT ? OFFSET ?"
+            % ", ".join(COLUMNS),
+            (size, number * size),
+        )
+        return [Job(row) for row in rows]
+
+    def __count(self) -> int:
+        return self.__connect().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    async def store(self, jobs: List[dict]):
+        if jobs:
+            await self.__run(self.__store, jobs)
+            self.version += 1
+
+    async def sync(self, call: Callable[..., Coroutine[Any, Any, Any]]) -> int:
+        """Fetches the jobs missing locally, returns how many were stored"""
+        async with self.lock:
+            since = await self.__run(self.__since)
+            stored = 0
+            while True:
+                response = await call(
+                    "server.history.list",
+                    since=since,
+                    order="asc",
+                    limit=SYNC_BATCH,
+                    start=stored,
+                )
+                if "error" in response:
+                    raise RuntimeError(response["error"])
+                jobs = response.get("jobs", [])
+                await self.store(jobs)
+                stored += len(jobs)
+                if len(jobs) < SYNC_BATCH:
+                    break
+
+            # Jobs that were still running when stored, the listing only
+            # covers newer ones
+            for job_id in await self.__run(self.__pending):
+                response = await call("server.history.get_job", job_id=job_id)
+                error = response.get("error")
+                if error is not None:
+                    if isinstance(error, dict) and error.get("code") == 404:
+                        # Deleted from Moonraker's history meanwhile
+                        await self.__run(self.__delete, job_id)
+                        self.version += 1
+                        continue
+                    raise RuntimeError(error)
+                await self.store([response["job"]])
+                stored += 1
+            return stored
+
+    async def page(self, number: int, size: int) -> List[Job]:
+        return await self.__run(self.__page, number, size)
+
+    async def count(self) -> int:
+        return await self.__run(self.__count)
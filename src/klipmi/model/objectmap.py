@@ -0,0 +1,194 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from typing import Dict, List, Tuple
+
+Point = Tuple[float, float]
+
+# RGB565 colors
+BLACK = 0
+WHITE = 65535
+YELLOW = 65504
+GRAY = 33840
+
+# Outline points closer than this many pixels to the simplified outline are
+# dropped
+TOLERANCE = 1.5
+
+# Objects without a polygon are drawn as a square of this size around the
+# center
+MARKER = 6
+
+
+def decimate(points: List[Point], tolerance: float = TOLERANCE) -> List[Point]:
+    """Ramer-Douglas-Peucker simplification of a polyline"""
+    if len(points) < 3:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = points[first], points[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = (dx * dx + dy * dy) ** 0.5
+        farthest, distance = -1, tolerance
+        for i in range(first + 1, last):
+            x, y = points[i]
+            if length > 0:
+                d = abs(dy * x - dx * y + x2 * y1 - y2 * x1) / length
+            else:
+                d = ((x - x1) ** 2 + (y - y1) ** 2) ** 0.5
+            if d > distance:
+                farthest, distance = i, d
+        if farthest >= 0:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def contains(polygon: List[Point], x: float, y: float) -> bool:
+    """Even-odd rule point in polygon test"""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        xi, yi = polygon[i]
+        xj, yj = polygon[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class MapObject:
+    def __init__(self, name: str, outline: List[Point]):
+        self.name: str = name
+        self.outline: List[Point] = outline
+        xs = [x for x, _ in outline]
+        ys = [y for _, y in outline]
+        self.box: Tuple[float, float, float, float] = (
+            min(xs),
+            min(ys),
+            max(xs),
+            max(ys),
+        )
+
+
+class ObjectMap:
+    """
+    Screen geometry of the exclude_object objects.
+
+    Outlines are projected from bed to map coordinates and simplified once
+    per object set. A grid of cells lists the objects whose bounding box
+    overlaps each cell, a touch only tests the few objects of its cell.
+    """
+
+    def __init__(
+        self,
+        x: int,
+        y: int,
+        width: int,
+        height: int,
+        bedMin: Point,
+        bedMax: Point,
+        cell: int = 20,
+    ):
+        self.x: int = x
+        self.y: int = y
+        self.width: int = width
+        self.height: int = height
+        self.bedMin: Point = bedMin
+        self.bedMax: Point = bedMax
+        self.cell: int = cell
+        self.objects: List[MapObject] = []
+        self.grid: Dict[Tuple[int, int], List[MapObject]] = {}
+
+    def project(self, point: List[float]) -> Point:
+        # The back of the bed is at the top of the map
+        scaleX = self.width / (self.bedMax[0] - self.bedMin[0])
+        scaleY = self.height / (self.bedMax[1] - self.bedMin[1])
+        return (
+            self.x + (point[0] - self.bedMin[0]) * scaleX,
+            self.y + self.height - (point[1] - self.bedMin[1]) * scaleY,
+        )
+
+    def build(self, objects: List[dict]):
+        self.objects = []
+        self.grid = {}
+        for obj in objects:
+            polygon = obj.get("polygon") or []
+            if len(polygon) >= 3:
+                outline = decimate([self.project(point) for point in polygon])
+            elif obj.get("center"):
+                cx, cy = self.project(obj["center"])
+                outline = [
+                    (cx - MARKER, cy - MARKER),
+                    (cx + MARKER, cy - MARKER),
+                    (cx + MARKER, cy + MARKER),
+                    (cx - MARKER, cy + MARKER),
+                ]
+            else:
+                continue
+            mapObject = MapObject(obj["name"], outline)
+            self.objects.append(mapObject)
+
+            left, top, right, bottom = mapObject.box
+            for column in range(int(left) // self.cell, int(right) // self.cell + 1):
+                for row in range(int(top) // self.cell, int(bottom) // self.cell + 1):
+                    self.grid.setdefault((column, row), []).append(mapObject)
+
+    def hit(self, x: int, y: int) -> str | None:
+        """Name of the object at a touch position"""
+        candidates = self.grid.get((x // self.cell, y // self.cell), [])
+        for obj in candidates:
+            if contains(obj.outline, x, y):
+                return obj.name
+        # Small objects are hard to hit, accept a touch on their box
+        for obj in candidates:
+            left, top, right, bottom = obj.box
+            if left <= x <= right and top <= y <= bottom:
+                return obj.name
+        return None
+
+    def commands(self, excluded: List[str], current: str | None) -> List[str]:
+        """Draw commands for the whole map"""
+        commands = [
+            "fill %d,%d,%d,%d,%d" % (self.x, self.y, self.width, self.height, BLACK)
+        ]
+        for obj in self.objects:
+            if obj.name in excluded:
+                color = GRAY
+            elif obj.name == current:
+                color = YELLOW
+            else:
+                color = WHITE
+            outline = obj.outline
+            for (x1, y1), (x2, y2) in zip(outline, outline[1:] + outline[:1]):
+                commands.append(
+                    "line %d,%d,%d,%d,%d"
+                    % (round(x1), round(y1), round(x2), round(y2), color)
+                )
+            if obj.name == current:
+                left, top, right, bottom = obj.box
+                cx, cy = (left + right) / 2, (top + bottom) / 2
+                commands.append(
+                    "fill %d,%d,%d,%d,%d" % (round(cx) - 2, round(cy) - 2, 5, 5, YELLOW)
+                )
+        return commands
@@ -16,25 +16,31 @@ You should have received a copy of the GNU General Public License along with
 klipmi. If not, see <https://www.gnu.org/licenses/>. 
 """
 
-import requests
+import aiohttp
 import io
+import logging
+import random
 
 from enum import StrEnum
-from PIL import Image
-from moonraker_api import MoonrakerClient, MoonrakerListener
+from moonraker_api import MoonrakerListener
 from moonraker_api.websockets.websocketclient import (
-    WEBSOCKET_STATE_CONNECTING,
     WEBSOCKET_STATE_CONNECTED,
-    WEBSOCKET_STATE_STOPPING,
     WEBSOCKET_STATE_STOPPED,
     WEBSOCKET_CONNECTION_TIMEOUT,
 )
 from nextion.client import asyncio
-from typing import Callable, Coroutine, Dict, List, Literal
+from typing import Any, Callable, Coroutine, Dict, List, Literal, Tuple
 from urllib.request import pathname2url
 
+from klipmi.model.commands import CommandQueue
 from klipmi.model.config import MoonrakerConfig
-from klipmi.utils import updateNestedDict
+from klipmi.model.console import Console
+from klipmi.model.files import GCODES, FileIndex, MetadataCache
+from klipmi.model.history import HISTORY_INTERVAL, TemperatureHistory
+from klipmi.model.jobs import JobHistory
+from klipmi.model.rpc import RESET_TIMEOUT, CircuitState, RpcClient
+from klipmi.model.status import StatusStore
+from klipmi.model.transport import Transport, createTransport
 
 
 class PrinterState(StrEnum):
@@ -43,15 +49,43 @@ class PrinterState(StrEnum):
     STOPPED = "stopped"
     MOONRAKER_ERR = "moonraker error"
     KLIPPER_ERR = "klipper error"
+    DEGRADED = "degraded"
 
 
 class Notifications(StrEnum):
     KLIPPY_READY = "notify_klippy_ready"
     KLIPPY_SHUTDOWN = "notify_klippy_shutdown"
-    KLIPPY_DISCONNECTED = "notify_klippy_shutdown"
+    KLIPPY_DISCONNECTED = "notify_klippy_disconnected"
     STATUS_UPDATE = "notify_status_update"
     GCODE_RESPONSE = "notify_gcode_response"
     FILES_CHANGED = "notify_filelist_changed"
+    HISTORY_CHANGED = "notify_history_changed"
+
+
+class ConnectionPhase(StrEnum):
+    DISCONNECTED = "disconnected"
+    CONNECTING = "connecting"
+    BACKOFF = "waiting to reconnect"
+    SYNCING = "syncing"
+    SYNCED = "synced"
+
+
+# Reconnect delay in seconds, doubled after every failed attempt
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+# Seconds an optimistic value waits for confirmation before it is rolled back
+PENDING_TIMEOUT = 5.0
+
+# Files added to the search index per loop iteration
+SEARCH_CHUNK = 200
+
+
+class PendingValue:
+    def __init__(self, value: Any, previous: Any, timer: asyncio.TimerHandle):
+        self.value = value
+        self.previous = previous
+        self.timer = timer
 
 
 class Printer(MoonrakerListener):
@@ -61,24 +95,60 @@ class Printer(MoonrakerListener):
         stateCallback: Callable,
         printerCallback: Callable,
         filesCallback: Callable,
+        gcodeCallback: Callable,
         objects: Dict[str, List[str]],
+        session: Callable[[], aiohttp.ClientSession],
+        cacheDir: str = "~/.cache/klipmi",
     ):
         self.stateCallback: Callable = stateCallback
         self.printerCallback: Callable = printerCallback
         self.filesCallback: Callable = filesCallback
+        self.gcodeCallback: Callable = gcodeCallback
         self.options: MoonrakerConfig = options
         self.objects = objects
+        # The objects currently subscribed to, fewer than `objects` while idle
+        self.subscription: Dict[str, List[str]] = objects
         self.running: bool = False
-        self.status: dict = {}
-        self.files: dict = {}
-        self.client: MoonrakerClient = MoonrakerClient(
-            self, options.host, options.port, options.api_key
+        self.status: StatusStore = StatusStore(objects)
+        self.history: TemperatureHistory = TemperatureHistory(self.status)
+        self.files: FileIndex = FileIndex()
+        self.metadata: MetadataCache = MetadataCache(self.__fetchMetadata)
+        self.console: Console = Console()
+        self.jobs: JobHistory = JobHistory(cacheDir)
+        self.pending: Dict[Tuple[str, str], PendingValue] = {}
+        self.session: Callable[[], aiohttp.ClientSession] = session
+        self.headers: Dict[str, str] = (
+            {"X-Api-Key": options.api_key} if options.api_key else {}
+        )
+        self.client: Transport = createTransport(
+            options.transport, self, options, self.getSession
+        )
+        self.rpc: RpcClient = RpcClient(
+            self.client.call_method,
+            self.__onDegraded,
+            options.rpc_timeout,
+            options.max_in_flight,
         )
+        self.commands: CommandQueue = CommandQueue(
+            self.rpc.call_method, lambda: self.rpc.circuit != CircuitState.OPEN
+        )
+        self.lastState: PrinterState = PrinterState.NOT_READY
+        self.phase: ConnectionPhase = ConnectionPhase.DISCONNECTED
+        self.generation: int = 0
+        # Generation and reload flag of a resync waiting for the breaker
+        self.deferred: Tuple[int, bool] | None = None
+        self.reconnectTask: asyncio.Task | None = None
+        self.historyTask: asyncio.Task | None = None
 
     async def connect(self) -> bool | None:
         self.running = True
         self.state = PrinterState.NOT_READY
-        return await self.client.connect()
+        if self.historyTask is None or self.historyTask.done():
+            self.historyTask = asyncio.create_task(self.__sampleHistory())
+        if await self.__tryConnect():
+            return True
+        self.__scheduleReconnect()
+        return False
 
     async def disconnect(self) -> None:
         self.running = False
@@ -86,73 +156,281 @@ class Printer(MoonrakerListener):
         await self.client.disconnect()
 
     async def state_changed(self, state: str | Literal[120]):
-        tasks: List[Coroutine] = []
-        printerStatus = PrinterState.NOT_READY
-        if state == WEBSOCKET_STATE_CONNECTING:
-            pass
-        elif state == WEBSOCKET_STATE_CONNECTED:
-            tasks.append(self.__subscribe())
-            tasks.append(self.__updateKlippyStatus())
-        elif state == WEBSOCKET_STATE_STOPPING:
-            pass
+        if state == WEBSOCKET_STATE_CONNECTED:
+            self.rpc.reset()
+            await self.__resync()
         elif state == WEBSOCKET_STATE_STOPPED:
-            printerStatus = PrinterState.STOPPED
+            # Invalidate a resync that may still be waiting for its response
+            self.generation += 1
+            self.__setPhase(ConnectionPhase.DISCONNECTED)
+            self.__scheduleReconnect()
+            await self.__updateState(PrinterState.STOPPED)
         elif state == WEBSOCKET_CONNECTION_TIMEOUT:
-            printerStatus = PrinterState.MOONRAKER_ERR
-
-        tasks.append(self.__updateState(printerStatus))
-        asyncio.gather(*tasks)
+            await self.__updateState(PrinterState.MOONRAKER_ERR)
 
     async def on_notification(self, method: str, data: list):
         tasks: List[Coroutine] = []
         if method == Notifications.KLIPPY_READY:
-            tasks.append(self.__updatePrinterStatus())
-            tasks.append(self.__subscribe())
-            tasks.append(self.__updateKlippyStatus())
-            tasks.append(self.__updateState(PrinterState.READY))
+            tasks.append(self.__resync())
         elif method == Notifications.KLIPPY_SHUTDOWN:
             tasks.append(self.__updateState(PrinterState.KLIPPER_ERR))
         elif method == Notifications.KLIPPY_DISCONNECTED:
             tasks.append(self.__updateState(PrinterState.KLIPPER_ERR))
         elif method == Notifications.STATUS_UPDATE:
-            updateNestedDict(self.status, data[0])
-            tasks.append(self.printerCallback(self.status))
+            self.onStatusUpdate(data[0])
         elif method == Notifications.FILES_CHANGED:
-            self.files = data[0]
-            tasks.append(self.filesCallback(self.files))
+            change = data[0]
+            for item in [change.get("item", {}), change.get("source_item", {})]:
+                if item.get("root") == GCODES:
+                    self.metadata.invalidate(item.get("path", ""))
+            if self.files.apply(change):
+                tasks.append(self.filesCallback(self.files))
+            else:
+                tasks.append(self.__loadFiles())
+        elif method == Notifications.HISTORY_CHANGED:
+            tasks.append(self.jobs.store([data[0]["job"]]))
+        elif method == Notifications.GCODE_RESPONSE:
+            for response in data:
+                self.console.append(response)
+            tasks.append(self.gcodeCallback(self.console))
         asyncio.gather(*tasks)
 
+    def onStatusUpdate(self, update: dict):
+        """Fast path for notify_status_update, called directly by transports"""
+        self.status.update(update)
+        self.__resolvePending(update)
+        asyncio.create_task(self.printerCallback(self.status))
+
     async def on_exception(self, exception: type | BaseException) -> None:
-        """TODO"""
+        # The websocket run loop ends in WEBSOCKET_STATE_STOPPED after every
+        # exception, reconnecting is handled there
+        logging.warning("Moonraker connection error: %s" % repr(exception))
+
+    def __setPhase(self, phase: ConnectionPhase):
+        if phase != self.phase:
+            logging.info("Moonraker connection: %s" % phase)
+            self.phase = phase
+
+    async def __tryConnect(self) -> bool:
+        self.__setPhase(ConnectionPhase.CONNECTING)
+        try:
+            return await self.client.connect()
+        except Exception as e:
+            logging.warning("Connecting to Moonraker failed: %s" % repr(e))
+            return False
+
+    def __scheduleReconnect(self):
+        if not self.running:
+            return
+        if self.reconnectTask is not None and not self.reconnectTask.done():
+            return
+        self.reconnectTask = asyncio.create_task(self.__reconnect())
+
+    async def __reconnect(self):
+        attempt = 0
+        while self.running and not self.client.is_connected:
+            # Exponential backoff with jitter, so several clients restarted at
+            # once do not hit Moonraker in lockstep
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt)
+            delay *= random.uniform(0.5, 1.0)
+            self.__setPhase(ConnectionPhase.BACKOFF)
+            logging.info("Reconnecting to Moonraker in %.1fs" % delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+            if await self.__tryConnect():
+                return
+
+    async def subscribe(self, objects: Dict[str, List[str]]):
+        """
+        Replaces the subscription, e.g. to shrink it while the display is
+        asleep. Notifications keep files and jobs current meanwhile, so only
+        the status and the temperature history are resynced.
+        """
+        self.subscription = objects
+        await self.__resync(reload=False)
 
-    async def __subscribe(self):
-        await self.client.call_method("printer.objects.subscribe", objects=self.objects)
+    async def __resync(self, reload: bool = True):
+        """
+        Subscribes to the printer objects and uses the subscribe response as
+        the status snapshot, one round trip instead of separate server.info,
+        query and subscribe calls. The last known status stays in place until
+        the snapshot arrives.
+        """
+        self.generation += 1
+        generation = self.generation
+        self.deferred = None
+        self.__setPhase(ConnectionPhase.SYNCING)
+        try:
+            response = await self.rpc.call_method(
+                "printer.objects.subscribe", objects=self.subscription
+            )
+        except Exception as e:
+            response = {"error": repr(e)}
+
+        if generation != self.generation:
+            # A newer resync or a disconnect superseded this one
+            return
+
+        if "status" not in response:
+            if self.rpc.circuit != CircuitState.CLOSED:
+                # Moonraker is not answering, Klippy may be ready all along
+                self.__deferResync(reload)
+                return
+            # Klippy is not ready, find out why
+            await self.__updateKlippyStatus()
+            return
+
+        self.status.update(response["status"])
+        self.__resolvePending(response["status"])
+        self.__setPhase(ConnectionPhase.SYNCED)
+        asyncio.create_task(self.__seedHistory())
+        if reload:
+            # Changes may have been missed while disconnected
+            asyncio.create_task(self.__loadFiles())
+            asyncio.create_task(self.syncJobs())
+        if reload or self.state != PrinterState.READY:
+            await self.__updateState(PrinterState.READY)
+        await self.printerCallback(self.status)
+
+    def __deferResync(self, reload: bool):
+        """
+        Retries the resync once the breaker lets a probe through, the retry
+        is that probe. The breaker closing earlier retries it right away.
+        """
+        logging.info("Moonraker unavailable, retrying the resync later")
+        self.deferred = (self.generation, reload)
+        asyncio.get_event_loop().call_later(RESET_TIMEOUT, self.__retryResync)
+
+    def __retryResync(self):
+        # Only if nothing else resynced or disconnected in the meantime
+        if self.deferred is not None and self.deferred[0] == self.generation:
+            asyncio.create_task(self.__resync(self.deferred[1]))
 
     async def __updateKlippyStatus(self):
-        status = await self.client.get_klipper_status()
-        if status == "ready":
-            await self.__updatePrinterStatus()
-            await self.stateCallback(PrinterState.READY)
-        elif status == "shutdown" or status == "disconnected":
-            await self.stateCallback(PrinterState.KLIPPER_ERR)
+        try:
+            status = (await self.rpc.call_method("server.info"))["klippy_state"]
+        except Exception as e:
+            logging.warning("Klippy state unavailable: %s" % repr(e))
+            return
 
-    async def __updatePrinterStatus(self):
-        self.status = (
-            await self.client.call_method("printer.objects.query", objects=self.objects)
-        )["status"]
+        if status == "ready":
+            # Became ready after the subscribe failed
+            asyncio.get_event_loop().call_later(
+                BACKOFF_BASE, lambda: asyncio.create_task(self.__resync())
+            )
+        elif status in ["shutdown", "error", "disconnected"]:
+            await self.__updateState(PrinterState.KLIPPER_ERR)
+        else:
+            # Klippy is starting up, notify_klippy_ready triggers the resync
+            await self.__updateState(PrinterState.NOT_READY)
+
+    async def __seedHistory(self):
+        # Fills the history recorded by Moonraker, including any time klipmi
+        # was not running or disconnected
+        try:
+            store = await self.rpc.call_method(
+                "server.temperature_store", include_monitors=False
+            )
+        except Exception as e:
+            logging.warning("Temperature store unavailable: %s" % repr(e))
+            return
+        if "error" not in store:
+            self.history.seed(store)
+
+    async def __loadFiles(self):
+        try:
+            files = await self.rpc.call_method("server.files.list", root=GCODES)
+        except Exception as e:
+            logging.warning("File list unavailable: %s" % repr(e))
+            return
+        if "error" in files:
+            return
+        self.metadata.clear()
+        self.files.load(files)
+        await self.filesCallback(self.files)
+        # Build the search index without holding up the loop for long
+        while not self.files.search.build(SEARCH_CHUNK):
+            await asyncio.sleep(0)
+
+    async def syncJobs(self):
+        try:
+            synced = await self.jobs.sync(self.rpc.call_method)
+        except Exception as e:
+            logging.warning("Job history unavailable: %s" % repr(e))
+            return
+        if synced:
+            logging.info("Synced %d jobs from the job history" % synced)
+
+    async def __sampleHistory(self):
+        while self.running:
+            await asyncio.sleep(HISTORY_INTERVAL)
+            if self.phase == ConnectionPhase.SYNCED:
+                self.history.sample()
+
+    def setOptimistic(self, obj: str, field: str, value: Any):
+        """
+        Applies a value to the local status before Moonraker reports it, so the
+        UI reflects the change immediately. The value stays pending until a
+        status update confirms or overrides it, or is rolled back on timeout.
+        """
+        if obj not in self.status:
+            return
+
+        key = (obj, field)
+        slot = self.status.slot(obj, field)
+        previous = self.status.getValue(slot)
+        if key in self.pending:
+            self.pending[key].timer.cancel()
+            previous = self.pending[key].previous
+
+        timer = asyncio.get_event_loop().call_later(
+            PENDING_TIMEOUT, self.__rollback, key
+        )
+        self.pending[key] = PendingValue(value, previous, timer)
+        self.status.set(slot, value)
+        asyncio.create_task(self.printerCallback(self.status))
+
+    def isPending(self, obj: str, field: str) -> bool:
+        return (obj, field) in self.pending
+
+    def __resolvePending(self, update: dict):
+        for key in list(self.pending):
+            obj, field = key
+            if field in update.get(obj, {}):
+                self.pending.pop(key).timer.cancel()
+
+    def __rollback(self, key: Tuple[str, str]):
+        pending = self.pending.pop(key, None)
+        if pending is None:
+            return
+        obj, field = key
+        logging.warning("No confirmation for %s.%s, rolling back" % (obj, field))
+        self.status.set(self.status.slot(obj, field), pending.previous)
+        asyncio.create_task(self.printerCallback(self.status))
 
     async def __updateState(self, state: PrinterState):
         self.state = state
         await self.stateCallback(state)
 
+    async def __onDegraded(self, degraded: bool):
+        if degraded:
+            # Commands waiting now would only be sent long after the touch
+            self.commands.fail("Moonraker unavailable")
+            self.lastState = self.state
+            await self.__updateState(PrinterState.DEGRADED)
+        else:
+            if self.state == PrinterState.DEGRADED:
+                await self.__updateState(self.lastState)
+            self.__retryResync()
+
     async def getMetadata(self, filename):
-        metadata = await self.client.call_method(
-            "server.files.metadata", filename=filename
-        )
-        return metadata
+        return await self.metadata.get(filename)
+
+    async def __fetchMetadata(self, filename: str) -> dict:
+        return await self.rpc.call_method("server.files.metadata", filename=filename)
 
     async def getThumbnail(self, size: int, filename: str):
-        thumbnailsList = await self.client.call_method(
+        thumbnailsList = await self.rpc.call_method(
             "server.files.thumbnails", filename=filename
         )
 
@@ -169,16 +447,27 @@ class Printer(MoonrakerListener):
         if "http" not in host:
             host = "http://%s" % host
 
-        img = requests.get(
+        # Pillow is only needed once the first thumbnail is shown
+        from PIL import Image
+
+        async with self.getSession().get(
             "%s/server/files/gcodes/%s" % (host, pathname2url(path)),
-            timeout=5,
-        )
-        return Image.open(io.BytesIO(img.content))
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=5),
+        ) as response:
+            content = await response.read()
+        return Image.open(io.BytesIO(content))
+
+    def getSession(self) -> aiohttp.ClientSession:
+        """
+        HTTP session for requests outside the websocket, e.g. thumbnails. It
+        may be shared with other printers, requests to Moonraker pass the API
+        key in `headers` themselves.
+        """
+        return self.session()
 
     def runGcode(self, gcode: str):
-        asyncio.create_task(
-            self.client.call_method("printer.gcode.script", script=gcode)
-        )
+        return self.commands.submit("printer.gcode.script", script=gcode)
 
     def run_macro(self, macro_name: str, **params):
         """
@@ -200,38 +489,37 @@ class Printer(MoonrakerListener):
         # String representation of parameters
         params_str = " ".join([f"{k}={v}" for k, v in params.items()])
         macro_cmd = f"{macro_name} {params_str}".strip()
-        self.runGcode(macro_cmd)
+        return self.runGcode(macro_cmd)
 
 
     def emergencyStop(self):
-        asyncio.create_task(self.client.call_method("printer.emergency_stop"))
+        asyncio.create_task(self.commands.bypass("printer.emergency_stop"))
 
     def restart(self):
-        asyncio.create_task(self.client.call_method("printer.restart"))
+        return self.commands.submit("printer.restart")
 
     def firmwareRestart(self):
-        asyncio.create_task(self.client.call_method("printer.firmware_restart"))
+        return self.commands.submit("printer.firmware_restart")
 
     def startPrint(self, filename: str):
-        asyncio.create_task(
-            self.client.call_method("printer.print.start", filename=filename)
-        )
+        return self.commands.submit("printer.print.start", filename=filename)
 
     def pausePrint(self):
-        asyncio.create_task(self.client.call_method("printer.print.pause"))
+        return self.commands.submit("printer.print.pause")
 
     def resumePrint(self):
-        asyncio.create_task(self.client.call_method("printer.print.resume"))
+        return self.commands.submit("printer.print.resume")
 
     def cancelPrint(self):
-        asyncio.create_task(self.client.call_method("printer.print.cancel"))
+        return self.commands.submit("printer.print.cancel")
 
     def togglePin(self, pin: str):
 
         """Toggle a pin between 0 and 1"""
-        pin_status = self.status.get(f"output_pin {pin}", {"value": 0})
-        new_value = 1 - pin_status["value"]  # Toggle between 0 and 1
-        
+        pin_value = self.status.lookup(f"output_pin {pin}", "value", 0)
+        new_value = 1 - pin_value  # Toggle between 0 and 1
+        self.setOptimistic(f"output_pin {pin}", "value", new_value)
+
         # Send gcode to set new value
         self.run_macro("SET_PIN", PIN=pin, VALUE=new_value)
 
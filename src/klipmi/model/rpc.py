@@ -0,0 +1,148 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import logging
+import time
+
+from enum import StrEnum
+from moonraker_api.websockets.websocketclient import ClientNotConnectedError
+from typing import Any, Callable, Dict
+
+# Per-method deadlines in seconds. G-code scripts only return once Klipper
+# has executed them, which may take minutes (homing, heating), so they get a
+# long deadline of their own.
+GCODE_TIMEOUT = 600.0
+TIMEOUTS: Dict[str, float] = {
+    "printer.gcode.script": GCODE_TIMEOUT,
+    "printer.emergency_stop": 5,
+    "printer.print.start": 30,
+    "server.files.thumbnails": 10,
+    "server.files.metadata": 10,
+}
+
+# Methods that bypass the in-flight limit and the circuit breaker, they keep
+# their deadline
+URGENT = ["printer.emergency_stop"]
+
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 15.0
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RpcClient:
+    """
+    Wraps MoonrakerClient.call_method with a deadline per method, a cap on
+    requests in flight and a circuit breaker.
+
+    After FAILURE_THRESHOLD consecutive timeouts or errors the circuit opens
+    and calls fail immediately instead of queueing up behind an unresponsive
+    Moonraker. After RESET_TIMEOUT a single probe call is let through; if it
+    succeeds the circuit closes again. Only calls with at most the default
+    deadline may probe, a long G-code call would keep the circuit half open
+    for minutes. Failures are also counted per method. `stateCallback` is
+    invoked with True when the circuit opens and False when it closes.
+    """
+
+    def __init__(
+        self,
+        call: Callable,
+        stateCallback: Callable,
+        timeout: float,
+        maxInFlight: int,
+    ):
+        self.call: Callable = call
+        self.stateCallback: Callable = stateCallback
+        self.timeout: float = timeout
+        self.slots: asyncio.Semaphore = asyncio.Semaphore(maxInFlight)
+        self.circuit: CircuitState = CircuitState.CLOSED
+        self.failures: int = 0
+        self.openedAt: float = 0.0
+        self.failuresByMethod: Dict[str, int] = {}
+
+    def reset(self):
+        self.failures = 0
+        if self.circuit != CircuitState.CLOSED:
+            self.__setCircuit(CircuitState.CLOSED)
+
+    async def call_method(self, method: str, **params) -> Any:
+        timeout = TIMEOUTS.get(method, self.timeout)
+        if method in URGENT:
+            return await asyncio.wait_for(self.call(method, **params), timeout)
+
+        if self.circuit == CircuitState.OPEN:
+            if (
+                time.monotonic() - self.openedAt < RESET_TIMEOUT
+                or timeout > self.timeout
+            ):
+                raise CircuitOpenError("Moonraker unavailable, %s not sent" % method)
+            self.__setCircuit(CircuitState.HALF_OPEN)
+        elif self.circuit == CircuitState.HALF_OPEN:
+            raise CircuitOpenError("Moonraker unavailable, %s not sent" % method)
+
+        try:
+            result = await asyncio.wait_for(self.__send(method, params), timeout)
+        except ClientNotConnectedError:
+            # Disconnects are handled by the reconnect logic, not the breaker,
+            # but a probe that could not be sent must not leave it half open
+            if self.circuit == CircuitState.HALF_OPEN:
+                self.openedAt = time.monotonic()
+                self.__setCircuit(CircuitState.OPEN)
+            raise
+        except Exception as e:
+            self.__onFailure(method, e)
+            raise
+        self.__onSuccess()
+        return result
+
+    async def __send(self, method: str, params: dict) -> Any:
+        async with self.slots:
+            return await self.call(method, **params)
+
+    def __onSuccess(self):
+        self.failures = 0
+        if self.circuit != CircuitState.CLOSED:
+            self.__setCircuit(CircuitState.CLOSED)
+
+    def __onFailure(self, method: str, error: Exception):
+        self.failures += 1
+        self.failuresByMethod[method] = self.failuresByMethod.get(method, 0) + 1
+        logging.warning(
+            "RPC %s failed (%d in a row): %s" % (method, self.failures, repr(error))
+        )
+        if self.circuit == CircuitState.HALF_OPEN or self.failures >= FAILURE_THRESHOLD:
+            self.openedAt = time.monotonic()
+            if self.circuit != CircuitState.OPEN:
+                self.__setCircuit(CircuitState.OPEN)
+
+    def __setCircuit(self, circuit: CircuitState):
+        logging.info("Moonraker circuit %s" % circuit)
+        wasOpen = self.circuit != CircuitState.CLOSED
+        self.circuit = circuit
+        isOpen = circuit != CircuitState.CLOSED
+        if wasOpen != isOpen:
+            asyncio.create_task(self.stateCallback(isOpen))
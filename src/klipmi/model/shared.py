@@ -0,0 +1,63 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import aiohttp
+import contextvars
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from klipmi.utils.thumbnail import ThumbnailCache
+
+# Image encoding is mostly pure Python, more threads would only contend for
+# the GIL. Two keep one printer's long encode from stalling all the others.
+ENCODER_THREADS = 2
+
+# Thumbnail cache entries per printer
+THUMBNAILS = 8
+
+# Name of the printer whose code is running, for tagging logs and metrics
+PRINTER: contextvars.ContextVar[str] = contextvars.ContextVar("printer", default="")
+
+
+class PrinterTag(logging.Filter):
+    """Adds the current printer name to log records as %(printer)s"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.printer = PRINTER.get()
+        return True
+
+
+class SharedResources:
+    """
+    Resources shared by all the printer/display pairs of one process: the
+    HTTP session, the image encoder threads and the thumbnail cache.
+    """
+
+    def __init__(self, printers: int = 1):
+        self.session: aiohttp.ClientSession | None = None
+        self.encoder: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=ENCODER_THREADS, thread_name_prefix="klipmi-encoder"
+        )
+        self.thumbnails: ThumbnailCache = ThumbnailCache(THUMBNAILS * printers)
+
+    def getSession(self) -> aiohttp.ClientSession:
+        # No default headers, every Moonraker has its own API key
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        return self.session
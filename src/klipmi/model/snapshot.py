@@ -0,0 +1,103 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+
+from klipmi.model.state import KlipmiState
+from klipmi.utils.thumbnail import ThumbnailCache
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILE = "snapshot.json"
+
+
+class Snapshot:
+    """
+    Last known printer status and the encoded thumbnail of the current file,
+    persisted so the display can show them right after a restart while
+    Moonraker and Klippy are still coming up.
+    """
+
+    def __init__(self, directory: str, interval: float):
+        self.path: str = os.path.join(os.path.expanduser(directory), SNAPSHOT_FILE)
+        self.interval: float = interval
+        self.written: str = ""
+
+    def load(self, thumbnails: ThumbnailCache) -> dict | None:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning("Ignoring unreadable snapshot %s: %s" % (self.path, e))
+            return None
+
+        if data.get("version") != SNAPSHOT_VERSION:
+            return None
+        for key, encoded in data.get("thumbnails", []):
+            thumbnails.put(tuple(key), encoded)
+        logging.info(
+            "Loaded snapshot from %s"
+            % time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(data["saved"]))
+        )
+        return data["status"]
+
+    def serialize(self, status: dict, thumbnails: ThumbnailCache) -> dict:
+        filename = status.get("print_stats", {}).get("filename", "")
+        return {
+            "version": SNAPSHOT_VERSION,
+            "status": status,
+            "thumbnails": [
+                [key, encoded]
+                for key, encoded in thumbnails.items()
+                if filename != "" and key[0] == filename
+            ],
+        }
+
+    def write(self, contents: str):
+        # Write to a temporary file and rename, a power loss never leaves a
+        # truncated snapshot behind
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write(contents)
+        os.replace(temporary, self.path)
+
+    async def save(self, status: dict, thumbnails: ThumbnailCache):
+        # Serialize on the loop, the thumbnail cache keeps changing underneath
+        data = self.serialize(status, thumbnails)
+        serialized = json.dumps(data)
+        if serialized == self.written:
+            return
+        contents = json.dumps({**data, "saved": time.time()})
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, self.write, contents)
+            self.written = serialized
+        except Exception as e:
+            logging.warning("Writing snapshot failed: %s" % e)
+
+    async def run(self, state: KlipmiState):
+        """Periodically saves the live printer status while it is fresh"""
+        while True:
+            await asyncio.sleep(self.interval)
+            if not state.stale and state.printer.status:
+                await self.save(state.printer.status.toDict(), state.thumbnails)
@@ -17,16 +17,25 @@ klipmi. If not, see <https://www.gnu.org/licenses/>.
 """
 
 from asyncio import AbstractEventLoop
-from nextion import TJC
+from concurrent.futures import Executor
 
 from klipmi.model.config import Config
+from klipmi.model.display import Display
+from klipmi.model.displaygroup import DisplayGroup
 from klipmi.model.printer import Printer, PrinterState
+from klipmi.utils.thumbnail import ThumbnailCache, ThumbnailPolicy
 
 
 class KlipmiState:
     def __init__(self):
         self.options: Config
-        self.display: TJC
+        self.display: Display | DisplayGroup
         self.printer: Printer
         self.status: PrinterState = PrinterState.NOT_READY
+        # Printer status comes from a snapshot, not from Moonraker
+        self.stale: bool = False
         self.loop: AbstractEventLoop
+        self.thumbnails: ThumbnailCache = ThumbnailCache()
+        self.thumbnailPolicy: ThumbnailPolicy
+        # Runs image encoding off the loop, None for the loop's default executor
+        self.encoder: Executor | None = None
@@ -0,0 +1,136 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from array import array
+from typing import Any, Dict, List, Tuple
+
+
+class StatusStore:
+    """
+    Flat store of the printer status.
+
+    Every (object, field) pair is interned once into a slot, an index into
+    the value list. Pages resolve the slots they need up front and then read
+    values with plain list indexing instead of nested string-keyed lookups.
+    Each slot carries the store version at which it last changed, so readers
+    can tell whether a value moved since they last looked.
+
+    Nested dict access (status["extruder"]["temperature"], status.get(...))
+    still works for code off the hot path and builds small dicts on demand.
+    """
+
+    def __init__(self, objects: Dict[str, List[str]] | None = None):
+        self.index: Dict[str, Dict[str, int]] = {}
+        self.names: List[Tuple[str, str]] = []
+        self.values: List[Any] = []
+        self.versions: array = array("Q")
+        self.version: int = 0
+        for obj, fields in (objects or {}).items():
+            for field in fields:
+                self.slot(obj, field)
+
+    def slot(self, obj: str, field: str) -> int:
+        fields = self.index.setdefault(obj, {})
+        slot = fields.get(field)
+        if slot is None:
+            slot = fields[field] = len(self.names)
+            self.names.append((obj, field))
+            self.values.append(None)
+            self.versions.append(0)
+        return slot
+
+    def has(self, obj: str, field: str | None = None) -> bool:
+        fields = self.index.get(obj)
+        if fields is None:
+            return False
+        return field is None or field in fields
+
+    def update(self, delta: dict):
+        """Merges a status update as sent by printer.objects.subscribe/query"""
+        self.version += 1
+        for obj, fields in delta.items():
+            slots = self.index.get(obj)
+            for field, value in fields.items():
+                slot = slots.get(field) if slots is not None else None
+                if slot is None:
+                    slot = self.slot(obj, field)
+                    slots = self.index[obj]
+                if self.values[slot] != value:
+                    self.values[slot] = value
+                    self.versions[slot] = self.version
+
+    def set(self, slot: int, value: Any):
+        self.version += 1
+        self.values[slot] = value
+        self.versions[slot] = self.version
+
+    def getValue(self, slot: int, default: Any = None) -> Any:
+        value = self.values[slot]
+        return default if value is None else value
+
+    def getFloat(self, slot: int, default: float = 0.0) -> float:
+        value = self.values[slot]
+        return default if value is None else float(value)
+
+    def getInt(self, slot: int, default: int = 0) -> int:
+        value = self.values[slot]
+        return default if value is None else int(value)
+
+    def getStr(self, slot: int, default: str = "") -> str:
+        value = self.values[slot]
+        return default if value is None else str(value)
+
+    def lookup(self, obj: str, field: str, default: Any = None) -> Any:
+        """Reads a value by name without interning a new slot"""
+        slot = self.index.get(obj, {}).get(field)
+        return default if slot is None else self.getValue(slot, default)
+
+    def changedSince(self, slot: int, version: int) -> bool:
+        return self.versions[slot] > version
+
+    def changes(self, version: int) -> dict:
+        """The fields changed since `version`, nested like a status update"""
+        status: dict = {}
+        for slot, changed in enumerate(self.versions):
+            if changed > version:
+                obj, field = self.names[slot]
+                status.setdefault(obj, {})[field] = self.values[slot]
+        return status
+
+    def toDict(self) -> dict:
+        status: dict = {}
+        for (obj, field), value in zip(self.names, self.values):
+            if value is not None:
+                status.setdefault(obj, {})[field] = value
+        return status
+
+    def __getitem__(self, obj: str) -> dict:
+        return {
+            field: self.values[slot]
+            for field, slot in self.index[obj].items()
+            if self.values[slot] is not None
+        }
+
+    def __contains__(self, obj: str) -> bool:
+        return obj in self.index
+
+    def __bool__(self) -> bool:
+        return self.version > 0
+
+    def get(self, obj: str, default: Any = None) -> Any:
+        return self[obj] if obj in self.index else default
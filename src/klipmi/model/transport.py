@@ -0,0 +1,227 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import aiohttp
+import asyncio
+import itertools
+import json
+import logging
+
+from abc import ABC, abstractmethod
+from moonraker_api import MoonrakerClient
+from moonraker_api.websockets.websocketclient import (
+    ClientNotConnectedError,
+    WEBSOCKET_STATE_CONNECTED,
+    WEBSOCKET_STATE_STOPPED,
+)
+from typing import Any, Callable, Dict
+
+from klipmi.model.rpc import TIMEOUTS
+
+# Use the fastest JSON library available, they are optional
+try:
+    import orjson
+
+    loads = orjson.loads
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+except ImportError:
+    try:
+        import msgspec
+
+        loads = msgspec.json.Decoder().decode
+        _encoder = msgspec.json.Encoder()
+
+        def dumps(obj) -> str:
+            return _encoder.encode(obj).decode()
+
+    except ImportError:
+        loads = json.loads
+        dumps = json.dumps
+
+TRANSPORT_WEBSOCKET = "websocket"
+TRANSPORT_MOONRAKER_API = "moonraker-api"
+
+STATUS_UPDATE = "notify_status_update"
+
+# Notifications klipmi never uses, dropped before they are decoded. Moonraker
+# sends process stats to every client once per second.
+IGNORED = ["notify_proc_stat_update"]
+
+
+class Transport(ABC):
+    """Connection to Moonraker, as used by Printer"""
+
+    @property
+    @abstractmethod
+    def is_connected(self) -> bool:
+        pass
+
+    @abstractmethod
+    async def connect(self) -> bool:
+        pass
+
+    @abstractmethod
+    async def disconnect(self) -> None:
+        pass
+
+    @abstractmethod
+    async def call_method(self, method: str, **kwargs: Any) -> Any:
+        pass
+
+
+class MoonrakerApiTransport(MoonrakerClient, Transport):
+    """The moonraker-api client, every message goes through its dispatch"""
+
+
+class WebsocketTransport(Transport):
+    """
+    Lean JSON-RPC websocket client for Moonraker.
+
+    Messages are decoded with orjson or msgspec when installed. Status
+    updates, by far the most frequent message, are handed straight to the
+    listener's onStatusUpdate() from the receive loop without creating a
+    task, and notifications in IGNORED are dropped undecoded.
+
+    Results and errors are returned the same way moonraker-api does, errors
+    as {"error": ...}, and connection states use its WEBSOCKET_STATE_*
+    values, so both transports are interchangeable. Every call has a
+    deadline, the same per-method one RpcClient uses or `callTimeout`, so
+    callers that bypass RpcClient cannot wait forever either.
+    """
+
+    def __init__(
+        self,
+        listener,
+        host: str,
+        port: int,
+        api_key: str,
+        session: Callable[[], aiohttp.ClientSession],
+        timeout: float = 30.0,
+        callTimeout: float = 10.0,
+    ):
+        self.listener = listener
+        if "://" not in host:
+            host = "ws://%s" % host
+        self.url: str = "%s:%d/websocket" % (host.replace("http", "ws", 1), port)
+        self.headers: Dict[str, str] = {"X-Api-Key": api_key} if api_key else {}
+        self.session: Callable[[], aiohttp.ClientSession] = session
+        self.timeout: float = timeout
+        self.callTimeout: float = callTimeout
+        self.websocket: aiohttp.ClientWebSocketResponse | None = None
+        self.receiver: asyncio.Task | None = None
+        self.requests: Dict[int, asyncio.Future] = {}
+        self.ids = itertools.count(1)
+
+    @property
+    def is_connected(self) -> bool:
+        return self.websocket is not None and not self.websocket.closed
+
+    async def connect(self) -> bool:
+        self.websocket = await self.session().ws_connect(
+            self.url, headers=self.headers, heartbeat=self.timeout / 3
+        )
+        self.receiver = asyncio.create_task(self.__receive(self.websocket))
+        asyncio.create_task(self.listener.state_changed(WEBSOCKET_STATE_CONNECTED))
+        return True
+
+    async def disconnect(self) -> None:
+        if self.websocket is not None:
+            await self.websocket.close()
+        if self.receiver is not None:
+            await self.receiver
+
+    async def call_method(self, method: str, **kwargs: Any) -> Any:
+        if not self.is_connected:
+            raise ClientNotConnectedError()
+
+        id = next(self.ids)
+        request = {"jsonrpc": "2.0", "method": method, "id": id}
+        if kwargs:
+            request["params"] = kwargs
+        future = asyncio.get_event_loop().create_future()
+        self.requests[id] = future
+        try:
+            await self.websocket.send_str(dumps(request))
+            return await asyncio.wait_for(
+                future, TIMEOUTS.get(method, self.callTimeout)
+            )
+        finally:
+            self.requests.pop(id, None)
+
+    async def __receive(self, websocket: aiohttp.ClientWebSocketResponse):
+        try:
+            async for message in websocket:
+                if message.type == aiohttp.WSMsgType.TEXT:
+                    self.__dispatch(message.data)
+                elif message.type == aiohttp.WSMsgType.ERROR:
+                    raise websocket.exception()
+        except Exception as e:
+            await self.listener.on_exception(e)
+        finally:
+            for future in self.requests.values():
+                if not future.done():
+                    future.set_exception(ClientNotConnectedError())
+            self.requests.clear()
+            if self.websocket is websocket:
+                self.websocket = None
+            asyncio.create_task(self.listener.state_changed(WEBSOCKET_STATE_STOPPED))
+
+    def __dispatch(self, data: str):
+        head = data[:64]
+        for method in IGNORED:
+            if method in head:
+                return
+
+        message = loads(data)
+        method = message.get("method")
+        if method == STATUS_UPDATE:
+            self.listener.onStatusUpdate(message["params"][0])
+        elif method is not None:
+            asyncio.create_task(
+                self.listener.on_notification(method, message.get("params"))
+            )
+        else:
+            future = self.requests.get(message.get("id"))
+            if future is None or future.done():
+                return
+            if "error" in message:
+                future.set_result({"error": message["error"]})
+            else:
+                future.set_result(message.get("result"))
+
+
+def createTransport(
+    name: str, listener, options, session: Callable[[], aiohttp.ClientSession]
+) -> Transport:
+    if name == TRANSPORT_MOONRAKER_API:
+        return MoonrakerApiTransport(
+            listener, options.host, options.port, options.api_key
+        )
+    if name != TRANSPORT_WEBSOCKET:
+        logging.warning("Unknown transport %s, using %s" % (name, TRANSPORT_WEBSOCKET))
+    return WebsocketTransport(
+        listener,
+        options.host,
+        options.port,
+        options.api_key,
+        session,
+        callTimeout=options.rpc_timeout,
+    )
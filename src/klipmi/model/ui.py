@@ -17,6 +17,7 @@ klipmi. If not, see <https://www.gnu.org/licenses/>.
 """
 
 import asyncio
+import time
 from abc import ABC, abstractmethod
 from collections.abc import Callable
 from typing import Dict, List, Type
@@ -24,9 +25,11 @@ from typing import Dict, List, Type
 from nextion import EventType
 from nextion.client import logging
 
+from klipmi.model.console import Console
+from klipmi.model.files import FileIndex
 from klipmi.model.state import KlipmiState
+from klipmi.model.status import StatusStore
 from klipmi.utils import classproperty
-from klipmi.utils.libcolpic import parseThumbnail
 
 
 class BasePage(ABC):
@@ -47,38 +50,83 @@ class BasePage(ABC):
     async def init(self):
         pass
 
+    def onLeave(self):
+        """Called when another page replaces this one, stops its background work"""
+        pass
+
     async def onDisplayEvent(self, type: EventType, data):
         pass
 
-    async def onPrinterStatusUpdate(self, data: dict):
+    async def onPrinterStatusUpdate(self, data: StatusStore):
+        pass
+
+    async def onFileListUpdate(self, data: FileIndex):
         pass
 
-    async def onFileListUpdate(self, data: dict):
+    async def onGcodeResponse(self, console: Console):
         pass
 
     def changePage(self, page):
         self.changePageCallback(page)
 
+    async def encodeThumbnail(self, size: int, bgColor: str, filename: str) -> str:
+        policy = self.state.thumbnailPolicy
+        scaled, colors = policy.choose(size)
+        key = (filename, scaled, colors, bgColor)
+
+        thumbnail = self.state.thumbnails.get(key)
+        if thumbnail is None:
+            try:
+                image = await self.state.printer.getThumbnail(size, filename)
+            except Exception:
+                # Offline, e.g. showing a snapshot, settle for what is cached
+                thumbnail = self.state.thumbnails.find(filename, bgColor)
+                if thumbnail is None:
+                    raise
+                return thumbnail
+            # Imported here to keep Pillow out of startup
+            from klipmi.utils.libcolpic import parseThumbnail
+
+            thumbnail = await asyncio.get_event_loop().run_in_executor(
+                self.state.encoder,
+                parseThumbnail,
+                image,
+                scaled,
+                scaled,
+                bgColor,
+                colors,
+            )
+            policy.recordEncoding(scaled, colors, len(thumbnail))
+            self.state.thumbnails.put(key, thumbnail)
+            logging.debug(
+                "Encoded thumbnail %s at %dpx, %d colors: %d bytes"
+                % (filename, scaled, colors, len(thumbnail))
+            )
+        return thumbnail
+
     async def uploadThumbnail(
         self, element: str, size: int, bgColor: str, filename: str
     ):
-        thumbnail = parseThumbnail(
-            await self.state.printer.getThumbnail(size, filename),
-            size,
-            size,
-            bgColor,
+        thumbnail = await self.encodeThumbnail(size, bgColor, filename)
+        started = time.monotonic()
+        await self.uploadPicture(element, thumbnail)
+        self.state.thumbnailPolicy.recordUpload(
+            len(thumbnail), time.monotonic() - started
         )
+
+    async def uploadPicture(self, element: str, encoded: str):
+        """Writes a ColPic encoded image to a picture component of this page"""
         await self.state.display.command("p[%d].%s.close()" % (self.id, element))
 
         parts = []
         start = 0
         end = 1024
-        while start + 1024 < len(thumbnail):
-            parts.append(thumbnail[start:end])
+        while start + 1024 < len(encoded):
+            parts.append(encoded[start:end])
             start = start + 1024
             end = end + 1024
 
-        parts.append(thumbnail[start : len(thumbnail)])
+        parts.append(encoded[start : len(encoded)])
         for part in parts:
             await self.state.display.command(
                 'p[%d].%s.write("%s")' % (self.id, element, str(part))
@@ -87,6 +135,7 @@ class BasePage(ABC):
 
 class BaseUi(ABC):
     currentPage: BasePage | None = None
+    degraded: bool = False
 
     @classproperty
     @abstractmethod
@@ -116,27 +165,43 @@ class BaseUi(ABC):
     def onKlipperError(self):
         pass
 
+    def onSnapshot(self, status: StatusStore):
+        """Shows the last known status from a snapshot while still offline"""
+        self.onReady()
+        asyncio.create_task(self.onPrinterStatusUpdate(status))
+
+    def onDegraded(self, degraded: bool):
+        """Moonraker stopped (True) or resumed (False) answering requests"""
+        self.degraded = degraded
+
     async def onDisplayEvent(self, type: EventType, data):
         logging.info("onDisplayEvent: EventType: %s, data: %s" % (type.name, str(data)))
         if self.currentPage is not None:
             await self.currentPage.onDisplayEvent(type, data)
 
-    async def onPrinterStatusUpdate(self, data: dict):
+    async def onPrinterStatusUpdate(self, data: StatusStore):
         if self.currentPage is not None:
             await self.currentPage.onPrinterStatusUpdate(data)
 
-    async def onFileListUpdate(self, data: dict):
+    async def onFileListUpdate(self, data: FileIndex):
         if self.currentPage is not None:
             await self.currentPage.onFileListUpdate(data)
 
+    async def onGcodeResponse(self, console: Console):
+        if self.currentPage is not None:
+            await self.currentPage.onGcodeResponse(console)
+
     async def __executePageChange(self):
         if self.currentPage is not None:
             await self.state.display.wakeup()
             await self.state.display.command(
                 "page %d" % self.currentPage.id, self.state.options.timeout
             )
+            self.state.display.clearShadow()
             await self.currentPage.init()
 
     def changePage(self, page: Type[BasePage]):
+        if self.currentPage is not None:
+            self.currentPage.onLeave()
         self.currentPage = page(self.state, self.changePage)
         asyncio.create_task(self.__executePageChange())
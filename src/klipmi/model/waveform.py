@@ -0,0 +1,82 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import logging
+
+from array import array
+from typing import List, Tuple
+
+from klipmi.model.display import Display
+from klipmi.model.history import SensorHistory
+
+TEMPERATURES = "temperatures"
+TARGETS = "targets"
+
+
+class Waveform:
+    """
+    TJC waveform component plotting sensor histories, one channel each.
+
+    The first render clears the channels and sends the whole visible window,
+    later renders only append the samples recorded since, both as a single
+    addt transfer per channel.
+    """
+
+    def __init__(
+        self,
+        display: Display,
+        component: int,
+        width: int,
+        height: int,
+        maxValue: float,
+        channels: List[Tuple[SensorHistory, str]],
+    ):
+        self.display: Display = display
+        self.component: int = component
+        self.width: int = width
+        self.factor: float = height / maxValue
+        self.top: int = min(height, 255)
+        self.channels: List[Tuple[SensorHistory, str]] = channels
+        # (seeded, total) of each channel's history when it was last sent
+        self.sent: List[Tuple[int, int] | None] = [None] * len(channels)
+
+    def scale(self, values: array) -> bytes:
+        factor = self.factor
+        top = self.top
+        return bytes([min(top, max(0, int(value * factor))) for value in values])
+
+    async def render(self):
+        for channel, (history, series) in enumerate(self.channels):
+            sent = self.sent[channel]
+            new = history.total - sent[1] if sent is not None else 0
+            if sent is not None and sent[0] == history.seeded and new == 0:
+                continue
+
+            try:
+                if sent is None or sent[0] != history.seeded or new > self.width:
+                    await self.display.command("cle %d,%d" % (self.component, channel))
+                    new = self.width
+                values = history.window(getattr(history, series), new)
+                delivered = await self.display.addt(
+                    self.component, channel, self.scale(values)
+                )
+            except Exception as e:
+                logging.warning("Waveform update failed: %s" % repr(e))
+                delivered = False
+            # Redraw the whole window next time if this update did not arrive
+            self.sent[channel] = (history.seeded, history.total) if delivered else None
@@ -0,0 +1,161 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import aiohttp
+import asyncio
+import io
+import time
+
+from concurrent.futures import Executor
+
+from klipmi.model.printer import Printer
+
+# Size of the grayscale thumbnail frames are compared by
+SIGNATURE_SIZE = (16, 12)
+
+# Palette size of encoded frames, smaller than for thumbnails to keep uploads
+# short
+WEBCAM_COLORS = 256
+
+
+class FrameStats:
+    """Frames shown, skipped as unchanged and bytes sent since `started`"""
+
+    def __init__(self):
+        self.started: float = time.monotonic()
+        self.frames: int = 0
+        self.skipped: int = 0
+        self.bytes: int = 0
+
+    def record(self, length: int):
+        self.frames += 1
+        self.bytes += length
+
+    def fps(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+    def bytesPerFrame(self) -> float:
+        return self.bytes / self.frames if self.frames else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "fps": self.fps(),
+            "bytes_per_frame": self.bytesPerFrame(),
+            "frames": self.frames,
+            "skipped": self.skipped,
+        }
+
+    def __str__(self) -> str:
+        return "%.1f fps %d B/frame" % (self.fps(), self.bytesPerFrame())
+
+
+def signature(image) -> bytes:
+    return image.convert("L").resize(SIGNATURE_SIZE).tobytes()
+
+
+def difference(a: bytes, b: bytes) -> float:
+    """Mean absolute difference of two signatures, from 0 to 1"""
+    return sum(abs(x - y) for x, y in zip(a, b)) / (len(a) * 255)
+
+
+class Webcam:
+    """
+    Pulls JPEG snapshots from a webcam and encodes them for a picture
+    component. Frames that barely differ from the last one shown, compared
+    on a small grayscale thumbnail, are skipped before encoding, so a still
+    scene costs neither encoding time nor serial bandwidth.
+    """
+
+    def __init__(
+        self,
+        printer: Printer,
+        url: str,
+        size: int,
+        threshold: float,
+        bgColor: str = "000000",
+        executor: Executor | None = None,
+    ):
+        self.printer: Printer = printer
+        self.url: str = url
+        self.size: int = size
+        self.threshold: float = threshold
+        self.bgColor: str = bgColor
+        self.executor: Executor | None = executor
+        self.shown: bytes | None = None
+        self.stats: FrameStats = FrameStats()
+
+    async def resolveUrl(self) -> str:
+        if self.url:
+            return self.url
+        webcams = (await self.printer.rpc.call_method("server.webcams.list"))["webcams"]
+        if not webcams:
+            raise RuntimeError("No webcam configured in Moonraker")
+        url = webcams[0]["snapshot_url"]
+        if "://" not in url:
+            # Relative to the web server in front of Moonraker
+            host = self.printer.options.host
+            if "http" not in host:
+                host = "http://%s" % host
+            url = host + url
+        self.url = url
+        return url
+
+    async def fetch(self) -> bytes:
+        async with self.printer.getSession().get(
+            await self.resolveUrl(), timeout=aiohttp.ClientTimeout(total=5)
+        ) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    def process(self, content: bytes) -> str | None:
+        """Decodes and encodes a frame, None if it is too similar to the last"""
+        from PIL import Image
+        from klipmi.utils.libcolpic import parseThumbnail
+
+        image = Image.open(io.BytesIO(content))
+        # Let the JPEG decoder downscale, much cheaper than a full decode
+        image.draft("RGB", (self.size, self.size))
+        current = signature(image)
+        if self.shown is not None and difference(self.shown, current) < self.threshold:
+            return None
+        self.shown = current
+
+        # The encoder only takes square images, letterbox the frame
+        image.thumbnail((self.size, self.size))
+        frame = Image.new("RGBA", (self.size, self.size), "#" + self.bgColor)
+        frame.paste(
+            image.convert("RGBA"),
+            ((self.size - image.width) // 2, (self.size - image.height) // 2),
+        )
+        return parseThumbnail(frame, self.size, self.size, self.bgColor, WEBCAM_COLORS)
+
+    async def next(self) -> str | None:
+        """The next frame to show, or None if the scene did not change"""
+        content = await self.fetch()
+        encoded = await asyncio.get_event_loop().run_in_executor(
+            self.executor, self.process, content
+        )
+        if encoded is None:
+            self.stats.skipped += 1
+        return encoded
+
+    def reset(self):
+        """Forgets the frame shown, e.g. after the picture was cleared"""
+        self.shown = None
+        self.stats = FrameStats()
@@ -16,8 +16,15 @@ You should have received a copy of the GNU General Public License along with
 klipmi. If not, see <https://www.gnu.org/licenses/>. 
 """
 
+import importlib
+
 from typing import Dict, Type
 from klipmi.model.ui import BaseUi
-from klipmi.ui.openq1 import OpenQ1UI
 
-implementations: Dict[str, Type[BaseUi]] = {"openq1": OpenQ1UI}
+# Module and class of every UI, only the one selected in the config is imported
+implementations: Dict[str, str] = {"openq1": "klipmi.ui.openq1:OpenQ1UI"}
+
+
+def load(name: str) -> Type[BaseUi]:
+    module, _, cls = implementations[name].partition(":")
+    return getattr(importlib.import_module(module), cls)
@@ -16,6 +16,8 @@ You should have received a copy of the GNU General Public License along with
 klipmi. If not, see <https://www.gnu.org/licenses/>. 
 """
 
+import asyncio
+
 from typing import Dict, List
 from klipmi.model.ui import BaseUi
 from klipmi.utils.utils import classproperty
@@ -49,6 +51,13 @@ class OpenQ1UI(BaseUi):
             "heater_fan hotend_fan": ["speed"],             # Hotend fan
             "heater_fan chamber_fan": ["speed"],            # Chamber fan
 
+            # Bed mesh heatmap
+            "bed_mesh": ["profile_name", "probed_matrix", "mesh_matrix"],
+
+            # Exclude object map
+            "exclude_object": ["objects", "excluded_objects", "current_object"],
+            "toolhead": ["axis_minimum", "axis_maximum"],
+
 
 
         }
@@ -66,6 +75,11 @@ class OpenQ1UI(BaseUi):
     def onMoonrakerError(self):
         pass
 
+    def onDegraded(self, degraded: bool):
+        super().onDegraded(degraded)
+        if isinstance(self.currentPage, MainPage):
+            asyncio.create_task(self.currentPage.updateTip())
+
     def onKlipperError(self):
         self.changePage(ResetPage)
         pass
@@ -21,9 +21,17 @@ klipmi. If not, see <https://www.gnu.org/licenses/>.
 
 import asyncio
 
-from PIL.Image import init
+from typing import Dict, List
+
 from nextion import EventType
 
+from klipmi.model.console import Console
+from klipmi.model.files import FileEntry, FileIndex
+from klipmi.model.objectmap import ObjectMap
+from klipmi.model.printer import PrinterState
+from klipmi.model.status import StatusStore
+from klipmi.model.waveform import TARGETS, TEMPERATURES, Waveform
+from klipmi.model.webcam import Webcam
 from klipmi.model.ui import BasePage
 from klipmi.utils import classproperty
 
@@ -47,16 +55,19 @@ class HeaterManager:
     HEATERS = {
         "extruder": {
             "name": "extruder",
+            "object": "extruder",
             "title": "Extruder",
             "max_digits": 3
         },
         "bed": {
             "name": "heater_bed", 
+            "object": "heater_bed",
             "title": "Bed",
             "max_digits": 2
         },
         "chamber": {
             "name": "chamber",
+            "object": "heater_generic chamber",
             "title": "Chamber",
             "max_digits": 2
         }
@@ -68,6 +79,9 @@ class HeaterManager:
         self.printer = printer
 
     def set_temperature(self, heater: str, temperature: int):
+        for config in self.HEATERS.values():
+            if config["name"] == heater:
+                self.printer.setOptimistic(config["object"], "target", temperature)
         self.printer.run_macro("SET_HEATER_TEMPERATURE", 
                              HEATER=heater, 
                              TARGET=temperature)
@@ -90,12 +104,51 @@ class HeaterManager:
 
 
 
+class HeaterSlots:
+    def __init__(self, status: StatusStore, obj: str):
+        self.temperature = status.slot(obj, "temperature")
+        self.target = status.slot(obj, "target")
+
+
+class StatusSlots:
+    """Status slots read by the pages, resolved once per status store"""
+
+    def __init__(self, status: StatusStore):
+        self.extruder = HeaterSlots(status, "extruder")
+        self.bed = HeaterSlots(status, "heater_bed")
+        self.chamber = HeaterSlots(status, "heater_generic chamber")
+        self.caselight = status.slot("output_pin caselight", "value")
+        self.sound = status.slot("output_pin sound", "value")
+        self.state = status.slot("print_stats", "state")
+        self.filename = status.slot("print_stats", "filename")
+        self.printDuration = status.slot("print_stats", "print_duration")
+        self.progress = status.slot("display_status", "progress")
+        self.position = status.slot("motion_report", "live_position")
+        self.partFan = status.slot("fan_generic cooling_fan", "speed")
+        self.auxiliaryFan = status.slot("fan_generic auxiliary_cooling_fan", "speed")
+        self.chamberFan = status.slot("heater_fan chamber_fan", "speed")
+        self.meshProfile = status.slot("bed_mesh", "profile_name")
+        self.probedMatrix = status.slot("bed_mesh", "probed_matrix")
+        self.meshMatrix = status.slot("bed_mesh", "mesh_matrix")
+        self.objects = status.slot("exclude_object", "objects")
+        self.excludedObjects = status.slot("exclude_object", "excluded_objects")
+        self.currentObject = status.slot("exclude_object", "current_object")
+        self.axisMinimum = status.slot("toolhead", "axis_minimum")
+        self.axisMaximum = status.slot("toolhead", "axis_maximum")
+
+
 class OpenQ1Page(BasePage):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if not hasattr(self.state, 'heater_manager'):
             self.state.heater_manager = HeaterManager(self.state.printer)
+        if not hasattr(self.state, 'slots'):
+            self.state.slots = StatusSlots(self.state.printer.status)
+        self.slots: StatusSlots = self.state.slots
+
+    def isHeating(self, data: StatusStore, heater: HeaterSlots) -> bool:
+        return data.getFloat(heater.target) > data.getFloat(heater.temperature)
 
     def handleNavBarButtons(self, component_id: int):
         if component_id == 30:
@@ -139,17 +192,22 @@ class MainPage(OpenQ1Page):
     # Thumbnail
     filename = ""
 
-    def isHeating(self, heaterData: dict) -> bool:
-        return heaterData["target"] > heaterData["temperature"]
-
     async def setHighlight(self, element: str, highlight: bool):
         await self.state.display.set(
             "%s.picc" % element, self._highlight if highlight else self._regular
         )
 
+    async def updateTip(self):
+        tip = ""
+        if self.state.status == PrinterState.DEGRADED:
+            tip = "Moonraker not responding"
+        elif self.state.stale:
+            tip = "Connecting..."
+        await self.state.display.set("tip.txt", tip)
+
     async def init(self):
         await self.state.display.set("b6.picc", 31)
-        await self.state.display.set("tip.txt", "")      # Clear display field
+        await self.updateTip()
         #Trun off logging DEBUG
         logging.getLogger().setLevel(logging.INFO)
 
@@ -184,36 +242,43 @@ class MainPage(OpenQ1Page):
                 self.state.return_page = self.__class__  # Store current page class
                 self.changePage(KeypadPage)
 
+            elif data.component_id == 24:  # temperature chart
+                self.changePage(TemperaturePage)
+
+            elif data.component_id == 25:  # camera
+                self.changePage(CameraPage)
+
             else:
                 self.handleNavBarButtons(data.component_id)
 
 
-    async def onPrinterStatusUpdate(self, data: dict):
+    async def onPrinterStatusUpdate(self, data: StatusStore):
 
         #log.info(f"Main: onPrinterStatusUpdate: {data}")
+        slots = self.slots
 
-        state = data["print_stats"]["state"]
+        state = data.getStr(slots.state)
         if state == "printing":
             self.changePage(PrintingPage)
 
 
-        await self.state.display.set("n0.val", int(data["extruder"]["temperature"]))
-        await self.setHighlight("b3", self.isHeating(data["extruder"]))
+        await self.state.display.set("n0.val", data.getInt(slots.extruder.temperature))
+        await self.setHighlight("b3", self.isHeating(data, slots.extruder))
 
-        await self.state.display.set("n1.val", int(data["heater_bed"]["temperature"]))
-        await self.setHighlight("b4", self.isHeating(data["heater_bed"]))
+        await self.state.display.set("n1.val", data.getInt(slots.bed.temperature))
+        await self.setHighlight("b4", self.isHeating(data, slots.bed))
 
         await self.state.display.set(
-            "n2.val", int(data["heater_generic chamber"]["temperature"])
+            "n2.val", data.getInt(slots.chamber.temperature)
         )
-        await self.setHighlight("b5", self.isHeating(data["heater_generic chamber"]))
+        await self.setHighlight("b5", self.isHeating(data, slots.chamber))
 
-        await self.setHighlight("b0", data["output_pin caselight"]["value"] > 0)
-        await self.setHighlight("b1", data["output_pin sound"]["value"] > 0)
+        await self.setHighlight("b0", data.getFloat(slots.caselight) > 0)
+        await self.setHighlight("b1", data.getFloat(slots.sound) > 0)
 
 
 
-        filename = data["print_stats"]["filename"]
+        filename = data.getStr(slots.filename)
         await self.state.display.set("t0.txt", filename)
 
         if filename == "":
@@ -251,6 +316,95 @@ class PrintingPage2(OpenQ1Page):
         if type == EventType.TOUCH:
             if data.component_id == 0:
                 self.changePage(PrintingPage)
+            elif data.component_id == 1:  # exclude object map
+                self.changePage(ExcludeObjectPage)
+
+
+class ExcludeObjectPage(OpenQ1Page):
+    """
+    Map of the objects being printed, touch one to cancel it. The stock
+    OpenQ1 firmware has no such page, the TFT must provide:
+    page 75 "objects"
+    0 - back
+    1 - cancel the selected object
+    t0 - object being printed
+    t1 - selected object
+    The map is drawn directly on the page background at 10,50, 300x300.
+    PrintingPage2 component 1 opens it.
+    """
+
+    @classproperty
+    def name(cls) -> str:
+        return "objects"
+
+    @classproperty
+    def id(cls) -> int:
+        return 75
+
+    _map = (10, 50, 300, 300)
+    # Bed used when the toolhead limits are unknown
+    _bed = ([0.0, 0.0], [245.0, 245.0])
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.map: ObjectMap | None = None
+        # Object list the map was built from and what was drawn last
+        self.built: list | None = None
+        self.drawn: tuple | None = None
+        self.selected: str | None = None
+
+    async def init(self):
+        # Report touch coordinates for hit testing
+        await self.state.display.command("sendxy=1")
+        await self.draw(self.state.printer.status)
+
+    def onLeave(self):
+        asyncio.create_task(self.state.display.command("sendxy=0"))
+
+    async def onDisplayEvent(self, type: EventType, data):
+        if type == EventType.TOUCH_COORDINATE:
+            if self.map is None:
+                return
+            name = self.map.hit(data.x, data.y)
+            if name is not None and name != self.selected:
+                self.selected = name
+                await self.state.display.set("t1.txt", name)
+        elif type == EventType.TOUCH:
+            if data.component_id == 0:
+                self.changePage(PrintingPage)
+            elif data.component_id == 1 and self.selected is not None:
+                self.state.printer.runGcode("EXCLUDE_OBJECT NAME=%s" % self.selected)
+                self.selected = None
+                await self.state.display.set("t1.txt", "")
+            else:
+                self.handleNavBarButtons(data.component_id)
+
+    async def onPrinterStatusUpdate(self, data: StatusStore):
+        await self.draw(data)
+
+    async def draw(self, data: StatusStore):
+        slots = self.slots
+        objects = data.getValue(slots.objects, [])
+        excluded = data.getValue(slots.excludedObjects, [])
+        current = data.getValue(slots.currentObject)
+
+        # The store keeps the same list until the object set changes, the
+        # value check covers a fresh default or an equal list sent again
+        if self.map is None or (objects is not self.built and objects != self.built):
+            low = data.getValue(slots.axisMinimum) or self._bed[0]
+            high = data.getValue(slots.axisMaximum) or self._bed[1]
+            self.map = ObjectMap(*self._map, (low[0], low[1]), (high[0], high[1]))
+            self.map.build(objects)
+            self.built = objects
+            self.drawn = None
+
+        key = (tuple(excluded), current)
+        if key == self.drawn:
+            return
+        self.drawn = key
+        await self.state.display.set("t0.txt", current or "")
+        # One pipelined batch of line and fill commands for the whole map
+        await self.state.display.batch(self.map.commands(excluded, current))
 
 
 # Printing page Main
@@ -271,9 +425,6 @@ class PrintingPage(OpenQ1Page):
     # Thumbnail
     filename = ""
 
-    def isHeating(self, heaterData: dict) -> bool:
-        return heaterData["target"] > heaterData["temperature"]
-
     async def setHighlight(self, element: str, highlight: bool):
         await self.state.display.set(
             "%s.picc" % element, self._highlight if highlight else self._regular
@@ -286,62 +437,56 @@ class PrintingPage(OpenQ1Page):
         await self.state.display.set("n6.val", 0) # Chamber fan # "heater_fan chamber_fan": ["speed"],          
 
     
-    def format_time(self, seconds: float) -> str:
+    @staticmethod
+    def format_time(seconds: float) -> str:
         """Format seconds into HH:MM format"""
         hours = int(seconds // 3600)
         minutes = int((seconds % 3600) // 60)
         return f"{hours:02d}:{minutes:02d}"
 
 
-    async def onPrinterStatusUpdate(self, data: dict):
-
-        log.info(f"Main: onPrinterStatusUpdate: {data}")
+    async def onPrinterStatusUpdate(self, data: StatusStore):
 
-        state = data["print_stats"]["state"]
+        slots = self.slots
+        state = data.getStr(slots.state)
 
         if state != "printing":
             self.changePage(MainPage)
 
         
         # Extruder
-        await self.state.display.set("n0.val", int(data["extruder"]["temperature"]))
-        await self.setHighlight("b0", self.isHeating(data["extruder"]))
-        extruder_target = int(data["extruder"]["target"])
+        await self.state.display.set("n0.val", data.getInt(slots.extruder.temperature))
+        await self.setHighlight("b0", self.isHeating(data, slots.extruder))
+        extruder_target = data.getInt(slots.extruder.target)
         await self.state.display.set("t0.txt", f"{extruder_target}")
 
 
         # Bed
-        await self.state.display.set("n1.val", int(data["heater_bed"]["temperature"]))
-        await self.setHighlight("b1", self.isHeating(data["heater_bed"]))
-        bed_target = int(data["heater_bed"]["target"])
+        await self.state.display.set("n1.val", data.getInt(slots.bed.temperature))
+        await self.setHighlight("b1", self.isHeating(data, slots.bed))
+        bed_target = data.getInt(slots.bed.target)
         await self.state.display.set("t1.txt", f"{bed_target}")
 
 
         # Chamber
-        await self.state.display.set("n2.val", int(data["heater_generic chamber"]["temperature"]))
-        await self.setHighlight("b7", self.isHeating(data["heater_generic chamber"]))
-        chamber_target = int(data["heater_generic chamber"]["target"])
+        await self.state.display.set("n2.val", data.getInt(slots.chamber.temperature))
+        await self.setHighlight("b7", self.isHeating(data, slots.chamber))
+        chamber_target = data.getInt(slots.chamber.target)
         await self.state.display.set("t5.txt", f"{chamber_target}")
 
 
         # Caselight
-        await self.setHighlight("b3", data["output_pin caselight"]["value"] < 1)
+        await self.setHighlight("b3", data.getFloat(slots.caselight) < 1)
 
 
-        # Fans handling with null checks
-        def get_fan_speed(fan_data: dict) -> int:
-            """Safely get fan speed as percentage"""
-            if not fan_data or fan_data.get("speed") is None:
-                return 0
-            return int(fan_data["speed"] * 100)
-
-        fan_speed_1 = get_fan_speed(data.get("fan_generic cooling_fan"))
+        # Fans, a fan that was not reported yet reads as 0
+        fan_speed_1 = int(data.getFloat(slots.partFan) * 100)
         await self.state.display.set("n4.val", fan_speed_1)
 
-        fan_speed_2 = get_fan_speed(data.get("fan_generic auxiliary_cooling_fan"))
+        fan_speed_2 = int(data.getFloat(slots.auxiliaryFan) * 100)
         await self.state.display.set("n5.val", fan_speed_2)
 
-        fan_speed_3 = get_fan_speed(data.get("heater_fan chamber_fan"))
+        fan_speed_3 = int(data.getFloat(slots.chamberFan) * 100)
         await self.state.display.set("n6.val", fan_speed_3)
 
         await self.setHighlight("b4", fan_speed_1 > 0)
@@ -350,7 +495,7 @@ class PrintingPage(OpenQ1Page):
 
 
         # Filename
-        filename = data["print_stats"]["filename"]
+        filename = data.getStr(slots.filename)
         await self.state.display.set("t4.txt", filename)
 
         if filename == "":
@@ -363,9 +508,8 @@ class PrintingPage(OpenQ1Page):
 
 
         # Progress tracking
-        progress = data["display_status"]["progress"] * 100
-        print_duration = data["print_stats"]["print_duration"]
-        total_duration = data["print_stats"]["total_duration"]
+        progress = data.getFloat(slots.progress) * 100
+        print_duration = data.getFloat(slots.printDuration)
         
         # Progress bar and percentage
         await self.state.display.set("j0.val", int(progress))
@@ -484,6 +628,135 @@ class KeypadPage(OpenQ1Page):
 
 
 
+class TemperaturePage(OpenQ1Page):
+    """
+    Temperature history chart. The stock OpenQ1 firmware has no such page,
+    the TFT must provide:
+    page 70 "temp_chart"
+    0 - back
+    1 - waveform s0, 400x200, channels extruder, bed, chamber, extruder target
+    MainPage component 24 opens it.
+    """
+
+    @classproperty
+    def name(cls) -> str:
+        return "temp_chart"
+
+    @classproperty
+    def id(cls) -> int:
+        return 70
+
+    # Waveform component and its size
+    _waveform = 1
+    _width = 400
+    _height = 200
+    _maxTemperature = 300
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        history = self.state.printer.history
+        self.waveform = Waveform(
+            self.state.display,
+            self._waveform,
+            self._width,
+            self._height,
+            self._maxTemperature,
+            [
+                (history["extruder"], TEMPERATURES),
+                (history["heater_bed"], TEMPERATURES),
+                (history["heater_generic chamber"], TEMPERATURES),
+                (history["extruder"], TARGETS),
+            ],
+        )
+
+    async def init(self):
+        await self.waveform.render()
+
+    async def onDisplayEvent(self, type: EventType, data):
+        if type == EventType.TOUCH:
+            if data.component_id == 0:
+                self.changePage(MainPage)
+            else:
+                self.handleNavBarButtons(data.component_id)
+
+    async def onPrinterStatusUpdate(self, data: StatusStore):
+        # Only sends the samples recorded since the last render, if any
+        await self.waveform.render()
+
+
+class CameraPage(OpenQ1Page):
+    """
+    Webcam view. The stock OpenQ1 firmware has no such page, the TFT must
+    provide:
+    page 72 "camera"
+    0 - back
+    cp0 - 200x200 picture
+    t0 - frame rate and size
+    MainPage component 25 opens it.
+    """
+
+    @classproperty
+    def name(cls) -> str:
+        return "camera"
+
+    @classproperty
+    def id(cls) -> int:
+        return 72
+
+    _size = 200
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = self.state.options.klipmi
+        if not hasattr(self.state, "webcam"):
+            self.state.webcam = Webcam(
+                self.state.printer,
+                options.webcam_url,
+                self._size,
+                options.webcam_threshold,
+                executor=self.state.encoder,
+            )
+        self.webcam: Webcam = self.state.webcam
+        self.interval: float = 1 / max(options.webcam_fps, 0.01)
+        self.task: asyncio.Task | None = None
+
+    async def init(self):
+        # The picture is empty after the page change
+        self.webcam.reset()
+        self.task = asyncio.create_task(self.stream())
+
+    def onLeave(self):
+        if self.task is not None:
+            self.task.cancel()
+        log.info(f"Camera: {self.webcam.stats.summary()}")
+
+    async def stream(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            started = loop.time()
+            try:
+                encoded = await self.webcam.next()
+                if encoded is not None:
+                    await self.uploadPicture("cp0", encoded)
+                    self.webcam.stats.record(len(encoded))
+                    await self.state.display.set("t0.txt", str(self.webcam.stats))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"Camera: frame failed: {e!r}")
+                await asyncio.sleep(max(self.interval, 5.0))
+                continue
+            # Uploads slower than the frame rate simply lower it
+            await asyncio.sleep(max(0.0, self.interval - (loop.time() - started)))
+
+    async def onDisplayEvent(self, type: EventType, data):
+        if type == EventType.TOUCH:
+            if data.component_id == 0:
+                self.changePage(MainPage)
+            else:
+                self.handleNavBarButtons(data.component_id)
+
+
 class MovePage(OpenQ1Page):
     @classproperty
     def name(cls) -> str:
@@ -500,19 +773,29 @@ class MovePage(OpenQ1Page):
             else:
                 self.handleNavBarButtons(data.component_id)
 
-    async def onPrinterStatusUpdate(self, data: dict):
-        await self.state.display.set(
-            "t0.txt", f'{data["motion_report"]["live_position"][0]:.1f}'
-        )
-        await self.state.display.set(
-            "t1.txt", f'{data["motion_report"]["live_position"][1]:.1f}'
-        )
-        await self.state.display.set(
-            "t2.txt", f'{data["motion_report"]["live_position"][2]:.1f}'
-        )
+    async def onPrinterStatusUpdate(self, data: StatusStore):
+        position = data.getValue(self.slots.position, [0.0, 0.0, 0.0])
+        await self.state.display.set("t0.txt", f"{position[0]:.1f}")
+        await self.state.display.set("t1.txt", f"{position[1]:.1f}")
+        await self.state.display.set("t2.txt", f"{position[2]:.1f}")
 
 
 class FilelistPage(OpenQ1Page):
+    """
+    File browser, newest files first, one page of rows at a time. The
+    components of the stock page are not documented, this layout is assumed:
+    t0-t4 - file names, touch areas 10-14, thumbnails cp0-cp4
+    20 - previous page
+    21 - next page
+    22 - print the selected file
+    t10 - page number
+    t11 - selected file
+    t12 - print time, filament and layer height of the selected file
+    t13 - search text, filled by the TFT's keyboard
+    23 - search for t13, the keyboard may send it on every key
+    24 - clear the search
+    """
+
     @classproperty
     def name(cls) -> str:
         return "filelist"
@@ -521,9 +804,141 @@ class FilelistPage(OpenQ1Page):
     def id(cls) -> int:
         return 4
 
+    _rows = 5
+    _columns = 32
+    _thumbnailSize = 80
+    _background = "4d4d4d"
+    _results = 200
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.number: int = 0
+        self.rows: List[FileEntry] = []
+        self.query: str = ""
+        # Search results, None while browsing the whole library
+        self.results: List[FileEntry] | None = None
+        self.selected: str | None = None
+        # File index version the rows were drawn from
+        self.drawn: int = -1
+        # File shown by each thumbnail
+        self.shown: Dict[int, str] = {}
+        self.thumbnails: asyncio.Task | None = None
+
+    async def init(self):
+        await self.render()
+
+    def onLeave(self):
+        if self.thumbnails is not None:
+            self.thumbnails.cancel()
+
     async def onDisplayEvent(self, type: EventType, data):
         if type == EventType.TOUCH:
-            self.handleNavBarButtons(data.component_id)
+            comp_id = data.component_id
+            files = self.state.printer.files
+            if 10 <= comp_id < 10 + self._rows:
+                row = comp_id - 10
+                if row < len(self.rows):
+                    self.selected = self.rows[row].path
+                    await self.state.display.set(
+                        "t11.txt", self.selected[-self._columns :]
+                    )
+                    await self.showMetadata(self.selected)
+            elif comp_id == 20 and self.number > 0:
+                self.number -= 1
+                await self.render()
+            elif comp_id == 21 and self.number + 1 < self.pages():
+                self.number += 1
+                await self.render()
+            elif comp_id == 23:
+                self.query = (await self.state.display.get("t13.txt")).strip()
+                self.number = 0
+                await self.render()
+            elif comp_id == 24:
+                self.query = ""
+                self.number = 0
+                await self.state.display.set("t13.txt", "")
+                await self.render()
+            elif comp_id == 22 and self.selected is not None:
+                if self.selected in files:
+                    self.state.printer.startPrint(self.selected)
+                    self.changePage(MainPage)
+            else:
+                self.handleNavBarButtons(comp_id)
+
+    async def onFileListUpdate(self, data: FileIndex):
+        if data.version != self.drawn:
+            await self.render()
+
+    def page(self, number: int) -> List[FileEntry]:
+        if self.results is None:
+            return self.state.printer.files.page(number, self._rows)
+        return self.results[number * self._rows : (number + 1) * self._rows]
+
+    def pages(self) -> int:
+        if self.results is None:
+            return self.state.printer.files.pages(self._rows)
+        return max(1, -(-len(self.results) // self._rows))
+
+    async def render(self):
+        files = self.state.printer.files
+        self.drawn = files.version
+        self.results = files.find(self.query, self._results) if self.query else None
+        pages = self.pages()
+        self.number = min(self.number, pages - 1)
+        self.rows = self.page(self.number)
+
+        for row in range(self._rows):
+            name = self.rows[row].path if row < len(self.rows) else ""
+            await self.state.display.set("t%d.txt" % row, name[-self._columns :])
+        await self.state.display.set("t10.txt", "%d/%d" % (self.number + 1, pages))
+
+        # Thumbnails only for the visible rows, after the names are up
+        if self.thumbnails is not None:
+            self.thumbnails.cancel()
+        self.thumbnails = asyncio.create_task(self.loadThumbnails(list(self.rows)))
+
+        # Metadata of the rows shown and of the next page, the likely next
+        # selections
+        upcoming = self.rows + self.page(self.number + 1)
+        self.state.printer.metadata.prefetch([entry.path for entry in upcoming])
+
+    async def showMetadata(self, filename: str):
+        try:
+            metadata = await self.state.printer.getMetadata(filename)
+        except Exception as e:
+            log.warning(f"Filelist: metadata of {filename} unavailable: {e!r}")
+            metadata = {}
+        details = []
+        if metadata.get("estimated_time"):
+            details.append(PrintingPage.format_time(metadata["estimated_time"]))
+        if metadata.get("filament_total"):
+            details.append("%.1fm" % (metadata["filament_total"] / 1000))
+        if metadata.get("layer_height"):
+            details.append("%.2fmm" % metadata["layer_height"])
+        await self.state.display.set("t12.txt", " ".join(details))
+
+    async def loadThumbnails(self, rows: List[FileEntry]):
+        for row in range(self._rows):
+            element = "cp%d" % row
+            if row >= len(rows):
+                self.shown.pop(row, None)
+                await self.state.display.command("vis %s,0" % element)
+                continue
+            if self.shown.get(row) == rows[row].path:
+                continue
+            self.shown.pop(row, None)
+            try:
+                await self.uploadThumbnail(
+                    element, self._thumbnailSize, self._background, rows[row].path
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # No thumbnail in the file
+                await self.state.display.command("vis %s,0" % element)
+                continue
+            self.shown[row] = rows[row].path
+            await self.state.display.command("vis %s,1" % element)
 
 
 class SettingsPage(OpenQ1Page):
@@ -539,12 +954,181 @@ class SettingsPage(OpenQ1Page):
         if type == EventType.TOUCH:
             if data.component_id == 0:
                 self.changePage(LanguagePage)
-            if data.component_id == 22:
+            elif data.component_id == 1:
+                self.changePage(ConsolePage)
+            elif data.component_id == 2:
+                self.changePage(HistoryPage)
+            elif data.component_id == 22:
                 self.changePage(CalibrationPage)
             else:
                 self.handleNavBarButtons(data.component_id)
 
 
+class ConsolePage(OpenQ1Page):
+    """
+    G-code console. The stock OpenQ1 firmware has no such page, the TFT must
+    provide:
+    page 73 "console"
+    0 - back
+    1 - scroll up
+    2 - scroll down
+    t0-t9 - lines, oldest at the top
+    SettingsPage component 1 opens it.
+    """
+
+    @classproperty
+    def name(cls) -> str:
+        return "console"
+
+    @classproperty
+    def id(cls) -> int:
+        return 73
+
+    _rows = 10
+    _columns = 40
+    # Minimum seconds between redraws, a burst of responses is drawn once
+    _interval = 0.5
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        console = self.state.printer.console
+        # Lines scrolled back from the newest one
+        self.offset: int = 0
+        self.seen: int = console.total
+        self.drawn: float = 0.0
+        self.timer: asyncio.TimerHandle | None = None
+
+    async def init(self):
+        await self.render()
+
+    def onLeave(self):
+        if self.timer is not None:
+            self.timer.cancel()
+
+    async def onDisplayEvent(self, type: EventType, data):
+        if type == EventType.TOUCH:
+            console = self.state.printer.console
+            if data.component_id == 0:
+                self.changePage(SettingsPage)
+            elif data.component_id == 1:
+                self.offset = min(
+                    self.offset + self._rows, max(0, len(console) - self._rows)
+                )
+                self.schedule()
+            elif data.component_id == 2:
+                self.offset = max(0, self.offset - self._rows)
+                self.schedule()
+            else:
+                self.handleNavBarButtons(data.component_id)
+
+    async def onGcodeResponse(self, console: Console):
+        received = console.total - self.seen
+        self.seen = console.total
+        if self.offset > 0:
+            # Keep the lines being read in view while new ones arrive
+            self.offset = min(
+                self.offset + received, max(0, len(console) - self._rows)
+            )
+        self.schedule()
+
+    def schedule(self):
+        if self.timer is not None:
+            return
+        loop = asyncio.get_event_loop()
+        delay = max(0.0, self.drawn + self._interval - loop.time())
+        self.timer = loop.call_later(
+            delay, lambda: asyncio.create_task(self.render())
+        )
+
+    async def render(self):
+        self.timer = None
+        self.drawn = asyncio.get_event_loop().time()
+        lines = self.state.printer.console.window(self._rows, self.offset)
+        # Unchanged rows are skipped by the display's shadow copy
+        for row, line in enumerate(lines):
+            await self.state.display.set(
+                "t%d.txt" % row, line[: self._columns].replace('"', "'")
+            )
+
+
+class HistoryPage(OpenQ1Page):
+    """
+    Job history, newest first, read from the local copy. The stock OpenQ1
+    firmware has no such page, the TFT must provide:
+    page 74 "history"
+    0 - back
+    20 - previous page
+    21 - next page
+    t0-t4 - file names
+    t5-t9 - status and print time
+    t10 - page number
+    SettingsPage component 2 opens it.
+    """
+
+    @classproperty
+    def name(cls) -> str:
+        return "history"
+
+    @classproperty
+    def id(cls) -> int:
+        return 74
+
+    _rows = 5
+    _columns = 32
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.number: int = 0
+        self.pages: int = 1
+
+    async def init(self):
+        jobs = self.state.printer.jobs
+        await self.render()
+        # Usually a no-op, notifications keep the copy current
+        version = jobs.version
+        await self.state.printer.syncJobs()
+        if jobs.version != version:
+            await self.render()
+
+    async def onDisplayEvent(self, type: EventType, data):
+        if type == EventType.TOUCH:
+            if data.component_id == 0:
+                self.changePage(SettingsPage)
+            elif data.component_id == 20 and self.number > 0:
+                self.number -= 1
+                await self.render()
+            elif data.component_id == 21 and self.number + 1 < self.pages:
+                self.number += 1
+                await self.render()
+            else:
+                self.handleNavBarButtons(data.component_id)
+
+    async def render(self):
+        jobs = self.state.printer.jobs
+        try:
+            self.pages = max(1, -(-(await jobs.count()) // self._rows))
+            self.number = min(self.number, self.pages - 1)
+            rows = await jobs.page(self.number, self._rows)
+        except Exception as e:
+            log.warning(f"History: reading the job history failed: {e!r}")
+            rows = []
+
+        for row in range(self._rows):
+            name = details = ""
+            if row < len(rows):
+                job = rows[row]
+                name = job.filename[-self._columns :]
+                details = "%s %s" % (
+                    job.status.replace("_", " "),
+                    PrintingPage.format_time(job.print_duration or 0),
+                )
+            await self.state.display.set("t%d.txt" % row, name)
+            await self.state.display.set("t%d.txt" % (row + self._rows), details)
+        await self.state.display.set(
+            "t10.txt", "%d/%d" % (self.number + 1, self.pages)
+        )
+
+
 class LanguagePage(OpenQ1Page):
     @classproperty
     def name(cls) -> str:
@@ -575,9 +1159,6 @@ class FilamentPage(OpenQ1Page):
     _regular = 176
     _highlight = 177
 
-    def isHeating(self, heaterData: dict) -> bool:
-        return heaterData["target"] > heaterData["temperature"]
-
     async def setHighlight(self, element: str, highlight: bool):
         await self.state.display.set(
             "%s.picc" % element, self._highlight if highlight else self._regular
@@ -590,29 +1171,28 @@ class FilamentPage(OpenQ1Page):
             else:
                 self.handleNavBarButtons(data.component_id)
 
-    async def onPrinterStatusUpdate(self, data: dict):
+    async def onPrinterStatusUpdate(self, data: StatusStore):
+        slots = self.slots
         await self.state.display.set(
-            "t0.txt", str(int(data["extruder"]["temperature"]))
+            "t0.txt", str(data.getInt(slots.extruder.temperature))
         )
-        await self.state.display.set("n0.val", int(data["extruder"]["target"]))
-        await self.setHighlight("b2", self.isHeating(data["extruder"]))
-        await self.setHighlight("b0", self.isHeating(data["extruder"]))
+        await self.state.display.set("n0.val", data.getInt(slots.extruder.target))
+        await self.setHighlight("b2", self.isHeating(data, slots.extruder))
+        await self.setHighlight("b0", self.isHeating(data, slots.extruder))
 
         await self.state.display.set(
-            "t1.txt", str(int(data["heater_bed"]["temperature"]))
+            "t1.txt", str(data.getInt(slots.bed.temperature))
         )
-        await self.state.display.set("n1.val", int(data["heater_bed"]["target"]))
-        await self.setHighlight("b3", self.isHeating(data["heater_bed"]))
-        await self.setHighlight("b1", self.isHeating(data["heater_bed"]))
+        await self.state.display.set("n1.val", data.getInt(slots.bed.target))
+        await self.setHighlight("b3", self.isHeating(data, slots.bed))
+        await self.setHighlight("b1", self.isHeating(data, slots.bed))
 
         await self.state.display.set(
-            "t2.txt", str(int(data["heater_generic chamber"]["temperature"]))
+            "t2.txt", str(data.getInt(slots.chamber.temperature))
         )
-        await self.state.display.set(
-            "n2.val", int(data["heater_generic chamber"]["target"])
-        )
-        await self.setHighlight("b12", self.isHeating(data["heater_generic chamber"]))
-        await self.setHighlight("b13", self.isHeating(data["heater_generic chamber"]))
+        await self.state.display.set("n2.val", data.getInt(slots.chamber.target))
+        await self.setHighlight("b12", self.isHeating(data, slots.chamber))
+        await self.setHighlight("b13", self.isHeating(data, slots.chamber))
 
 
 class CalibrationPage(OpenQ1Page):
@@ -628,9 +1208,110 @@ class CalibrationPage(OpenQ1Page):
         if type == EventType.TOUCH:
             if data.component_id == 23:
                 self.changePage(SettingsPage)
+            elif data.component_id == 1:  # bed mesh
+                self.changePage(BedMeshPage)
             else:
                 self.handleNavBarButtons(data.component_id)
 
+class BedMeshPage(OpenQ1Page):
+    """
+    Heatmap of the active bed mesh. The stock OpenQ1 firmware has no such
+    page, the TFT must provide:
+    page 71 "bed_mesh"
+    0 - back
+    cp0 - 160x160 picture
+    t0 - profile name
+    t1 - lowest and highest point
+    CalibrationPage component 1 opens it.
+    """
+
+    @classproperty
+    def name(cls) -> str:
+        return "bed_mesh"
+
+    @classproperty
+    def id(cls) -> int:
+        return 71
+
+    _size = 160
+    _background = "000000"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Cache key of the heatmap on the display, and the status version it
+        # was checked at
+        self.shown: tuple | None = None
+        self.version: int = -1
+
+    async def init(self):
+        await self.showMesh(self.state.printer.status)
+
+    async def onDisplayEvent(self, type: EventType, data):
+        if type == EventType.TOUCH:
+            if data.component_id == 0:
+                self.changePage(CalibrationPage)
+            else:
+                self.handleNavBarButtons(data.component_id)
+
+    async def onPrinterStatusUpdate(self, data: StatusStore):
+        await self.showMesh(data)
+
+    async def showMesh(self, data: StatusStore):
+        slots = self.slots
+        if not (
+            data.changedSince(slots.meshMatrix, self.version)
+            or data.changedSince(slots.probedMatrix, self.version)
+            or data.changedSince(slots.meshProfile, self.version)
+        ):
+            return
+        self.version = data.version
+
+        # The interpolated mesh if there is one, else the probed points
+        matrix = data.getValue(slots.meshMatrix) or data.getValue(slots.probedMatrix)
+        if not matrix or not matrix[0]:
+            self.shown = None
+            await self.state.display.set("t0.txt", "No mesh loaded")
+            await self.state.display.set("t1.txt", "")
+            await self.state.display.command("vis cp0,0")
+            return
+
+        profile = data.getStr(slots.meshProfile)
+        key = (
+            "bed_mesh",
+            profile,
+            hash(tuple(tuple(row) for row in matrix)),
+            self._background,
+        )
+        if key == self.shown:
+            return
+
+        # Imported here to keep Pillow out of startup
+        from klipmi.utils.heatmap import encodeHeatmap, matrixRange
+
+        try:
+            encoded = self.state.thumbnails.get(key)
+            if encoded is None:
+                encoded = await asyncio.get_event_loop().run_in_executor(
+                    self.state.encoder,
+                    encodeHeatmap,
+                    matrix,
+                    self._size,
+                    self._background,
+                )
+                self.state.thumbnails.put(key, encoded)
+
+            low, high = matrixRange(matrix)
+            await self.state.display.set("t0.txt", profile)
+            await self.state.display.set("t1.txt", f"{low:+.3f} / {high:+.3f} mm")
+            await self.uploadPicture("cp0", encoded)
+            await self.state.display.command("vis cp0,1")
+        except Exception:
+            # Drawn again with the next status update
+            self.version = 0
+            raise
+        self.shown = key
+
+
 '''
 0 - back
 2 - restart klipper
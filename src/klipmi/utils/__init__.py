@@ -17,10 +17,25 @@ klipmi. If not, see <https://www.gnu.org/licenses/>.
 """
 
 from .utils import updateNestedDict, classproperty
-from .libcolpic import parseThumbnail
+from .thumbnail import ThumbnailCache, ThumbnailPolicy
+from .ringbuffer import RingBuffer
+from .stats import LatencyStats
 
 __all__ = [
     "classproperty",
     "updateNestedDict",
     "parseThumbnail",
+    "ThumbnailCache",
+    "ThumbnailPolicy",
+    "RingBuffer",
+    "LatencyStats",
 ]
+
+
+def __getattr__(name):
+    # libcolpic pulls in Pillow, only load it when it is actually used
+    if name == "parseThumbnail":
+        from .libcolpic import parseThumbnail
+
+        return parseThumbnail
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
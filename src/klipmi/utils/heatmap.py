@@ -0,0 +1,77 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from typing import List, Tuple
+
+from PIL import Image
+
+from klipmi.utils.libcolpic import parseThumbnail
+
+# Color ramp from the lowest to the highest point, blue through green to red
+STOPS: List[Tuple[int, Tuple[int, int, int]]] = [
+    (0, (0, 0, 255)),
+    (128, (0, 255, 0)),
+    (255, (255, 0, 0)),
+]
+
+
+def colorRamp() -> Tuple[List[int], List[int], List[int]]:
+    """Per channel lookup tables mapping a 0-255 level to the ramp color"""
+    channels: Tuple[List[int], List[int], List[int]] = ([], [], [])
+    for (start, low), (end, high) in zip(STOPS, STOPS[1:]):
+        for level in range(start, end + (1 if end == 255 else 0)):
+            t = (level - start) / (end - start)
+            for channel in range(3):
+                channels[channel].append(
+                    round(low[channel] + (high[channel] - low[channel]) * t)
+                )
+    return channels
+
+
+RAMP = colorRamp()
+
+
+def matrixRange(matrix: List[List[float]]) -> Tuple[float, float]:
+    return min(min(row) for row in matrix), max(max(row) for row in matrix)
+
+
+def renderHeatmap(matrix: List[List[float]], size: int) -> Image.Image:
+    """
+    Color maps a bed mesh matrix into a size x size image. The matrix is
+    quantized into a grayscale image with one pixel per point, then
+    interpolation and color mapping run over whole images inside Pillow
+    instead of per pixel in Python. The scale is symmetric around zero so a
+    flat bed is green.
+    """
+    low, high = matrixRange(matrix)
+    span = max(abs(low), abs(high), 1e-6)
+    # Row 0 is the front of the bed, shown at the bottom
+    levels = bytes(
+        min(255, max(0, round((value / span + 1) * 127.5)))
+        for row in reversed(matrix)
+        for value in row
+    )
+    image = Image.frombytes("L", (len(matrix[0]), len(matrix)), levels)
+    image = image.resize((size, size), Image.BILINEAR)
+    return Image.merge(
+        "RGBA", [image.point(lut) for lut in RAMP] + [Image.new("L", (size, size), 255)]
+    )
+
+
+def encodeHeatmap(matrix: List[List[float]], size: int, bgColor: str) -> str:
+    return parseThumbnail(renderHeatmap(matrix, size), size, size, bgColor)
@@ -6,7 +6,7 @@ from array import array
 from PIL import ImageColor
 
 
-def parseThumbnail(img, width, height, default_background) -> str:
+def parseThumbnail(img, width, height, default_background, colorsmax=1024) -> str:
     img.thumbnail((width, height))
     pixels = img.load()
     result = ""
@@ -49,7 +49,7 @@ def parseThumbnail(img, width, height, default_background) -> str:
             img_size[1],
             output_data,
             img_size[0] * img_size[1] * 10,
-            1024,
+            colorsmax,
         )
 
         j = 0
@@ -0,0 +1,62 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from typing import Any, List
+
+
+class RingBuffer:
+    """
+    Fixed size single-producer single-consumer ring buffer.
+
+    The producer only moves `tail` and the consumer only moves `head`, so one
+    thread may push while another pops without taking a lock. When the buffer
+    is full new items are dropped and counted.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity: int = capacity
+        self.items: List[Any] = [None] * (capacity + 1)
+        self.head: int = 0
+        self.tail: int = 0
+        self.dropped: int = 0
+
+    def __len__(self) -> int:
+        return (self.tail - self.head) % len(self.items)
+
+    def push(self, item: Any) -> bool:
+        tail = (self.tail + 1) % len(self.items)
+        if tail == self.head:
+            self.dropped += 1
+            return False
+        self.items[self.tail] = item
+        self.tail = tail
+        return True
+
+    def pop(self) -> Any:
+        if self.head == self.tail:
+            return None
+        item = self.items[self.head]
+        self.items[self.head] = None
+        self.head = (self.head + 1) % len(self.items)
+        return item
+
+    def drain(self) -> List[Any]:
+        items = []
+        while self.head != self.tail:
+            items.append(self.pop())
+        return items
@@ -0,0 +1,128 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import time
+
+from array import array
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, List
+
+
+class LatencyStats:
+    """Rolling latency statistics over the last `window` samples, in seconds"""
+
+    def __init__(self, window: int = 256):
+        self.samples: array = array("d", [0.0] * window)
+        self.count: int = 0
+        self.max: float = 0.0
+
+    def record(self, seconds: float):
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def window(self) -> list:
+        return sorted(self.samples[: min(self.count, len(self.samples))])
+
+    def mean(self) -> float:
+        samples = self.window()
+        return sum(samples) / len(samples) if samples else 0.0
+
+    def percentile(self, p: float) -> float:
+        samples = self.window()
+        if not samples:
+            return 0.0
+        return samples[min(int(len(samples) * p), len(samples) - 1)]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean(),
+            "p95": self.percentile(0.95),
+            "max": self.max,
+        }
+
+    def __str__(self) -> str:
+        return "n=%d mean=%.1fms p95=%.1fms max=%.1fms" % (
+            self.count,
+            self.mean() * 1000,
+            self.percentile(0.95) * 1000,
+            self.max * 1000,
+        )
+
+
+class PhaseTimer:
+    """Records when named phases complete, relative to a start time"""
+
+    def __init__(self, started: float | None = None):
+        self.started: float = time.perf_counter() if started is None else started
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, phase: str):
+        self.phases.setdefault(phase, time.perf_counter() - self.started)
+
+    def __str__(self) -> str:
+        return ", ".join(
+            "%s %.2fs" % (phase, at)
+            for phase, at in sorted(self.phases.items(), key=lambda item: item[1])
+        )
+
+
+class RollingHistogram:
+    """
+    Histogram of the samples of the last `periods` periods of `period`
+    seconds. `bounds` are the inclusive upper limits of the buckets in
+    seconds, a last bucket takes everything above.
+    """
+
+    def __init__(self, bounds: List[float], period: float = 60.0, periods: int = 10):
+        self.bounds: List[float] = bounds
+        self.period: float = period
+        self.windows: Deque[List[int]] = deque(maxlen=periods)
+        self.windows.append([0] * (len(bounds) + 1))
+        self.started: float = time.monotonic()
+        # Largest sample since startup, not only within the window
+        self.max: float = 0.0
+
+    def __rotate(self):
+        elapsed = time.monotonic() - self.started
+        if elapsed < self.period:
+            return
+        periods = int(elapsed // self.period)
+        for _ in range(min(periods, self.windows.maxlen or periods)):
+            self.windows.append([0] * (len(self.bounds) + 1))
+        self.started += periods * self.period
+
+    def record(self, seconds: float):
+        self.__rotate()
+        self.windows[-1][bisect_left(self.bounds, seconds)] += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def counts(self) -> List[int]:
+        self.__rotate()
+        return [sum(column) for column in zip(*self.windows)]
+
+    def __str__(self) -> str:
+        labels = ["<=%gms" % (bound * 1000) for bound in self.bounds]
+        labels.append(">%gms" % (self.bounds[-1] * 1000))
+        return ", ".join(
+            "%s %d" % (label, count) for label, count in zip(labels, self.counts())
+        )
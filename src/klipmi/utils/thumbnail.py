@@ -0,0 +1,124 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+# Palette sizes and resolution scales tried in order of decreasing quality
+COLORS = [1024, 512, 256]
+SCALES = [1.0, 0.75, 0.5]
+
+# Bytes per chunk written with p[].write() and the command overhead around it
+CHUNK_SIZE = 1024
+CHUNK_OVERHEAD = 24
+
+
+class ThumbnailPolicy:
+    """
+    Picks the palette size and resolution of a thumbnail so that uploading it
+    over the serial link fits into a time budget. The link throughput starts
+    from the baud rate and is corrected with every measured upload.
+    """
+
+    def __init__(self, baud: int, budget: float, smoothing: float = 0.3):
+        self.budget: float = budget
+        self.smoothing: float = smoothing
+        # 8N1 framing, 10 bits on the wire per byte
+        self.throughput: float = baud / 10
+        # Encoded bytes per pixel, learned per palette size
+        self.ratio: Dict[int, float] = {colors: 1.5 for colors in COLORS}
+
+    def estimate(self, size: int, colors: int) -> float:
+        """Estimated upload time in seconds for a square thumbnail"""
+        encoded = size * size * self.ratio[colors] + colors * 8 / 3 + 32
+        chunks = encoded // CHUNK_SIZE + 1
+        return (encoded + chunks * CHUNK_OVERHEAD) / self.throughput
+
+    def candidates(self, size: int) -> List[Tuple[int, int]]:
+        return [
+            (max(int(size * scale), 1), colors) for scale in SCALES for colors in COLORS
+        ]
+
+    def choose(self, size: int) -> Tuple[int, int]:
+        """Returns (size, colors) of the best thumbnail within budget"""
+        candidates = self.candidates(size)
+        for candidate in candidates:
+            if self.estimate(*candidate) <= self.budget:
+                return candidate
+        return candidates[-1]
+
+    def recordEncoding(self, size: int, colors: int, length: int):
+        ratio = length / (size * size)
+        self.ratio[colors] += self.smoothing * (ratio - self.ratio[colors])
+
+    def recordUpload(self, length: int, elapsed: float):
+        if elapsed <= 0:
+            return
+        self.throughput += self.smoothing * (length / elapsed - self.throughput)
+
+
+class ThumbnailCache:
+    """
+    LRU cache of encoded thumbnails keyed by file, resolution, palette size
+    and background color.
+
+    Printers sharing one cache each use a scoped() view of it. Views share
+    the entries and the size limit, their keys are prefixed with the scope
+    so equally named files of different printers do not collide.
+    """
+
+    def __init__(
+        self, maxsize: int = 8, scope: str = "", entries: OrderedDict | None = None
+    ):
+        self.maxsize: int = maxsize
+        self.scope: str = scope
+        self.entries: OrderedDict[tuple, str] = (
+            OrderedDict() if entries is None else entries
+        )
+
+    def scoped(self, scope: str) -> "ThumbnailCache":
+        return ThumbnailCache(self.maxsize, scope, self.entries)
+
+    def get(self, key: tuple) -> str | None:
+        key = (self.scope,) + key
+        encoded = self.entries.get(key)
+        if encoded is not None:
+            self.entries.move_to_end(key)
+        return encoded
+
+    def find(self, filename: str, bgColor: str) -> str | None:
+        """Any cached encoding of the file, regardless of quality"""
+        for key in reversed(self.entries):
+            if key[0] == self.scope and key[1] == filename and key[4] == bgColor:
+                return self.entries[key]
+        return None
+
+    def put(self, key: tuple, encoded: str):
+        key = (self.scope,) + key
+        self.entries[key] = encoded
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def items(self) -> List[Tuple[tuple, str]]:
+        """The entries of this scope, with unprefixed keys"""
+        return [
+            (key[1:], encoded)
+            for key, encoded in self.entries.items()
+            if key[0] == self.scope
+        ]
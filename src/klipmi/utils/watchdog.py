@@ -0,0 +1,144 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+from collections import deque
+from types import FrameType
+from typing import Deque, Tuple
+
+from klipmi.utils.stats import RollingHistogram
+
+# Seconds between loop lag measurements
+WATCHDOG_INTERVAL = 0.1
+
+# Lag histogram buckets, in seconds
+LAG_BOUNDS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+
+# Stalls kept for the SIGUSR1 dump
+STALLS = 20
+
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+
+def locate(frame: FrameType | None) -> str:
+    """The innermost klipmi function of a stack, e.g. PrintingPage.init"""
+    while frame is not None:
+        if frame.f_code.co_filename.startswith(PACKAGE):
+            return "%s (%s:%d)" % (
+                frame.f_code.co_qualname,
+                frame.f_code.co_filename.rsplit("/", 1)[-1],
+                frame.f_lineno,
+            )
+        frame = frame.f_back
+    return "unknown"
+
+
+class Watchdog:
+    """
+    Measures event loop lag and catches stalls in the act.
+
+    A task on the loop records every tick into a rolling histogram. A
+    thread watches the ticks and when the loop stops ticking for longer than
+    `threshold`, it captures the loop thread's stack while it is still stuck,
+    so the stall is attributed to the page method or callback that caused
+    it. The stall is logged with its full duration once the loop recovers.
+    SIGUSR1 dumps the histogram and the latest stalls to the log.
+
+    asyncio's own slow callback warnings use the same threshold, but need
+    the loop's debug mode, which slows everything down and is opt-in.
+    """
+
+    def __init__(self, threshold: float, debug: bool = False):
+        self.threshold: float = threshold
+        self.debug: bool = debug
+        self.lag: RollingHistogram = RollingHistogram(LAG_BOUNDS)
+        self.beat: float = time.monotonic()
+        self.loopThread: int = 0
+        # (beat, location, stack) captured by the thread for the current stall
+        self.capture: Tuple[float, str, str] | None = None
+        self.stalls: Deque[Tuple[float, float, str]] = deque(maxlen=STALLS)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Must be called from the thread running the loop"""
+        self.loopThread = threading.get_ident()
+        loop.slow_callback_duration = self.threshold
+        if self.debug:
+            loop.set_debug(True)
+        loop.add_signal_handler(signal.SIGUSR1, self.dump)
+        loop.create_task(self.__measure())
+        threading.Thread(
+            target=self.__watch, name="klipmi-watchdog", daemon=True
+        ).start()
+
+    async def __measure(self):
+        while True:
+            self.beat = time.monotonic()
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+            lag = max(time.monotonic() - self.beat - WATCHDOG_INTERVAL, 0.0)
+            self.lag.record(lag)
+            if lag < self.threshold:
+                continue
+
+            capture = self.capture
+            if capture is not None and capture[0] == self.beat:
+                _, location, stack = capture
+            else:
+                # Stalled while the thread was not looking
+                location, stack = "unknown", ""
+            self.stalls.append((time.time(), lag, location))
+            logging.warning(
+                "Event loop stalled for %.0fms in %s\n%s"
+                % (lag * 1000, location, stack)
+            )
+
+    def __watch(self):
+        while True:
+            time.sleep(self.threshold / 2)
+            beat = self.beat
+            stalled = time.monotonic() - beat - WATCHDOG_INTERVAL
+            if stalled < self.threshold:
+                continue
+            if self.capture is not None and self.capture[0] == beat:
+                # Already captured this stall
+                continue
+            frame = sys._current_frames().get(self.loopThread)
+            self.capture = (
+                beat,
+                locate(frame),
+                "".join(traceback.format_stack(frame)) if frame is not None else "",
+            )
+
+    def dump(self):
+        logging.info("Event loop lag: %s, max %.0fms" % (self.lag, self.lag.max * 1000))
+        for stamp, lag, location in self.stalls:
+            logging.info(
+                "Stall at %s: %.0fms in %s"
+                % (
+                    time.strftime("%H:%M:%S", time.localtime(stamp)),
+                    lag * 1000,
+                    location,
+                )
+            )
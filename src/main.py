@@ -16,91 +16,235 @@ You should have received a copy of the GNU General Public License along with
 klipmi. If not, see <https://www.gnu.org/licenses/>. 
 """
 
+import time
+
+# Taken before the remaining imports so the startup timing includes them
+STARTED = time.perf_counter()
+
 import asyncio
+import contextvars
 import logging
 
-from nextion import TJC, EventType
+from nextion import EventType
 from setproctitle import setproctitle
 
 from klipmi import ui
+from klipmi.model.api import StatusApi
 from klipmi.model.config import Config
+from klipmi.model.display import Display, waitForDevice
+from klipmi.model.displaygroup import DisplayGroup
+from klipmi.model.events import EventPipeline
+from klipmi.model.idle import IdleManager
 from klipmi.model.printer import Printer, PrinterState
+from klipmi.model.shared import PRINTER, PrinterTag, SharedResources
+from klipmi.model.snapshot import Snapshot
 from klipmi.model.state import KlipmiState
+from klipmi.model.status import StatusStore
 from klipmi.model.ui import BaseUi
+from klipmi.utils.stats import PhaseTimer
+from klipmi.utils.thumbnail import ThumbnailPolicy
+from klipmi.utils.watchdog import Watchdog
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+TAGGED_LOG_FORMAT = "%(asctime)s - %(levelname)s - [%(printer)s] %(message)s"
+
+# Seconds between attempts to reach a display that is missing or failed
+DISPLAY_RETRY = 5.0
 
 
 class Klipmi:
-    def __init__(self):
-        logging.basicConfig(
-            format="%(asctime)s - %(levelname)s - %(message)s",
-            level=logging.DEBUG,
-            handlers=[logging.StreamHandler()],
-        )
+    """One printer/display pair, several can share a process and event loop"""
+
+    def __init__(self, options: Config, shared: SharedResources):
+        self.startup: PhaseTimer = PhaseTimer(STARTED)
+        self.startup.mark("imports")
+        self.displayReady: asyncio.Event = asyncio.Event()
+        self.snapshotLoaded: bool = False
 
         # Initialize state
         self.state: KlipmiState = KlipmiState()
-        self.state.options = Config()
+        self.state.options = options
+        self.state.loop = asyncio.get_event_loop()
+        self.state.thumbnails = shared.thumbnails.scoped(options.name)
+        self.state.encoder = shared.encoder
 
         # Initializing the display
-        self.state.display = TJC(
+        self.state.display = Display(
             self.state.options.klipmi.device,
             self.state.options.klipmi.baud,
             self.onDisplayEvent,
+            self.state.options.klipmi.io_thread,
         )
+        if self.state.options.klipmi.mirrors:
+            self.state.display = DisplayGroup(
+                self.state.display,
+                self.state.options.klipmi.mirrors,
+                self.state.options.klipmi.baud,
+                self.onDisplayEvent,
+                self.state.options.klipmi.io_thread,
+            )
         self.state.display.encoding = "utf-8"
+        self.state.thumbnailPolicy = ThumbnailPolicy(
+            self.state.options.klipmi.baud, self.state.options.klipmi.thumbnail_time
+        )
 
         # Initialize UI
-        self.ui: BaseUi = ui.implementations[self.state.options.klipmi.ui](self.state)
+        self.ui: BaseUi = ui.load(self.state.options.klipmi.ui)(self.state)
+        self.events: EventPipeline = EventPipeline(
+            self.ui.onDisplayEvent,
+            self.state.options.klipmi.debounce,
+            self.state.options.klipmi.event_queue,
+        )
 
         # Initializing the printer
         self.state.printer = Printer(
             self.state.options.moonraker,
             self.onConnectionEvent,
-            self.ui.onPrinterStatusUpdate,
+            self.onPrinterStatusUpdate,
             self.ui.onFileListUpdate,
+            self.ui.onGcodeResponse,
             self.ui.printerObjects,
+            shared.getSession,
+            self.state.options.klipmi.cache_dir,
         )
+        self.snapshot: Snapshot = Snapshot(
+            self.state.options.klipmi.cache_dir,
+            self.state.options.klipmi.snapshot_interval,
+        )
+        self.idle: IdleManager = IdleManager(
+            self.state,
+            self.state.options.klipmi.idle_timeout * 60,
+            self.state.options.klipmi.idle_brightness,
+        )
+        self.api: StatusApi | None = None
+        if self.state.options.klipmi.api_listen:
+            self.api = StatusApi(self.state, self.state.options.klipmi.api_listen)
+        self.startup.mark("setup")
 
     async def onDisplayEvent(self, type: EventType, data):
         if type == EventType.RECONNECTED:
             # Force update status on reconnect
+            self.state.display.clearShadow()
             await self.onConnectionEvent(self.state.status)
+        elif self.idle.touched(type):
+            # The touch only woke the display, it must not press a button
+            return
         else:
-            asyncio.create_task(self.ui.onDisplayEvent(type, data))
+            self.events.put(type, data)
+
+    async def onPrinterStatusUpdate(self, data: StatusStore):
+        self.idle.onStatus()
+        if self.api is not None:
+            self.api.publish()
+        # Nothing to draw on yet or the display is asleep, the status is kept
+        # in Printer.status
+        if self.displayReady.is_set() and not self.idle.sleeping:
+            await self.ui.onPrinterStatusUpdate(data)
 
     async def onConnectionEvent(self, status: PrinterState):
         logging.info("Conenction status: %s", status)
+        previous = self.state.status
         self.state.status = status
+        if self.api is not None:
+            self.api.publish()
+        if not self.displayReady.is_set():
+            # Shown by initDisplay once the display is up
+            return
+        if status == PrinterState.DEGRADED:
+            self.ui.onDegraded(True)
+            return
+        if previous == PrinterState.DEGRADED:
+            self.ui.onDegraded(False)
+            if status == PrinterState.READY:
+                # Moonraker recovered, keep the current page
+                return
+
         if status == PrinterState.NOT_READY:
-            self.ui.onNotReady()
+            if not self.state.stale:
+                self.ui.onNotReady()
         elif status == PrinterState.READY:
+            self.state.stale = False
             self.ui.onReady()
+            if "ready" not in self.startup.phases:
+                self.startup.mark("ready")
+                logging.info("Startup: %s", self.startup)
         elif status == PrinterState.STOPPED:
             self.ui.onMoonrakerError()
         elif status == PrinterState.KLIPPER_ERR:
             self.ui.onKlipperError()
 
     async def init(self):
-
-        # Connecting the display
-        await self.state.display.connect()
-        await self.state.display.wakeup()
-        
-        # Initialize UI
-        self.ui.onNotReady()
-
-        # Connecting the printer
+        # The display and Moonraker come up independently, connect both at
+        # once. Printer events before the display is up are only recorded.
+        if self.api is not None:
+            try:
+                await self.api.start()
+            except Exception as e:
+                logging.warning("Starting the status API failed: %s" % repr(e))
+        # Apply the last snapshot before Moonraker can send live status, so
+        # it never overwrites anything newer
+        if self.state.options.klipmi.snapshot_interval > 0:
+            status = self.snapshot.load(self.state.thumbnails)
+            if status:
+                self.state.stale = True
+                self.state.printer.status.update(status)
+                self.snapshotLoaded = True
+            asyncio.create_task(self.snapshot.run(self.state))
+        await asyncio.gather(self.initDisplay(), self.initPrinter())
+
+    async def initDisplay(self):
+        while True:
+            if await waitForDevice(self.state.options.klipmi.device):
+                try:
+                    await self.state.display.connect()
+                    await self.state.display.wakeup()
+                    break
+                except Exception as e:
+                    logging.warning("Connecting the display failed: %s" % repr(e))
+            await asyncio.sleep(DISPLAY_RETRY)
+        self.startup.mark("display")
+
+        # Initialize UI, from the last snapshot if there is one. Any live
+        # status received meanwhile has been merged over it already.
+        if self.snapshotLoaded:
+            self.ui.onSnapshot(self.state.printer.status)
+            self.startup.mark("snapshot")
+        self.displayReady.set()
+        # Show the printer state reached while the display was not up
+        await self.onConnectionEvent(self.state.status)
+        if self.state.options.klipmi.idle_timeout > 0:
+            asyncio.create_task(self.idle.run())
+
+    async def initPrinter(self):
         await self.state.printer.connect()
-
-    def start(self):
-        self.state.loop = asyncio.get_event_loop()
-        asyncio.ensure_future(self.init(), loop=self.state.loop)
-        self.state.loop.run_forever()
+        self.startup.mark("moonraker")
 
 
 def main():
     setproctitle("klipmi")
-    Klipmi().start()
+    handler = logging.StreamHandler()
+    handler.addFilter(PrinterTag())
+    logging.basicConfig(format=LOG_FORMAT, level=logging.DEBUG, handlers=[handler])
+
+    configs = Config.load()
+    if len(configs) > 1:
+        handler.setFormatter(logging.Formatter(TAGGED_LOG_FORMAT))
+    shared = SharedResources(len(configs))
+
+    loop = asyncio.get_event_loop()
+    # One loop for all printers, the first one's settings apply
+    if configs[0].klipmi.watchdog_threshold > 0:
+        Watchdog(
+            configs[0].klipmi.watchdog_threshold, configs[0].klipmi.watchdog_debug
+        ).start(loop)
+    for options in configs:
+        # Everything a pair runs, including the tasks it spawns, inherits the
+        # context and logs with its printer name
+        context = contextvars.copy_context()
+        context.run(PRINTER.set, options.name)
+        klipmi = context.run(Klipmi, options, shared)
+        loop.create_task(klipmi.init(), context=context)
+    loop.run_forever()
 
 
 if __name__ == "__main__":
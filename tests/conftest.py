@@ -0,0 +1,5 @@
+import os
+import sys
+
+# klipmi runs from src/ without being installed
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
@@ -0,0 +1,159 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import pytest
+
+from klipmi.model import commands
+from klipmi.model.commands import (
+    GCODE_METHOD,
+    MAX_QUEUED,
+    CommandDroppedError,
+    CommandQueue,
+)
+
+
+class FakeMoonraker:
+    """Records the calls, each one waits until released"""
+
+    def __init__(self):
+        self.calls: list = []
+        self.release: asyncio.Event = asyncio.Event()
+
+    async def call(self, method: str, **params):
+        self.calls.append((method, params.get("script")))
+        await self.release.wait()
+        return "ok"
+
+
+def gcode(queue: CommandQueue, script: str) -> asyncio.Future:
+    return queue.submit(GCODE_METHOD, script=script)
+
+
+def test_commands_run_in_order():
+    async def run():
+        moonraker = FakeMoonraker()
+        queue = CommandQueue(moonraker.call)
+        futures = [gcode(queue, "G28"), gcode(queue, "G1 X10")]
+        moonraker.release.set()
+        assert await asyncio.gather(*futures) == ["ok", "ok"]
+        assert moonraker.calls == [(GCODE_METHOD, "G28"), (GCODE_METHOD, "G1 X10")]
+
+    asyncio.run(run())
+
+
+def test_coalesced_command_moves_to_the_tail():
+    async def run():
+        moonraker = FakeMoonraker()
+        queue = CommandQueue(moonraker.call)
+        gcode(queue, "G28")
+        await asyncio.sleep(0)
+        first = gcode(queue, "SET_HEATER_TEMPERATURE HEATER=extruder TARGET=200")
+        gcode(queue, "G1 X10")
+        second = gcode(queue, "SET_HEATER_TEMPERATURE HEATER=extruder TARGET=210")
+        moonraker.release.set()
+        # Both callers get the result of the command that was sent
+        assert await asyncio.gather(first, second) == ["ok", "ok"]
+        assert [script for _, script in moonraker.calls] == [
+            "G28",
+            "G1 X10",
+            "SET_HEATER_TEMPERATURE HEATER=extruder TARGET=210",
+        ]
+        assert queue.summary()["SET_HEATER_TEMPERATURE"]["coalesced"] == 1
+
+    asyncio.run(run())
+
+
+def test_other_targets_are_not_coalesced():
+    async def run():
+        moonraker = FakeMoonraker()
+        queue = CommandQueue(moonraker.call)
+        gcode(queue, "G28")
+        await asyncio.sleep(0)
+        gcode(queue, "SET_HEATER_TEMPERATURE HEATER=extruder TARGET=200")
+        gcode(queue, "SET_HEATER_TEMPERATURE HEATER=heater_bed TARGET=60")
+        assert len(queue.queue) == 2
+        moonraker.release.set()
+
+    asyncio.run(run())
+
+
+def test_full_queue_drops_new_commands():
+    async def run():
+        moonraker = FakeMoonraker()
+        queue = CommandQueue(moonraker.call)
+        gcode(queue, "G28")
+        await asyncio.sleep(0)
+        for _ in range(MAX_QUEUED):
+            gcode(queue, "G4 P1")
+        with pytest.raises(CommandDroppedError):
+            await gcode(queue, "G1 X10")
+        moonraker.release.set()
+
+    asyncio.run(run())
+
+
+def test_commands_waiting_too_long_are_dropped(monkeypatch):
+    async def run():
+        moonraker = FakeMoonraker()
+        queue = CommandQueue(moonraker.call)
+        gcode(queue, "G28")
+        await asyncio.sleep(0)
+        late = gcode(queue, "G1 X10")
+        monkeypatch.setattr(commands, "MAX_WAIT", 0.0)
+        moonraker.release.set()
+        with pytest.raises(CommandDroppedError):
+            await late
+        assert len(moonraker.calls) == 1
+
+    asyncio.run(run())
+
+
+def test_unavailable_rejects_and_fails():
+    async def run():
+        moonraker = FakeMoonraker()
+        available = True
+        queue = CommandQueue(moonraker.call, lambda: available)
+        gcode(queue, "G28")
+        await asyncio.sleep(0)
+        queued = gcode(queue, "G1 X10")
+        available = False
+        queue.fail("Moonraker unavailable")
+        with pytest.raises(CommandDroppedError):
+            await queued
+        with pytest.raises(CommandDroppedError):
+            await gcode(queue, "G1 X20")
+        moonraker.release.set()
+
+    asyncio.run(run())
+
+
+def test_bypass_skips_the_queue():
+    async def run():
+        moonraker = FakeMoonraker()
+        queue = CommandQueue(moonraker.call)
+        gcode(queue, "G28")
+        await asyncio.sleep(0)
+        queued = gcode(queue, "G1 X10")
+        moonraker.release.set()
+        assert await queue.bypass("printer.emergency_stop") == "ok"
+        assert queued.cancelled()
+        assert ("printer.emergency_stop", None) in moonraker.calls
+        assert (GCODE_METHOD, "G1 X10") not in moonraker.calls
+
+    asyncio.run(run())
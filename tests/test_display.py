@@ -0,0 +1,133 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import logging
+import pytest
+
+pytest.importorskip("nextion")
+
+from klipmi.model.display import (  # noqa: E402
+    EOL,
+    SUCCESS,
+    TRANSPARENT_FINISHED,
+    TRANSPARENT_READY,
+    TRANSPARENT_TIMEOUT,
+    Display,
+)
+
+
+def frames(*codes: int) -> bytes:
+    return b"".join(bytes([code]) + EOL for code in codes)
+
+
+class FakePanel(asyncio.Transport):
+    """Answers each write with the next reply, through the protocol"""
+
+    def __init__(self, protocol: asyncio.Protocol, replies: list):
+        super().__init__()
+        self.protocol = protocol
+        self.replies = replies
+        self.written: list = []
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        if self.replies:
+            reply = self.replies.pop(0)
+            asyncio.get_event_loop().call_soon(self.protocol.data_received, reply)
+
+
+def connect(replies: list):
+    events: list = []
+
+    async def handler(type, data):
+        events.append(type)
+
+    display = Display("/dev/null", 115200, handler)
+    protocol = display._make_protocol()
+    panel = FakePanel(protocol, replies)
+    protocol.connection_made(panel)
+    display._connection = protocol
+    # Awake, as after connect()
+    display._sleeping = False
+    return display, panel, events
+
+
+def test_addt_waits_for_transparent_replies():
+    async def run():
+        display, panel, events = connect(
+            [frames(TRANSPARENT_READY), frames(TRANSPARENT_FINISHED)]
+        )
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        assert await display.addt(1, 0, b"\x10\x20\x30")
+        # Answered by the replies, not by running into the timeout
+        assert loop.time() - started < TRANSPARENT_TIMEOUT / 2
+        assert len(panel.written) == 2
+        assert panel.written[0] == b"addt 1,0,3" + EOL
+        assert display.transparent == {}
+        assert not display._command_lock.locked()
+        await asyncio.sleep(0)
+        # The replies are not passed on as events
+        assert events == []
+
+    asyncio.run(run())
+
+
+def test_addt_times_out_without_reply():
+    async def run():
+        display, panel, _ = connect([])
+        with pytest.raises(asyncio.TimeoutError):
+            await display.addt(1, 0, b"\x10")
+        assert display.transparent == {}
+        assert not display._command_lock.locked()
+
+    asyncio.run(run())
+
+
+def test_batch_timeout_leaves_no_acks_behind(caplog):
+    async def run():
+        display, panel, _ = connect([])
+        commands = ['t0.txt="a"', 't1.txt="b"']
+        # One ack arrives, the second only after the timeout
+        panel.replies = [frames(SUCCESS)]
+        with pytest.raises(asyncio.TimeoutError):
+            await display.batch(commands)
+        display._connection.data_received(frames(SUCCESS))
+
+        # The late ack is not counted for the next batch, whose second
+        # command failed
+        panel.replies = [frames(SUCCESS, 0x1A)]
+        with caplog.at_level(logging.WARNING):
+            assert await display.batch(commands)
+        assert "1 of 2 batched commands failed" in caplog.text
+        assert display._connection.queue.empty()
+
+    asyncio.run(run())
+
+
+def test_touch_reaches_the_event_handler():
+    async def run():
+        display, _, events = connect([])
+        # Component 2 of page 1 released
+        display._connection.data_received(bytes([0x65, 1, 2, 0]) + EOL)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert events == [0x65]
+
+    asyncio.run(run())
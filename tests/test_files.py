@@ -0,0 +1,258 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+
+from klipmi.model.files import GCODES, FileIndex, MetadataCache, SearchIndex
+
+
+def item(path: str, modified: float = 0.0, size: int = 0) -> dict:
+    return {"root": GCODES, "path": path, "modified": modified, "size": size}
+
+
+def loaded() -> FileIndex:
+    index = FileIndex()
+    index.load(
+        [
+            {"path": "benchy.gcode", "modified": 1.0, "size": 10},
+            {"path": "parts/gear.gcode", "modified": 3.0, "size": 20},
+            {"path": "parts/old/axle.gcode", "modified": 2.0, "size": 30},
+        ]
+    )
+    return index
+
+
+def paths(index: FileIndex) -> list:
+    return [entry.path for entry in index.page(0, 100)]
+
+
+def test_load_sorts_newest_first():
+    index = loaded()
+    assert paths(index) == ["parts/gear.gcode", "parts/old/axle.gcode", "benchy.gcode"]
+    assert [entry.path for entry in index.page(1, 2)] == ["benchy.gcode"]
+    assert index.pages(2) == 2
+
+
+def test_create_and_modify_file():
+    index = loaded()
+    version = index.version
+    assert index.apply({"action": "create_file", "item": item("new.gcode", 4.0)})
+    assert paths(index)[0] == "new.gcode"
+    assert index.apply({"action": "modify_file", "item": item("benchy.gcode", 5.0, 11)})
+    assert paths(index)[0] == "benchy.gcode"
+    assert index.entries["benchy.gcode"].size == 11
+    assert len(index) == 4
+    assert index.version == version + 2
+
+
+def test_delete_file():
+    index = loaded()
+    assert index.apply({"action": "delete_file", "item": item("benchy.gcode")})
+    assert "benchy.gcode" not in index
+    assert index.find("benchy") == []
+
+
+def test_move_file():
+    index = loaded()
+    assert index.apply(
+        {
+            "action": "move_file",
+            "item": item("done/benchy.gcode", 1.0),
+            "source_item": item("benchy.gcode"),
+        }
+    )
+    assert "benchy.gcode" not in index
+    assert [entry.path for entry in index.find("benchy")] == ["done/benchy.gcode"]
+
+
+def test_delete_dir():
+    index = loaded()
+    assert index.apply({"action": "delete_dir", "item": item("parts")})
+    assert paths(index) == ["benchy.gcode"]
+
+
+def test_move_dir():
+    index = loaded()
+    assert index.apply(
+        {
+            "action": "move_dir",
+            "item": item("archive/parts"),
+            "source_item": item("parts"),
+        }
+    )
+    assert paths(index) == [
+        "archive/parts/gear.gcode",
+        "archive/parts/old/axle.gcode",
+        "benchy.gcode",
+    ]
+    # Modification times move along
+    assert index.entries["archive/parts/gear.gcode"].modified == 3.0
+
+
+def test_create_dir_and_other_roots_change_nothing():
+    index = loaded()
+    version = index.version
+    assert index.apply({"action": "create_dir", "item": item("empty")})
+    assert index.apply(
+        {"action": "delete_file", "item": {"root": "config", "path": "benchy.gcode"}}
+    )
+    assert len(index) == 3
+    assert index.version == version
+
+
+def test_unknown_action_asks_for_a_reload():
+    assert not loaded().apply({"action": "root_update", "item": item("")})
+
+
+def searchIndex() -> SearchIndex:
+    index = SearchIndex()
+    index.queue(["Benchy.gcode", "parts/Gear_M3.gcode", "parts/bench_leg.gcode"])
+    return index
+
+
+def test_search_indexes_queued_paths_lazily():
+    index = searchIndex()
+    assert index.texts == {}
+    assert not index.build(1)
+    assert len(index.texts) == 1
+    assert sorted(index.search("bench")) == ["Benchy.gcode", "parts/bench_leg.gcode"]
+    assert index.build()
+
+
+def test_short_queries_scan():
+    index = searchIndex()
+    assert index.search("m3") == ["parts/Gear_M3.gcode"]
+    assert len(index.search("")) == 3
+
+
+def test_trigram_queries():
+    index = searchIndex()
+    assert index.search("GEAR") == ["parts/Gear_M3.gcode"]
+    assert index.search("parts/") != []
+    # All trigrams present but not as one substring
+    assert index.search("benchleg") == []
+    assert index.search("xyz") == []
+
+
+def test_queries_are_normalized_like_paths():
+    index = searchIndex()
+    assert index.search(" Benchy.GCODE ") == ["Benchy.gcode"]
+    assert index.search("m3.gcode") == ["parts/Gear_M3.gcode"]
+
+
+def test_removed_paths_are_not_found():
+    index = searchIndex()
+    index.build()
+    index.remove("Benchy.gcode")
+    assert index.search("bench") == ["parts/bench_leg.gcode"]
+    # Removing a path that was only queued
+    index.queue(["queued.gcode"])
+    index.remove("queued.gcode")
+    assert index.search("queued") == []
+
+
+class FakeMetadata:
+    """server.files.metadata, each request waits until released"""
+
+    def __init__(self):
+        self.requests: list = []
+        self.release: asyncio.Event = asyncio.Event()
+        self.release.set()
+
+    async def fetch(self, filename: str) -> dict:
+        self.requests.append(filename)
+        await self.release.wait()
+        return {"filename": filename, "request": len(self.requests)}
+
+
+def test_concurrent_gets_share_one_fetch():
+    async def run():
+        metadata = FakeMetadata()
+        metadata.release.clear()
+        cache = MetadataCache(metadata.fetch)
+        gets = [asyncio.create_task(cache.get("a.gcode")) for _ in range(3)]
+        await asyncio.sleep(0)
+        metadata.release.set()
+        results = await asyncio.gather(*gets)
+        assert metadata.requests == ["a.gcode"]
+        assert all(result is results[0] for result in results)
+        # Cached from now on
+        assert await cache.get("a.gcode") is results[0]
+        assert metadata.requests == ["a.gcode"]
+
+    asyncio.run(run())
+
+
+def test_invalidation_during_fetch_is_not_cached():
+    async def run():
+        metadata = FakeMetadata()
+        metadata.release.clear()
+        cache = MetadataCache(metadata.fetch)
+        stale = asyncio.create_task(cache.get("parts/a.gcode"))
+        await asyncio.sleep(0)
+        cache.invalidate("parts")
+        metadata.release.set()
+        assert (await stale)["request"] == 1
+        # The file changed while it was fetched, the result is not kept
+        assert (await cache.get("parts/a.gcode"))["request"] == 2
+
+    asyncio.run(run())
+
+
+def test_errors_are_not_cached():
+    async def run():
+        requests = []
+
+        async def fetch(filename: str) -> dict:
+            requests.append(filename)
+            return {"error": "not found"}
+
+        cache = MetadataCache(fetch)
+        await cache.get("a.gcode")
+        await cache.get("a.gcode")
+        assert len(requests) == 2
+
+    asyncio.run(run())
+
+
+def test_least_recently_used_is_evicted():
+    async def run():
+        metadata = FakeMetadata()
+        cache = MetadataCache(metadata.fetch, maxsize=2)
+        await cache.get("a.gcode")
+        await cache.get("b.gcode")
+        await cache.get("a.gcode")
+        await cache.get("c.gcode")
+        assert list(cache.entries) == ["a.gcode", "c.gcode"]
+        await cache.get("b.gcode")
+        assert metadata.requests == ["a.gcode", "b.gcode", "c.gcode", "b.gcode"]
+
+    asyncio.run(run())
+
+
+def test_prefetch_skips_cached_files():
+    async def run():
+        metadata = FakeMetadata()
+        cache = MetadataCache(metadata.fetch)
+        await cache.get("a.gcode")
+        cache.prefetch(["a.gcode", "b.gcode"])
+        await cache.prefetching
+        assert metadata.requests == ["a.gcode", "b.gcode"]
+        assert "b.gcode" in cache.entries
+
+    asyncio.run(run())
@@ -0,0 +1,74 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import pytest
+import types
+
+pytest.importorskip("nextion")
+pytest.importorskip("moonraker_api")
+
+from nextion import EventType  # noqa: E402
+
+from klipmi.model.idle import FULL_BRIGHTNESS, IdleManager  # noqa: E402
+from klipmi.model.status import StatusStore  # noqa: E402
+
+
+class FakeDisplay:
+    def __init__(self):
+        self.written: list = []
+
+    async def set(self, key, value):
+        self.written.append((key, value))
+
+
+def idleManager() -> IdleManager:
+    printer = types.SimpleNamespace(status=StatusStore())
+    state = types.SimpleNamespace(printer=printer, display=FakeDisplay())
+    return IdleManager(state, 10.0, 10)
+
+
+def test_touch_while_awake_is_passed_on():
+    async def run():
+        idle = idleManager()
+        idle.lastTouch = 0.0
+        assert not idle.touched(EventType.TOUCH)
+        assert idle.lastTouch > 0.0
+
+    asyncio.run(run())
+
+
+def test_other_events_are_no_activity():
+    async def run():
+        idle = idleManager()
+        idle.dimmed = True
+        assert not idle.touched(EventType.AUTO_SLEEP)
+
+    asyncio.run(run())
+
+
+def test_touch_in_sleep_only_wakes():
+    async def run():
+        idle = idleManager()
+        await idle.dim()
+        assert idle.touched(EventType.TOUCH_IN_SLEEP)
+        await asyncio.sleep(0)
+        assert not idle.dimmed
+        assert idle.state.display.written == [("dim", 10), ("dim", FULL_BRIGHTNESS)]
+
+    asyncio.run(run())
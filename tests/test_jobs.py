@@ -0,0 +1,118 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import pytest
+
+from klipmi.model import jobs as jobsModule
+from klipmi.model.jobs import JobHistory
+
+
+def job(id: str, start: float, status: str = "completed") -> dict:
+    return {
+        "job_id": id,
+        "filename": "%s.gcode" % id,
+        "status": status,
+        "start_time": start,
+    }
+
+
+class FakeHistory:
+    """server.history.list and get_job over a list of jobs"""
+
+    def __init__(self, jobs: list):
+        self.jobs: dict = {item["job_id"]: item for item in jobs}
+        self.calls: list = []
+
+    async def call(self, method: str, **params) -> dict:
+        self.calls.append((method, params))
+        if method == "server.history.get_job":
+            item = self.jobs.get(params["job_id"])
+            if item is None:
+                return {"error": {"code": 404, "message": "Invalid job id"}}
+            return {"job": item}
+        matching = sorted(
+            (
+                item
+                for item in self.jobs.values()
+                if item["start_time"] > params["since"]
+            ),
+            key=lambda item: item["start_time"],
+        )
+        start = params["start"]
+        return {"jobs": matching[start : start + params["limit"]]}
+
+
+def stored(history: JobHistory) -> list:
+    async def read():
+        return [(item.job_id, item.status) for item in await history.page(0, 100)]
+
+    return asyncio.run(read())
+
+
+def test_sync_fetches_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobsModule, "SYNC_BATCH", 2)
+    history = JobHistory(str(tmp_path))
+    moonraker = FakeHistory([job("a", 1), job("b", 2), job("c", 3)])
+    assert asyncio.run(history.sync(moonraker.call)) == 3
+    assert [params["start"] for _, params in moonraker.calls] == [0, 2]
+    assert stored(history) == [
+        ("c", "completed"),
+        ("b", "completed"),
+        ("a", "completed"),
+    ]
+
+
+def test_sync_only_requests_newer_jobs(tmp_path):
+    history = JobHistory(str(tmp_path))
+    asyncio.run(history.store([job("a", 1), job("b", 2)]))
+    moonraker = FakeHistory([job("a", 1), job("b", 2), job("c", 3)])
+    assert asyncio.run(history.sync(moonraker.call)) == 1
+    assert moonraker.calls[0][1]["since"] == 2
+    assert stored(history)[0] == ("c", "completed")
+
+
+def test_sync_refreshes_jobs_in_progress(tmp_path):
+    history = JobHistory(str(tmp_path))
+    # The newest job was still printing when stored
+    asyncio.run(history.store([job("a", 1), job("b", 2, "in_progress")]))
+    moonraker = FakeHistory([job("a", 1), job("b", 2), job("c", 3)])
+    assert asyncio.run(history.sync(moonraker.call)) == 2
+    assert ("server.history.get_job", {"job_id": "b"}) in moonraker.calls
+    assert stored(history) == [
+        ("c", "completed"),
+        ("b", "completed"),
+        ("a", "completed"),
+    ]
+
+
+def test_sync_drops_jobs_deleted_from_moonraker(tmp_path):
+    history = JobHistory(str(tmp_path))
+    asyncio.run(history.store([job("a", 1), job("b", 2, "in_progress")]))
+    moonraker = FakeHistory([job("a", 1)])
+    assert asyncio.run(history.sync(moonraker.call)) == 0
+    assert stored(history) == [("a", "completed")]
+
+
+def test_sync_fails_on_other_errors(tmp_path):
+    async def call(method: str, **params) -> dict:
+        return {"error": {"code": 503, "message": "Klippy not ready"}}
+
+    history = JobHistory(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        asyncio.run(history.sync(call))
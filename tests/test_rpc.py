@@ -0,0 +1,131 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import pytest
+
+pytest.importorskip("moonraker_api")
+
+from klipmi.model import rpc as rpcModule  # noqa: E402
+from klipmi.model.rpc import (  # noqa: E402
+    FAILURE_THRESHOLD,
+    CircuitOpenError,
+    CircuitState,
+    RpcClient,
+)
+
+
+class FakeMoonraker:
+    def __init__(self):
+        self.responding: bool = False
+        self.calls: list = []
+        self.probing: asyncio.Event = asyncio.Event()
+        self.release: asyncio.Event = asyncio.Event()
+
+    async def call(self, method: str, **params):
+        self.calls.append(method)
+        if not self.responding:
+            await asyncio.Event().wait()
+        self.probing.set()
+        await self.release.wait()
+        return {"result": method}
+
+
+def client(moonraker: FakeMoonraker, states: list) -> RpcClient:
+    async def stateCallback(degraded: bool):
+        states.append(degraded)
+
+    return RpcClient(moonraker.call, stateCallback, 0.01, 4)
+
+
+async def openCircuit(rpc: RpcClient):
+    for _ in range(FAILURE_THRESHOLD):
+        with pytest.raises(asyncio.TimeoutError):
+            await rpc.call_method("server.info")
+
+
+def test_breaker_opens_after_repeated_timeouts():
+    async def run():
+        moonraker, states = FakeMoonraker(), []
+        rpc = client(moonraker, states)
+        await openCircuit(rpc)
+        assert rpc.circuit == CircuitState.OPEN
+        with pytest.raises(CircuitOpenError):
+            await rpc.call_method("server.info")
+        # Refused calls never reach Moonraker
+        assert len(moonraker.calls) == FAILURE_THRESHOLD
+        assert rpc.failuresByMethod == {"server.info": FAILURE_THRESHOLD}
+        await asyncio.sleep(0)
+        assert states == [True]
+
+    asyncio.run(run())
+
+
+def test_half_open_probe_closes_the_breaker(monkeypatch):
+    async def run():
+        moonraker, states = FakeMoonraker(), []
+        rpc = client(moonraker, states)
+        await openCircuit(rpc)
+        monkeypatch.setattr(rpcModule, "RESET_TIMEOUT", 0.0)
+
+        # G-code has a long deadline and must not be the probe
+        with pytest.raises(CircuitOpenError):
+            await rpc.call_method("printer.gcode.script", script="G28")
+
+        moonraker.responding = True
+        probe = asyncio.create_task(rpc.call_method("server.info"))
+        await moonraker.probing.wait()
+        assert rpc.circuit == CircuitState.HALF_OPEN
+        # Only the probe goes through while it is pending
+        with pytest.raises(CircuitOpenError):
+            await rpc.call_method("server.files.list")
+        moonraker.release.set()
+        assert await probe == {"result": "server.info"}
+        assert rpc.circuit == CircuitState.CLOSED
+        await asyncio.sleep(0)
+        assert states == [True, False]
+
+    asyncio.run(run())
+
+
+def test_failed_probe_reopens_the_breaker(monkeypatch):
+    async def run():
+        moonraker, states = FakeMoonraker(), []
+        rpc = client(moonraker, states)
+        await openCircuit(rpc)
+        monkeypatch.setattr(rpcModule, "RESET_TIMEOUT", 0.0)
+        with pytest.raises(asyncio.TimeoutError):
+            await rpc.call_method("server.info")
+        assert rpc.circuit == CircuitState.OPEN
+        await asyncio.sleep(0)
+        assert states == [True]
+
+    asyncio.run(run())
+
+
+def test_urgent_calls_bypass_the_breaker_with_a_deadline(monkeypatch):
+    async def run():
+        moonraker, states = FakeMoonraker(), []
+        rpc = client(moonraker, states)
+        await openCircuit(rpc)
+        monkeypatch.setitem(rpcModule.TIMEOUTS, "printer.emergency_stop", 0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await rpc.call_method("printer.emergency_stop")
+        assert moonraker.calls[-1] == "printer.emergency_stop"
+
+    asyncio.run(run())
@@ -0,0 +1,75 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from klipmi.model.status import StatusStore
+
+
+def test_update_merges_into_slots():
+    status = StatusStore({"extruder": ["temperature", "target"]})
+    temperature = status.slot("extruder", "temperature")
+    assert not status
+    status.update({"extruder": {"temperature": 200.5}, "fan": {"speed": 0.5}})
+    assert status
+    assert status.getFloat(temperature) == 200.5
+    assert status.getFloat(status.slot("extruder", "target")) == 0.0
+    # Unknown objects are interned on the fly
+    assert status.lookup("fan", "speed") == 0.5
+    assert status["extruder"] == {"temperature": 200.5}
+    assert status.get("heater_bed", {}) == {}
+
+
+def test_changes_since_version():
+    status = StatusStore()
+    status.update({"extruder": {"temperature": 200, "target": 210}})
+    version = status.version
+    status.update({"extruder": {"temperature": 201, "target": 210}})
+    status.update({"print_stats": {"state": "printing"}})
+    # Values sent again unchanged are not changes
+    assert status.changes(version) == {
+        "extruder": {"temperature": 201},
+        "print_stats": {"state": "printing"},
+    }
+    assert status.changes(status.version) == {}
+    temperature = status.slot("extruder", "temperature")
+    assert status.changedSince(temperature, version)
+    assert not status.changedSince(status.slot("extruder", "target"), version)
+
+
+def test_set_is_a_change():
+    status = StatusStore()
+    status.update({"fan": {"speed": 0.0}})
+    version = status.version
+    status.set(status.slot("fan", "speed"), 1.0)
+    assert status.changes(version) == {"fan": {"speed": 1.0}}
+
+
+def test_to_dict_skips_unset_fields():
+    status = StatusStore({"extruder": ["temperature", "target"]})
+    assert status.toDict() == {}
+    status.update({"extruder": {"target": 210}, "toolhead": {"position": [1, 2]}})
+    assert status.toDict() == {
+        "extruder": {"target": 210},
+        "toolhead": {"position": [1, 2]},
+    }
+
+
+def test_default_objects_are_not_shared():
+    first = StatusStore()
+    first.update({"extruder": {"temperature": 200}})
+    assert StatusStore().toDict() == {}
+    assert "extruder" not in StatusStore()
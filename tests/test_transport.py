@@ -0,0 +1,187 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import aiohttp
+import asyncio
+import json
+import pytest
+
+from aiohttp import web
+
+pytest.importorskip("moonraker_api")
+
+from moonraker_api.websockets.websocketclient import (  # noqa: E402
+    ClientNotConnectedError,
+    WEBSOCKET_STATE_CONNECTED,
+    WEBSOCKET_STATE_STOPPED,
+)
+
+from klipmi.model.transport import WebsocketTransport  # noqa: E402
+
+
+class FakeMoonraker:
+    """Answers a few JSON-RPC methods over a websocket, like Moonraker"""
+
+    def __init__(self):
+        self.runner: web.AppRunner | None = None
+        self.port: int = 0
+        self.sockets: list = []
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/websocket", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def handle(self, request: web.Request) -> web.WebSocketResponse:
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        self.sockets.append(websocket)
+        async for message in websocket:
+            request = json.loads(message.data)
+            method, id = request["method"], request["id"]
+            if method == "server.info":
+                await websocket.send_json(
+                    {"jsonrpc": "2.0", "id": id, "result": {"klippy_state": "ready"}}
+                )
+            elif method == "printer.gcode.script":
+                await websocket.send_json(
+                    {
+                        "jsonrpc": "2.0",
+                        "id": id,
+                        "error": {"code": 400, "message": "Unknown command"},
+                    }
+                )
+            elif method == "notify":
+                for method, params in request["params"]["send"]:
+                    await websocket.send_json(
+                        {"jsonrpc": "2.0", "method": method, "params": params}
+                    )
+                await websocket.send_json({"jsonrpc": "2.0", "id": id, "result": "ok"})
+            elif method == "close":
+                await websocket.close()
+            # Anything else is never answered
+        return websocket
+
+
+class Listener:
+    def __init__(self):
+        self.states: list = []
+        self.updates: list = []
+        self.notifications: list = []
+
+    async def state_changed(self, state):
+        self.states.append(state)
+
+    async def on_exception(self, exception):
+        pass
+
+    def onStatusUpdate(self, update: dict):
+        self.updates.append(update)
+
+    async def on_notification(self, method: str, data):
+        self.notifications.append(method)
+
+
+def withTransport(test):
+    async def run():
+        server = FakeMoonraker()
+        await server.start()
+        listener = Listener()
+        async with aiohttp.ClientSession() as session:
+            transport = WebsocketTransport(
+                listener,
+                "127.0.0.1",
+                server.port,
+                "",
+                lambda: session,
+                callTimeout=0.2,
+            )
+            assert await transport.connect()
+            try:
+                await test(transport, listener)
+            finally:
+                await transport.disconnect()
+                await server.stop()
+
+    asyncio.run(run())
+
+
+def test_result():
+    async def test(transport, listener):
+        assert await transport.call_method("server.info") == {"klippy_state": "ready"}
+        await asyncio.sleep(0)
+        assert listener.states == [WEBSOCKET_STATE_CONNECTED]
+
+    withTransport(test)
+
+
+def test_error():
+    async def test(transport, listener):
+        result = await transport.call_method("printer.gcode.script", script="NOPE")
+        assert result == {"error": {"code": 400, "message": "Unknown command"}}
+
+    withTransport(test)
+
+
+def test_deadline():
+    async def test(transport, listener):
+        with pytest.raises(asyncio.TimeoutError):
+            await transport.call_method("server.unanswered")
+        assert transport.requests == {}
+
+    withTransport(test)
+
+
+def test_notifications():
+    async def test(transport, listener):
+        send = [
+            ["notify_proc_stat_update", [{"cpu_temp": 50}]],
+            ["notify_status_update", [{"extruder": {"temperature": 200}}, 1.0]],
+            ["notify_klippy_ready", None],
+        ]
+        assert await transport.call_method("notify", send=send) == "ok"
+        await asyncio.sleep(0)
+        # Status updates are handed over directly, proc stats never decoded
+        assert listener.updates == [{"extruder": {"temperature": 200}}]
+        assert listener.notifications == ["notify_klippy_ready"]
+
+    withTransport(test)
+
+
+def test_disconnect():
+    async def test(transport, listener):
+        pending = asyncio.create_task(transport.call_method("server.unanswered"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ClientNotConnectedError):
+            await transport.call_method("close")
+        with pytest.raises(ClientNotConnectedError):
+            await pending
+        await asyncio.sleep(0)
+        assert listener.states[-1] == WEBSOCKET_STATE_STOPPED
+        assert not transport.is_connected
+        with pytest.raises(ClientNotConnectedError):
+            await transport.call_method("server.info")
+
+    withTransport(test)